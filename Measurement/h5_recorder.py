@@ -0,0 +1,173 @@
+"""Streaming HDF5 recorder for point-by-point sweeps"""
+import os
+import json
+import time
+import numpy as np
+import h5py
+from datetime import datetime
+from typing import Any, Dict, Optional, Sequence, Tuple
+
+PARTIAL_SUFFIX = ".partial"
+
+#################################################################
+# Recorder
+#################################################################
+class SweepRecorder:
+    """
+    Append every measured point to resizable, chunked HDF5 datasets instead
+    of keeping lists until the end of the run.
+    Datasets grow by chunk_points and are filled with NaN, so the number of
+    valid points is kept in attribute "n_points", which is updated on every
+    flush. File is flushed every flush_every points or flush_interval_s
+    seconds, so at most that much is lost on a crash.
+    Points are written to path + ".partial", so that readers which pick files
+    by name (e.g. GainVoltageMap) never see a run in progress or a crashed
+    one. close() trims datasets to n_points, which gives the same layout as
+    a one-shot dump (e.g. "X" : (n, 2) rows [v_g, X] of LED_Reset_Meas.ipynb,
+    or 1D "gain" and "voltage" of GainVoltageMap files), and renames the file
+    to path. Attribute "completed" is False if the run was interrupted.
+    metadata : file attributes, dict and list values are stored as JSON
+    """
+    def __init__(
+        self,
+        path: str,
+        columns: Optional[Dict[str, Tuple[int, ...]]] = None,
+        metadata: Optional[Dict[str, Any]] = None,
+        chunk_points: int = 256,
+        flush_every: int = 16,
+        flush_interval_s: float = 5.0
+    ):
+        self.path               = path
+        self.partial_path       = path + PARTIAL_SUFFIX
+        self.chunk_points       = chunk_points
+        self.flush_every        = flush_every
+        self.flush_interval_s   = flush_interval_s
+        self.n_points           = 0
+        self._file              = h5py.File(self.partial_path, "w")
+        self._capacity          = 0
+        self._n_since_flush     = 0
+        self._last_flush        = time.perf_counter()
+        self.set_metadata(started = datetime.now().isoformat(), completed = False, n_points = 0)
+        self.set_metadata(**(metadata or {}))
+        for name, shape in (columns or {}).items():
+            self.declare(name, shape)
+
+    def set_metadata(
+        self,
+        **metadata
+    ) -> None:
+        for key, value in metadata.items():
+            if isinstance(value, (dict, list, tuple)) and not _is_numeric(value):
+                value = json.dumps(value)
+            elif value is None:
+                value = "None"
+            self._file.attrs[key] = value
+
+    def declare(
+        self,
+        name: str,
+        shape: Tuple[int, ...] = (),
+        dtype: Any = np.float64
+    ) -> None:
+        """
+        Declare dataset of which one point has given shape
+        """
+        if name in self._file:
+            raise KeyError(f"{name} is already declared")
+        shape = tuple(shape)
+        dtype = np.dtype(dtype)
+        self._file.create_dataset(
+            name,
+            shape       = (self._capacity,) + shape,
+            maxshape    = (None,) + shape,
+            chunks      = (self.chunk_points,) + shape,
+            dtype       = dtype,
+            fillvalue   = np.nan if dtype.kind in "fc" else 0,
+        )
+
+    def append(
+        self,
+        point: Dict[str, Any]
+    ) -> int:
+        """
+        Append one point {dataset name : value}. Datasets which are not
+        declared are declared from the first value. Returns index of the point.
+        """
+        point = {name: np.asarray(value) for name, value in point.items()}
+        for name, value in point.items():
+            if name not in self._file:
+                self.declare(name, value.shape, value.dtype if value.dtype.kind in "biuf" else np.float64)
+        index = self.n_points
+        if index >= self._capacity:
+            self._resize(self._capacity + self.chunk_points)
+        for name, value in point.items():
+            self._file[name][index] = value
+        self.n_points += 1
+        self._n_since_flush += 1
+        if (
+            self._n_since_flush >= self.flush_every
+            or time.perf_counter() - self._last_flush >= self.flush_interval_s
+        ):
+            self.flush()
+        return index
+
+    def _resize(
+        self,
+        n: int
+    ) -> None:
+        for dset in self._file.values():
+            if isinstance(dset, h5py.Dataset):
+                dset.resize(n, axis = 0)
+        self._capacity = n
+
+    def flush(self) -> None:
+        self._file.attrs["n_points"] = self.n_points
+        self._file.flush()
+        self._n_since_flush = 0
+        self._last_flush = time.perf_counter()
+
+    def close(
+        self,
+        completed: bool = True
+    ) -> None:
+        if self._file is None:
+            return
+        self._resize(self.n_points)
+        self.set_metadata(completed = completed, finished = datetime.now().isoformat())
+        self.flush()
+        self._file.close()
+        self._file = None
+        os.replace(self.partial_path, self.path)
+
+    def __enter__(self) -> "SweepRecorder":
+        return self
+
+    def __exit__(self, exc_type, exc, tb) -> None:
+        self.close(completed = exc_type is None)
+
+def _is_numeric(
+    value: Sequence[Any]
+) -> bool:
+    try:
+        return np.asarray(value).dtype.kind in "biuf"
+    except ValueError:
+        return False
+
+#################################################################
+# Reader
+#################################################################
+def read_sweep(
+    path: str
+) -> Tuple[Dict[str, np.ndarray], Dict[str, Any]]:
+    """
+    ({dataset name : valid points}, metadata) of a recorded file. Files of
+    interrupted runs are cut at their last flushed "n_points".
+    """
+    with h5py.File(path, "r") as f:
+        metadata = dict(f.attrs)
+        n_points = int(metadata.get("n_points", -1))
+        data = {}
+        for name, dset in f.items():
+            if isinstance(dset, h5py.Dataset):
+                data[name] = dset[()] if n_points < 0 else dset[:n_points]
+    return data, metadata
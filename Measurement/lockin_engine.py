@@ -0,0 +1,232 @@
+"""
+SR860 lock-in + Keithley 2400 gate measurement engine.
+X, Y, R and theta are read with one SNAP? query, settling after a gate step
+is detected from successive readings instead of a fixed sleep, and
+multi-point averages are taken from the SR860 capture buffer.
+"""
+import math
+import time
+import numpy as np
+from typing import Any, Dict, List, Optional, Sequence, Tuple
+
+# SNAP? / capture parameter indices of SR860
+SNAP_X, SNAP_Y, SNAP_R = 0, 1, 2
+CAPTURE_XY      = 1
+BYTES_PER_XY    = 8             # two float32
+#################################################################
+# SR860
+#################################################################
+class SR860Engine:
+    """
+    Fast SR860 access through a pyvisa resource (rm.open_resource(addr)).
+    Settling : after min_wait_tc time constants, readings are taken every
+               poll_tc time constants until settle_count successive changes
+               of X and Y are below the tolerance, or max_wait_tc time
+               constants (3, the fixed wait of LED_Reset_Meas.ipynb) have
+               passed.
+    Tolerance : settle_sigma standard deviations of the difference of two
+               readings, with noise_std from the last capture buffer
+               (capture_average) or set_noise(). Capture points closer than
+               one time constant are correlated, so noise_std is taken from
+               points about one time constant apart. Until noise is known,
+               settle_rel_tol * R is used. settle_abs_tol is always added.
+    """
+    def __init__(
+        self,
+        resource: Any,
+        time_constant: float,
+        settle_sigma: float = 3.0,
+        settle_rel_tol: float = 0.01,
+        settle_abs_tol: float = 1e-9,
+        settle_count: int = 2,
+        min_wait_tc: float = 1.0,
+        max_wait_tc: float = 3.0,
+        poll_tc: float = 0.5
+    ):
+        self.resource       = resource
+        self.time_constant  = time_constant
+        self.settle_sigma   = settle_sigma
+        self.settle_rel_tol = settle_rel_tol
+        self.settle_abs_tol = settle_abs_tol
+        self.settle_count   = settle_count
+        self.min_wait_tc    = min_wait_tc
+        self.max_wait_tc    = max_wait_tc
+        self.poll_tc        = poll_tc
+        self.n_query        = 0
+        self.noise_std: Optional[float] = None
+        self._capture_n     = None
+        self._capture_rate  = None
+
+    def _query(
+        self,
+        cmd: str
+    ) -> str:
+        self.n_query += 1
+        return self.resource.query(cmd).strip()
+
+    def snap(self) -> Dict[str, float]:
+        """
+        X, Y, R [V] and angle [deg] of one instant with a single query.
+        SNAP? takes at most 3 parameters, so angle is computed from X and Y
+        of the same snapshot (same as the SR860 does).
+        """
+        x, y, r = (float(v) for v in self._query(f"SNAP? {SNAP_X},{SNAP_Y},{SNAP_R}").split(","))
+        return {"X": x, "Y": y, "R": r, "angle": math.degrees(math.atan2(y, x))}
+
+    def set_noise(
+        self,
+        noise_std: float
+    ) -> None:
+        """
+        Standard deviation [V] of X and Y readings at the current settings
+        """
+        self.noise_std = float(noise_std)
+
+    def tolerance(
+        self,
+        reading: Dict[str, float]
+    ) -> float:
+        """
+        Largest change of X and Y between readings which counts as settled
+        """
+        if self.noise_std is None:
+            return self.settle_rel_tol * abs(reading["R"]) + self.settle_abs_tol
+        # Difference of two independent readings has sqrt(2) times the noise
+        return self.settle_sigma * math.sqrt(2) * self.noise_std + self.settle_abs_tol
+
+    def wait_settled(self) -> Tuple[Dict[str, float], float]:
+        """
+        Wait until output is settled. Returns last reading and waited time [s].
+        """
+        start = time.perf_counter()
+        time.sleep(self.min_wait_tc * self.time_constant)
+        previous = self.snap()
+        stable = 0
+        while time.perf_counter() - start < self.max_wait_tc * self.time_constant:
+            time.sleep(self.poll_tc * self.time_constant)
+            reading = self.snap()
+            tol = self.tolerance(reading)
+            if abs(reading["X"] - previous["X"]) < tol and abs(reading["Y"] - previous["Y"]) < tol:
+                stable += 1
+                if stable >= self.settle_count:
+                    return reading, time.perf_counter() - start
+            else:
+                stable = 0
+            previous = reading
+        return previous, time.perf_counter() - start
+
+    def configure_capture(
+        self,
+        n_points: int,
+        rate_divider: int = 0
+    ) -> float:
+        """
+        Set capture buffer for n_points of (X, Y) at max rate / 2**rate_divider.
+        Returns capture duration [s].
+        """
+        length_kb = max(1, math.ceil(n_points * BYTES_PER_XY / 1024))
+        self.resource.write(f"CAPTURECFG {CAPTURE_XY}")
+        self.resource.write(f"CAPTURELEN {length_kb}")
+        self.resource.write(f"CAPTURERATE {rate_divider}")
+        rate = float(self._query("CAPTURERATEMAX?")) / 2 ** rate_divider
+        self._capture_n = n_points
+        self._capture_rate = rate
+        return n_points / rate
+
+    def capture_average(self) -> Dict[str, float]:
+        """
+        Capture configured number of points (one shot, immediate trigger)
+        and return mean X, Y with R and angle of the mean. X_std and Y_std
+        are standard deviations of all points. noise_std for settling is
+        taken from points decimated to about one per time constant, since
+        points at the capture rate are correlated by the output filter and
+        their std underestimates the noise of readings one poll apart. It
+        is not updated if the capture is shorter than two time constants.
+        """
+        if self._capture_n is None:
+            raise RuntimeError("Capture is not configured")
+        n_points = self._capture_n
+        self.resource.write("CAPTURESTART ONE, IMM")
+        time.sleep(n_points / self._capture_rate)
+        while int(self._query("CAPTUREBYTES?")) < n_points * BYTES_PER_XY:
+            time.sleep(0.01)
+        self.resource.write("CAPTURESTOP")
+        n_kb = math.ceil(n_points * BYTES_PER_XY / 1024)
+        self.n_query += 1
+        data = np.asarray(self.resource.query_binary_values(
+            f"CAPTUREGET? 0, {n_kb}", datatype = "f", is_big_endian = False, container = np.array
+        ))[:2 * n_points].reshape(-1, 2)
+        x, y = data[:, 0].mean(), data[:, 1].mean()
+        step = max(1, round(self.time_constant * self._capture_rate))
+        independent = data[::step]
+        if len(independent) >= 2:
+            self.noise_std = float(independent.std(axis = 0, ddof = 1).max())
+        return {
+            "X"     : float(x),
+            "Y"     : float(y),
+            "R"     : float(np.hypot(x, y)),
+            "angle" : float(np.degrees(np.arctan2(y, x))),
+            "X_std" : float(data[:, 0].std()),
+            "Y_std" : float(data[:, 1].std()),
+        }
+#################################################################
+# Gate sweep
+#################################################################
+class LockinMeasurement:
+    """
+    Gate voltage sweep with Keithley 2400 (pymeasure) and SR860Engine.
+    n_average : 0 reads the settled snapshot, otherwise the mean of
+                n_average capture buffer points is taken after settling.
+    """
+    def __init__(
+        self,
+        lockin: SR860Engine,
+        gate: Any,
+        n_average: int = 0,
+        capture_rate_divider: int = 0,
+        ramp_steps: int = 2,
+        ramp_pause: float = 0.1
+    ):
+        self.lockin     = lockin
+        self.gate       = gate
+        self.n_average  = n_average
+        self.ramp_steps = ramp_steps
+        self.ramp_pause = ramp_pause
+        if n_average > 0:
+            lockin.configure_capture(n_average, capture_rate_divider)
+
+    def measure(
+        self,
+        v_g: float
+    ) -> Dict[str, float]:
+        """
+        Same keys as measurement() in LED_Reset_Meas.ipynb, plus settle_s
+        """
+        self.gate.ramp_to_voltage(v_g, steps = self.ramp_steps, pause = self.ramp_pause)
+        reading, settle_s = self.lockin.wait_settled()
+        if self.n_average > 0:
+            reading = self.lockin.capture_average()
+        reading["settle_s"] = settle_s
+        return reading
+
+    def sweep(
+        self,
+        v_g_list: Sequence[float],
+        progress: bool = True
+    ) -> Dict[str, List[List[float]]]:
+        """
+        Data set in the notebook format {"X": [[v_g, X], ...], ...}
+        """
+        data_set: Dict[str, List[List[float]]] = {"X": [], "Y": [], "R": [], "angle": [], "settle_s": []}
+        self.gate.enable_source()
+        start_time = time.perf_counter()
+        for i, v_g in enumerate(v_g_list):
+            meas_data = self.measure(v_g)
+            for key in data_set:
+                data_set[key].append([v_g, meas_data[key]])
+            if progress:
+                elapsed = time.perf_counter() - start_time
+                print(f"\r{i + 1}/{len(v_g_list)} : {elapsed / (i + 1):.2f} s/point", end = "")
+        if progress:
+            print()
+        return data_set
@@ -0,0 +1,192 @@
+"""Concurrent multi-instrument VISA control with per-instrument ordering"""
+import time
+import queue
+import asyncio
+import threading
+from concurrent.futures import Future
+from typing import Any, Callable, Dict, List, Optional, Sequence, Union
+#################################################################
+# Instrument worker
+#################################################################
+_STOP = object()
+
+class InstrumentWorker:
+    """
+    One thread which owns one instrument (pyvisa resource or driver object,
+    e.g. SR860, Keithley2400, QDAC-II). Calls are run in submission order,
+    so commands to one instrument never overlap or reorder, while calls to
+    other instruments run at the same time.
+    """
+    def __init__(
+        self,
+        name: str,
+        instrument: Any
+    ):
+        self.name       = name
+        self.instrument = instrument
+        self.busy_s     = 0.0
+        self.n_calls    = 0
+        self._queue     = queue.Queue()
+        self._thread    = threading.Thread(target = self._run, name = f"visa-{name}", daemon = True)
+        self._thread.start()
+
+    def _run(self) -> None:
+        while True:
+            item = self._queue.get()
+            if item is _STOP:
+                return
+            fn, args, kwargs, future = item
+            if not future.set_running_or_notify_cancel():
+                continue
+            start = time.perf_counter()
+            try:
+                future.set_result(fn(self.instrument, *args, **kwargs))
+            except BaseException as e:
+                future.set_exception(e)
+            finally:
+                self.busy_s += time.perf_counter() - start
+                self.n_calls += 1
+
+    def submit(
+        self,
+        fn: Callable[..., Any],
+        *args,
+        **kwargs
+    ) -> Future:
+        """
+        fn(instrument, *args, **kwargs) in the instrument thread
+        """
+        if not self._thread.is_alive():
+            raise RuntimeError(f"{self.name} worker is closed")
+        future = Future()
+        self._queue.put((fn, args, kwargs, future))
+        return future
+
+    def close(self) -> None:
+        if self._thread.is_alive():
+            self._queue.put(_STOP)
+            self._thread.join()
+#################################################################
+# Orchestrator
+#################################################################
+Step = Union[str, Callable[[Any], Any]]
+
+def _call(
+    instrument: Any,
+    step: Step
+) -> Any:
+    """
+    "cmd?" is a query, other strings are writes, callables get the instrument
+    """
+    if callable(step):
+        return step(instrument)
+    if step.rstrip().split(" ")[0].endswith("?"):
+        return instrument.query(step)
+    return instrument.write(step)
+
+class VisaOrchestrator:
+    """
+    Thread per VISA session. Independent setup commands and queries to
+    different instruments are issued concurrently, commands to the same
+    instrument keep their order.
+    Instruments on one GPIB board still share the bus, so the gain is the
+    overlap of instrument side time (settling, measurement, ramp pauses),
+    which is most of the time of a sweep step.
+    """
+    def __init__(
+        self,
+        instruments: Dict[str, Any]
+    ):
+        self.workers: Dict[str, InstrumentWorker] = {
+            name: InstrumentWorker(name, instrument) for name, instrument in instruments.items()
+        }
+
+    def submit(
+        self,
+        name: str,
+        fn: Callable[..., Any],
+        *args,
+        **kwargs
+    ) -> Future:
+        return self.workers[name].submit(fn, *args, **kwargs)
+
+    def write(
+        self,
+        name: str,
+        cmd: str
+    ) -> Future:
+        return self.submit(name, lambda inst: inst.write(cmd))
+
+    def query(
+        self,
+        name: str,
+        cmd: str
+    ) -> Future:
+        return self.submit(name, lambda inst: inst.query(cmd))
+
+    def run(
+        self,
+        plan: Dict[str, Sequence[Step]],
+        timeout_s: Optional[float] = None
+    ) -> Dict[str, List[Any]]:
+        """
+        Run steps of every instrument in order, instruments concurrently,
+        and wait for all. Step is a SCPI string or callable(instrument).
+        Returns {name : results of steps}. First error is raised after all
+        instruments are finished.
+            orchestrator.run({
+                "gate"  : [lambda g: g.ramp_to_voltage(v_g, steps = 2, pause = 0.1)],
+                "sg386" : [f"FREQ {f} MHz"],
+                "scope" : [":MARK:Y1Position?"],
+            })
+        """
+        futures = {
+            name: [self.submit(name, _call, step) for step in steps]
+            for name, steps in plan.items()
+        }
+        deadline = None if timeout_s is None else time.perf_counter() + timeout_s
+        results: Dict[str, List[Any]] = {}
+        error: Optional[BaseException] = None
+        for name, fs in futures.items():
+            results[name] = []
+            for f in fs:
+                remaining = None if deadline is None else max(deadline - time.perf_counter(), 0.0)
+                try:
+                    results[name].append(f.result(remaining))
+                except BaseException as e:
+                    results[name].append(None)
+                    error = error or e
+        if error is not None:
+            raise error
+        return results
+
+    async def arun(
+        self,
+        plan: Dict[str, Sequence[Step]]
+    ) -> Dict[str, List[Any]]:
+        """
+        run() for asyncio code (e.g. Jupyter top-level await)
+        """
+        futures = {
+            name: [asyncio.wrap_future(self.submit(name, _call, step)) for step in steps]
+            for name, steps in plan.items()
+        }
+        return {name: list(await asyncio.gather(*fs)) for name, fs in futures.items()}
+
+    def stats(self) -> Dict[str, Dict[str, float]]:
+        """
+        {name : {"calls", "busy_s"}} of every instrument
+        """
+        return {
+            name: {"calls": w.n_calls, "busy_s": w.busy_s} for name, w in self.workers.items()
+        }
+
+    def close(self) -> None:
+        for worker in self.workers.values():
+            worker.close()
+
+    def __enter__(self) -> "VisaOrchestrator":
+        return self
+
+    def __exit__(self, *exc) -> None:
+        self.close()
@@ -0,0 +1,181 @@
+"""Offline benchmark of serial vs concurrent instrument stepping with pyvisa-sim"""
+import os
+import time
+import argparse
+import threading
+import numpy as np
+from typing import Any, Callable, Dict, List, Tuple
+
+from visa_orchestrator import VisaOrchestrator
+#################################################################
+# Simulated instruments
+# visa_sim.yaml defines SR860, Keithley 2400, SG386 and Keysight scope.
+# pyvisa-sim answers immediately, so bus and instrument time of each
+# call is added by LatencyResource.
+#################################################################
+HERE = os.path.dirname(os.path.abspath(__file__))
+SIM_FILE = os.path.join(HERE, "visa_sim.yaml")
+RESOURCES = {
+    "lockin"    : "GPIB0::4::INSTR",
+    "gate"      : "GPIB0::3::INSTR",
+    "sg386"     : "GPIB0::27::INSTR",
+    "scope"     : "USB0::0x2A8D::0x0396::SIM00000::0::INSTR",
+}
+# [s] (bus, instrument) time of write and query.
+# Bus time is one message transfer on the board, and a query transfers twice
+# (command and response). Instrument time is processing in the instrument.
+LATENCY = {
+    "lockin"    : {"write": (0.001, 0.001), "query": (0.001, 0.006)},
+    "gate"      : {"write": (0.002, 0.002), "query": (0.002, 0.006)},
+    "sg386"     : {"write": (0.002, 0.003), "query": (0.002, 0.006)},
+    "scope"     : {"write": (0.002, 0.008), "query": (0.002, 0.046)},
+}
+
+def board_of(
+    address: str
+) -> str:
+    """
+    Interface board of VISA address, e.g. "GPIB0" of "GPIB0::4::INSTR"
+    """
+    return address.split("::")[0].upper()
+
+class LatencyResource:
+    """
+    pyvisa resource with fixed latency of every write and query.
+    Bus time is taken while holding bus_lock, which is shared by all
+    resources on the same board (one GPIB controller transfers one message
+    at a time), so only instrument time overlaps between instruments.
+    """
+    def __init__(
+        self,
+        resource: Any,
+        bus_lock: threading.Lock,
+        latency: Dict[str, Tuple[float, float]]
+    ):
+        self.resource   = resource
+        self.bus_lock   = bus_lock
+        self.latency    = latency
+
+    def _transfer(
+        self,
+        bus_s: float
+    ) -> None:
+        with self.bus_lock:
+            time.sleep(bus_s)
+
+    def write(
+        self,
+        cmd: str
+    ) -> Any:
+        bus_s, instrument_s = self.latency["write"]
+        self._transfer(bus_s)
+        time.sleep(instrument_s)
+        return self.resource.write(cmd)
+
+    def query(
+        self,
+        cmd: str
+    ) -> str:
+        bus_s, instrument_s = self.latency["query"]
+        self._transfer(bus_s)
+        time.sleep(instrument_s)
+        self._transfer(bus_s)
+        return self.resource.query(cmd)
+
+    def close(self) -> None:
+        self.resource.close()
+
+def open_sim_instruments(
+    latency_scale: float = 1.0
+) -> Dict[str, LatencyResource]:
+    """
+    {name : simulated resource}. Needs pyvisa and pyvisa-sim.
+    """
+    import pyvisa
+
+    rm = pyvisa.ResourceManager(f"{SIM_FILE}@sim")
+    bus_locks = {board_of(address): threading.Lock() for address in RESOURCES.values()}
+    instruments = {}
+    for name, address in RESOURCES.items():
+        resource = rm.open_resource(address, read_termination = "\n", write_termination = "\n")
+        latency = {
+            kind: (bus_s * latency_scale, instrument_s * latency_scale)
+            for kind, (bus_s, instrument_s) in LATENCY[name].items()
+        }
+        instruments[name] = LatencyResource(resource, bus_locks[board_of(address)], latency)
+    return instruments
+#################################################################
+# Sweep step
+#################################################################
+def step_plan(
+    v_g: float,
+    freq_mhz: float
+) -> Dict[str, List[str]]:
+    """
+    One step of a gate x frequency sweep: set gate and source, then read
+    lock-in and scope marker
+    """
+    return {
+        "gate"      : [f":SOUR:VOLT:LEV {v_g:.6f}", ":SOUR:VOLT:LEV?"],
+        "sg386"     : [f"FREQ {freq_mhz:.6f} MHz", "FREQ? MHz"],
+        "lockin"    : ["SNAP? 0,1,2"],
+        "scope"     : [":MARK:Y1Position?"],
+    }
+
+def run_serial(
+    instruments: Dict[str, Any],
+    plans: List[Dict[str, List[str]]]
+) -> float:
+    start = time.perf_counter()
+    for plan in plans:
+        for name, steps in plan.items():
+            for step in steps:
+                if step.split(" ")[0].endswith("?"):
+                    instruments[name].query(step)
+                else:
+                    instruments[name].write(step)
+    return time.perf_counter() - start
+
+def run_concurrent(
+    instruments: Dict[str, Any],
+    plans: List[Dict[str, List[str]]]
+) -> float:
+    with VisaOrchestrator(instruments) as orchestrator:
+        start = time.perf_counter()
+        for plan in plans:
+            orchestrator.run(plan)
+        return time.perf_counter() - start
+
+def benchmark(
+    n_steps: int = 50,
+    latency_scale: float = 1.0,
+    repeat: int = 3
+) -> Dict[str, float]:
+    """
+    Best time per step [s] of serial and concurrent stepping
+    """
+    instruments = open_sim_instruments(latency_scale)
+    plans = [
+        step_plan(v_g, f)
+        for v_g, f in zip(np.linspace(0, 5.0, n_steps), np.linspace(100.0, 200.0, n_steps))
+    ]
+    runners: Dict[str, Callable] = {"serial": run_serial, "concurrent": run_concurrent}
+    result = {}
+    for label, runner in runners.items():
+        result[label] = min(runner(instruments, plans) for _ in range(repeat)) / n_steps
+    for instrument in instruments.values():
+        instrument.close()
+    result["speedup"] = result["serial"] / result["concurrent"]
+    return result
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description = __doc__)
+    parser.add_argument("--steps", type = int, default = 50)
+    parser.add_argument("--latency-scale", type = float, default = 1.0)
+    parser.add_argument("--repeat", type = int, default = 3)
+    args = parser.parse_args()
+
+    result = benchmark(args.steps, args.latency_scale, args.repeat)
+    print(f"serial     : {result['serial'] * 1e3:.1f} ms/step")
+    print(f"concurrent : {result['concurrent'] * 1e3:.1f} ms/step")
+    print(f"speedup    : {result['speedup']:.2f}x")
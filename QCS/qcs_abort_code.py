@@ -1,25 +1,15 @@
 	"""Abort a running program"""
-	import keysight.qcs as qcs
+	from qcs_watchdog import ProgramWatchdog
 	#################################################################
-	# Dummy mapper and backend for aborting a program
+	# Watchdog with its own dummy mapper and backend, which is
+	# enough to query and abort a program
 	#################################################################
-	mapper  = qcs.ChannelMapper()
-	backend = qcs.HclBackend(mapper)
+	watchdog = ProgramWatchdog()
 	#################################################################
 	# Check if there is a running program and abort it
 	#################################################################
-	if (
-	    backend.get_program_state(
-	        backend.get_program_execution_history()[0]["accession_id"]
-	    ) == "Running"
-	):
-	    backend.abort_program(backend.get_program_execution_history()[0]["accession_id"])
-	    print(
-	        backend.get_program_state(
-	            backend.get_program_execution_history()[0]["accession_id"]
-	        )
-	    )
+	if watchdog.abort_running():
+	    print(watchdog.records[watchdog.latest_id()].state)
 	    print("Aborted running program...")
 	else:
 	    print("There is no running program...")
-	
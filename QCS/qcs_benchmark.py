@@ -0,0 +1,142 @@
+"""Offline benchmark of QCS example scripts (program build, execution dispatch, result writing)"""
+import os
+import sys
+import time
+import tempfile
+import textwrap
+import statistics
+import contextlib
+from typing import Any, Dict, List, Optional, Sequence
+
+import qcs_offline
+import qcs_report
+#################################################################
+# Example scripts
+# Scripts which only build a program (qcs_dc_generation.py) are
+# included to time program construction.
+#################################################################
+HERE = os.path.dirname(os.path.abspath(__file__))
+SCRIPTS = [
+    "qcs_test_pulse.py",
+    "qcs_execute_meas_trace.py",
+    "qcs_execute_meas_IQ.py",
+    "qcs_iq_loopback.py",
+    "qcs_up_down_conversion.py",
+    "qcs_rf_dc_generation.py",
+    "qcs_dc_generation.py",
+    "qcs_repetitive.py",
+]
+STAGES = ["build", "compile", "synthesize", "dispatch", "write", "total"]
+
+def _load_source(
+    path: str
+) -> str:
+    """
+    Source of script. Some scripts have every line indented by a tab,
+    which is removed so that they can be compiled.
+    """
+    with open(path, "r", encoding = "utf-8") as f:
+        return textwrap.dedent(f.read())
+
+def run_script(
+    path: str
+) -> Dict[str, float]:
+    """
+    Run one script with the offline backend in a temporary directory, and
+    return time of each stage [s]
+        build      : script start to first execute (program construction)
+        compile    : timeline of all sweep points
+        synthesize : synthetic traces / IQ data
+        dispatch   : execute time except compile and synthesize
+        write      : program.to_hdf5 and reading results from executed programs
+    """
+    qcs_offline.install()
+    qcs_offline.reset_timings()
+    code = compile(_load_source(path), path, "exec")
+    first_execute = []
+    execute = qcs_offline.Executor.execute
+
+    def timed_execute(self, program):
+        if not first_execute:
+            first_execute.append(time.perf_counter())
+        return execute(self, program)
+
+    qcs_offline.Executor.execute = timed_execute
+    cwd = os.getcwd()
+    try:
+        with tempfile.TemporaryDirectory() as tmp:
+            # qcs_test_pulse.py writes to ./QCS/
+            os.makedirs(os.path.join(tmp, "QCS"))
+            os.chdir(tmp)
+            with open(os.devnull, "w") as devnull, contextlib.redirect_stdout(devnull):
+                start = time.perf_counter()
+                try:
+                    exec(code, {"__name__": "__main__", "__file__": path})
+                    end = time.perf_counter()
+                finally:
+                    # Reports of the script read and write files in tmp
+                    qcs_report.close_reporters()
+    finally:
+        os.chdir(cwd)
+        qcs_offline.Executor.execute = execute
+    timings = {k: sum(v) for k, v in qcs_offline.timings.items()}
+    executed = timings.get("execute", 0.0)
+    return {
+        "build"         : (first_execute[0] if first_execute else end) - start,
+        "compile"       : timings.get("compile", 0.0),
+        "synthesize"    : timings.get("synthesize", 0.0),
+        "dispatch"      : executed - timings.get("compile", 0.0) - timings.get("synthesize", 0.0),
+        "write"         : timings.get("to_hdf5", 0.0) + timings.get("get_results", 0.0),
+        "total"         : end - start,
+    }
+
+def run_benchmark(
+    scripts: Optional[Sequence[str]] = None,
+    n_repeat: int = 3,
+    waveform_cache: Any = None
+) -> Dict[str, Dict[str, float]]:
+    """
+    Median time of each stage over n_repeat runs, {script : {stage : s}}.
+    waveform_cache (WaveformCache) is used by all offline backends of the
+    scripts, so --cache shows the offline sampling time saved, not a
+    hardware speedup.
+    """
+    qcs_offline.waveform_cache = waveform_cache
+    import matplotlib
+    matplotlib.use("Agg")
+    if HERE not in sys.path:
+        sys.path.insert(0, HERE)
+    results = {}
+    for name in scripts or SCRIPTS:
+        runs: List[Dict[str, float]] = []
+        for _ in range(n_repeat):
+            try:
+                runs.append(run_script(os.path.join(HERE, name)))
+            except Exception as e:
+                print(f"{name} failed : {type(e).__name__}: {e}")
+                break
+        if runs:
+            results[name] = {stage: statistics.median(r[stage] for r in runs) for stage in STAGES}
+    return results
+
+def format_results(
+    results: Dict[str, Dict[str, float]]
+) -> str:
+    header = f"{'script':28s}" + "".join(f"{stage:>12s}" for stage in STAGES)
+    lines = [header, "-" * len(header)]
+    for name, stages in results.items():
+        lines.append(f"{name:28s}" + "".join(f"{stages[stage] * 1e3:10.2f}ms" for stage in STAGES))
+    return "\n".join(lines)
+
+if __name__ == "__main__":
+    # python qcs_benchmark.py [--cache] [script ...]
+    # --cache : offline backends reuse sampled waveforms (qcs_waveform_cache.py)
+    args = sys.argv[1:]
+    cache = None
+    if "--cache" in args:
+        from qcs_waveform_cache import WaveformCache
+        args.remove("--cache")
+        cache = WaveformCache()
+    print(format_results(run_benchmark(args or None, waveform_cache = cache)))
+    if cache is not None:
+        print(cache)
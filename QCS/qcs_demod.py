@@ -0,0 +1,194 @@
+"""
+Host side IQ demodulation of raw QCS traces (hw_demod = False).
+The integration filter (RFWaveform) is turned into a kernel of
+envelope x carrier once per trace length, and all shots and sweep points
+are demodulated with one matrix product. Very large trace stacks can be
+split into chunks which are demodulated in a process pool.
+"""
+import numpy as np
+import h5py
+from functools import lru_cache
+from concurrent.futures import ProcessPoolExecutor
+from typing import Any, Dict, Optional, Tuple
+
+SAMPLE_RATE = 4.8e9             # M5200 digitizer sample rate [Sa/s]
+#################################################################
+# Integration filter kernel
+#################################################################
+def envelope_spec(
+    envelope: Any
+) -> Tuple:
+    """
+    Hashable description of envelope. Constant, Gaussian and Arbitrary
+    envelopes of keysight.qcs are supported.
+    """
+    name = type(envelope).__name__
+    if "Gaussian" in name:
+        return ("gaussian", float(getattr(envelope, "num_sigma", 2.0)))
+    if "Arbitrary" in name:
+        return ("arbitrary", tuple(envelope.times), tuple(envelope.amplitudes))
+    if "Constant" in name or envelope is None:
+        return ("constant",)
+    raise ValueError(f"Unsupported envelope : {name}")
+
+def envelope_samples(
+    spec: Tuple,
+    x: np.ndarray
+) -> np.ndarray:
+    if spec[0] == "gaussian":
+        return np.exp(-0.5 * ((x - 0.5) * 2 * spec[1]) ** 2)
+    if spec[0] == "arbitrary":
+        return np.interp(x, spec[1], spec[2])
+    return np.ones_like(x)
+
+@lru_cache(maxsize = 32)
+def _kernel(
+    n_samples: int,
+    sample_rate: float,
+    frequency: float,
+    phase: float,
+    envelope: Tuple
+) -> np.ndarray:
+    """
+    Real kernel matrix (n_samples, 2) so that traces @ kernel gives (I, Q).
+    Kernel is normalised so that a tone of amplitude A matched to the filter
+    gives |IQ| = A.
+    """
+    t = np.arange(n_samples) / sample_rate
+    weight = envelope_samples(envelope, t * sample_rate / n_samples)
+    arg = 2 * np.pi * frequency * t + phase
+    norm = 2.0 / max(np.dot(weight, weight), 1e-30)
+    kernel = np.empty((n_samples, 2))
+    kernel[:, 0] = norm * weight * np.cos(arg)
+    kernel[:, 1] = -norm * weight * np.sin(arg)
+    kernel.setflags(write = False)
+    return kernel
+
+def clear_cache() -> None:
+    """
+    Drop cached kernels
+    """
+    _kernel.cache_clear()
+
+def filter_kernel(
+    integration_filter: Any,
+    n_samples: int,
+    sample_rate: float = SAMPLE_RATE,
+    lo_frequency: float = 0.0
+) -> np.ndarray:
+    """
+    Kernel of RFWaveform integration filter. Frequency is rf_frequency minus
+    LO of the downconverter (0 if the digitizer has no downconverter).
+    Filter parameters should be numbers, not swept qcs.Scalar.
+    """
+    frequency = float(integration_filter.rf_frequency) - lo_frequency
+    phase = float(getattr(integration_filter, "instantaneous_phase", 0.0) or 0.0)
+    return _kernel(
+        int(n_samples), float(sample_rate), frequency, phase,
+        envelope_spec(integration_filter.envelope)
+    )
+#################################################################
+# Demodulation
+#################################################################
+def _demod_chunk(
+    traces: np.ndarray,
+    kernel: np.ndarray
+) -> np.ndarray:
+    iq = traces @ kernel
+    return iq[..., 0] + 1j * iq[..., 1]
+
+class IQDemodulator:
+    """
+    Demodulate trace stacks (..., n_samples) against one integration filter
+    chunk_size : number of traces per matrix product. None does all at once.
+    processes  : number of worker processes used for chunks. None or 1 runs
+                 chunks sequentially in this process.
+    """
+    def __init__(
+        self,
+        integration_filter: Any,
+        sample_rate: float = SAMPLE_RATE,
+        lo_frequency: float = 0.0,
+        chunk_size: Optional[int] = None,
+        processes: Optional[int] = None
+    ):
+        self.integration_filter = integration_filter
+        self.sample_rate        = sample_rate
+        self.lo_frequency       = lo_frequency
+        self.chunk_size         = chunk_size
+        self.processes          = processes
+
+    def kernel(
+        self,
+        n_samples: int
+    ) -> np.ndarray:
+        return filter_kernel(self.integration_filter, n_samples, self.sample_rate, self.lo_frequency)
+
+    def demodulate(
+        self,
+        traces: np.ndarray
+    ) -> np.ndarray:
+        """
+        IQ of each trace, shape of traces without the last (sample) axis
+        """
+        traces = np.asarray(traces, dtype = np.float64)
+        kernel = self.kernel(traces.shape[-1])
+        flat = traces.reshape(-1, traces.shape[-1])
+        n_traces = flat.shape[0]
+        if self.chunk_size is None or self.chunk_size >= n_traces:
+            iq = _demod_chunk(flat, kernel)
+        else:
+            bounds = range(0, n_traces, self.chunk_size)
+            if self.processes is not None and self.processes > 1:
+                with ProcessPoolExecutor(max_workers = self.processes) as pool:
+                    futures = [
+                        pool.submit(_demod_chunk, flat[k:k + self.chunk_size], kernel)
+                        for k in bounds
+                    ]
+                    iq = np.concatenate([f.result() for f in futures])
+            else:
+                iq = np.concatenate([_demod_chunk(flat[k:k + self.chunk_size], kernel) for k in bounds])
+        return iq.reshape(traces.shape[:-1])
+#################################################################
+# QCS result files
+#################################################################
+def trace_stack(
+    trace: np.ndarray,
+    shape: Optional[np.ndarray] = None,
+    n_shots: Optional[int] = None
+) -> np.ndarray:
+    """
+    Reshape flat trace dataset into (n_points, n_shots, n_samples).
+    shape is the "Shape" attribute of program.to_hdf5 file, [[*sweep, n_shots, -1]].
+    """
+    trace = np.asarray(trace)
+    if n_shots is None:
+        n_shots = int(np.ravel(shape)[-2]) if shape is not None else 1
+    n_points = int(np.prod(np.ravel(shape)[:-2])) if shape is not None else 1
+    return trace.reshape(n_points, n_shots, -1)
+
+def demodulate_file(
+    path: str,
+    integration_filter: Any,
+    channel: Optional[int] = None,
+    sample_rate: float = SAMPLE_RATE,
+    lo_frequency: float = 0.0,
+    chunk_size: Optional[int] = None,
+    processes: Optional[int] = None
+) -> Dict[str, np.ndarray]:
+    """
+    Demodulate trace datasets of program.to_hdf5 file.
+    Returns {dataset group : IQ (n_points, n_shots)}. channel selects
+    DutChannel_<channel>_* datasets, None demodulates all of them.
+    """
+    demod = IQDemodulator(integration_filter, sample_rate, lo_frequency, chunk_size, processes)
+    iq = {}
+    with h5py.File(path, "r") as f:
+        shape = f.attrs.get("Shape")
+        for group in f:
+            if "trace" not in f[group]:
+                continue
+            if channel is not None and not group.startswith(f"DutChannel_{channel}_"):
+                continue
+            iq[group] = demod.demodulate(trace_stack(f[group]["trace"][()], shape))
+    return iq
@@ -2,40 +2,25 @@
 import keysight.qcs as qcs
 import time
 
+from qcs_hardware_profile import get_profile, get_backend, get_executor
+from qcs_profiler import ExecutionProfiler
+
 ns = 1e-9
 us = 1e-6
 MHz = 1e6
+# Shots of the program, also used for shots/s of the profiler
+n_shots = 10000
 
 program = qcs.Program()
-mapper = qcs.ChannelMapper()
-
-awg_channels = qcs.Channels(
-    labels = range(4),
-    name = "awg_channels",
-)
-dig_channels = qcs.Channels(
-    labels = range(4),
-    name = "dig_channels",
-)
-
-mapper.add_channel_mapping(
-    awg_channels,
-    [
-        (1,4,1), (1,4,2), (1,4,3), (1,4,4)
-    ],
-    instrument_types = qcs.InstrumentEnum.M5300AWG,
-)
-mapper.add_channel_mapping(
-    dig_channels,
-    [
-        (1,18,1), (1,18,2), (1,18,3), (1,18,4)
-    ],
-    instrument_types = qcs.InstrumentEnum.M5200Digitizer
-)
-mapper.set_lo_frequencies(
-    (1,4,4),
-    lo_frequency=0
+#################################################################
+# Cached channel mapper of the chassis (see qcs_hardware_profile.py)
+# awg_channels -> M5300 AWG, dig_channels -> M5200 Digitizer
+#################################################################
+profile = get_profile(
+    lo_frequencies = {(1,4,4): 0}
 )
+awg_channels = profile.awg_channels
+dig_channels = profile.dig_channels
 
 program.add_waveform(
     pulse = qcs.RFWaveform(
@@ -56,18 +41,27 @@ program.add_acquisition(
     channels = dig_channels[3]
 )
 
-program.n_shots(10000)
+program.n_shots(n_shots)
 
-backend = qcs.HclBackend(
-    channel_mapper=mapper,
+backend = get_backend(
+    profile,
     hw_demod = True,
     init_time = 60 * ns,
 )
 
+# Phases of execution are recorded in Chrome trace format
+profiler = ExecutionProfiler()
 start_time = time.time()
-program = qcs.Executor(backend).execute(program)
+program = profiler.execute(
+    get_executor(backend),
+    program,
+    label = "hw_demod=True",
+    n_shots = n_shots
+)
 # program.to_hdf5("test_result")
 end_time = time.time()
 
 print(end_time - start_time)
+print(profiler.summary())
+profiler.save("qcs_execute_meas_IQ_timeline.json")
 
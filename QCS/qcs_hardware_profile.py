@@ -0,0 +1,194 @@
+"""Shared M9046A chassis profile with cached channel mapper and backend"""
+import time
+import keysight.qcs as qcs
+from typing import Any, Dict, List, Optional, Tuple
+#################################################################
+# Chassis layout
+# M5300 AWG        -> M9046A chassis, slot 1, module 4,  channel 1 ~ 4
+# M5301 AWG        -> M9046A chassis, slot 1, module 7,  channel 1 ~ 4
+# M5200 Digitizer  -> M9046A chassis, slot 1, module 18, channel 1 ~ 4
+#################################################################
+CHASSIS         = 1
+M5300AWG_SLOT   = 4
+M5301AWG_SLOT   = 7
+M5200DIG_SLOT   = 18
+N_CHANNELS      = 4
+
+Address = Tuple[int, int, int]
+
+def slot_addresses(
+    slot: int,
+    chassis: int = CHASSIS
+) -> List[Address]:
+    return [(chassis, slot, ch + 1) for ch in range(N_CHANNELS)]
+#################################################################
+# Hardware profile
+#################################################################
+class HardwareProfile:
+    """
+    Virtual channels and channel mapper of the chassis, with the same
+    channel names as the scripts.
+    awg_channels : M5300 AWG channels
+    dig_channels : M5200 Digitizer channels
+    dc_awgs      : M5301 AWG channels, mapped only if dc_awgs is True
+                   (None otherwise)
+    lo_frequencies : {address : LO frequency} set on the mapper. They are
+                   part of the profile, so that a cached mapper never
+                   carries LO settings of another script.
+    """
+    def __init__(
+        self,
+        ip: Optional[str] = None,
+        absolute_phase: bool = False,
+        dc_awgs: bool = False,
+        lo_frequencies: Optional[Dict[Address, float]] = None,
+        digitizer_range: Optional[float] = None
+    ):
+        self.ip             = ip
+        self.absolute_phase = absolute_phase
+        self.lo_frequencies = dict(lo_frequencies or {})
+        self.awg_channels   = qcs.Channels(range(N_CHANNELS), "awg_channels", absolute_phase = absolute_phase)
+        self.dig_channels   = qcs.Channels(range(N_CHANNELS), "dig_channels", absolute_phase = absolute_phase)
+        self.dc_awgs        = qcs.Channels(range(N_CHANNELS), "dc_awgs") if dc_awgs else None
+        self.mapper         = qcs.ChannelMapper(ip) if ip is not None else qcs.ChannelMapper()
+        self.mapper.add_channel_mapping(
+            channels    = self.awg_channels,
+            addresses   = slot_addresses(M5300AWG_SLOT),
+            instrument_types = qcs.InstrumentEnum.M5300AWG
+        )
+        if self.dc_awgs is not None:
+            self.mapper.add_channel_mapping(
+                channels    = self.dc_awgs,
+                addresses   = slot_addresses(M5301AWG_SLOT),
+                instrument_types = qcs.InstrumentEnum.M5301AWG
+            )
+        self.mapper.add_channel_mapping(
+            channels    = self.dig_channels,
+            addresses   = slot_addresses(M5200DIG_SLOT),
+            instrument_types = qcs.InstrumentEnum.M5200Digitizer
+        )
+        for address, lo_frequency in self.lo_frequencies.items():
+            self.mapper.set_lo_frequencies(addresses = [address], lo_frequency = lo_frequency)
+        if digitizer_range is not None:
+            self.set_digitizer_range(digitizer_range)
+
+    def set_digitizer_range(
+        self,
+        value: float,
+        channels: Optional[List[int]] = None
+    ) -> None:
+        phys = self.mapper.get_physical_channels(self.dig_channels)
+        for ch in (range(N_CHANNELS) if channels is None else channels):
+            phys[ch].settings.range.value = value
+#################################################################
+# Caches
+#################################################################
+_profiles: Dict[Tuple, HardwareProfile] = {}
+_backends: Dict[Tuple, Any] = {}
+_executors: Dict[int, Any] = {}
+startup_times: Dict[str, List[float]] = {}
+
+def _record(
+    name: str,
+    start: float
+) -> None:
+    startup_times.setdefault(name, []).append(time.perf_counter() - start)
+
+def get_profile(
+    ip: Optional[str] = None,
+    absolute_phase: bool = False,
+    dc_awgs: bool = False,
+    lo_frequencies: Optional[Dict[Address, float]] = None
+) -> HardwareProfile:
+    """
+    Return cached HardwareProfile. Channel mapper is built only once per
+    session for each set of options, including LO frequencies.
+    """
+    lo_key = tuple(sorted((tuple(a), f) for a, f in (lo_frequencies or {}).items()))
+    key = (ip, absolute_phase, dc_awgs, lo_key)
+    start = time.perf_counter()
+    if key not in _profiles:
+        _profiles[key] = HardwareProfile(
+            ip              = ip,
+            absolute_phase  = absolute_phase,
+            dc_awgs         = dc_awgs,
+            lo_frequencies  = lo_frequencies
+        )
+    _record("profile", start)
+    return _profiles[key]
+
+def get_backend(
+    profile: HardwareProfile,
+    **kwargs
+) -> qcs.HclBackend:
+    """
+    Return long-lived HclBackend for profile and backend options
+    (hw_demod, init_time, reset_phase_every_shot, ...).
+    """
+    key = (id(profile.mapper), tuple(sorted(kwargs.items())))
+    start = time.perf_counter()
+    if key not in _backends:
+        _backends[key] = qcs.HclBackend(channel_mapper = profile.mapper, **kwargs)
+    _record("backend", start)
+    return _backends[key]
+
+def get_executor(
+    backend: qcs.HclBackend
+) -> qcs.Executor:
+    start = time.perf_counter()
+    if id(backend) not in _executors:
+        _executors[id(backend)] = qcs.Executor(backend)
+    _record("executor", start)
+    return _executors[id(backend)]
+
+def execute(
+    program: qcs.Program,
+    profile: Optional[HardwareProfile] = None,
+    **backend_kwargs
+) -> qcs.Program:
+    """
+    Execute program with cached profile, backend, and executor
+    """
+    profile = profile or get_profile()
+    backend = get_backend(profile, **backend_kwargs)
+    return get_executor(backend).execute(program)
+
+def clear_cache() -> None:
+    _profiles.clear()
+    _backends.clear()
+    _executors.clear()
+
+def startup_report() -> str:
+    """
+    First (cold) and mean of later (warm) startup time of each stage
+    """
+    lines = []
+    for name, times in startup_times.items():
+        warm = times[1:]
+        warm_str = f"{sum(warm) / len(warm) * 1e3:.3f} ms" if warm else "-"
+        lines.append(f"{name:10s} cold : {times[0] * 1e3:.3f} ms, warm : {warm_str} ({len(times)} calls)")
+    return "\n".join(lines)
+
+if __name__ == "__main__":
+    ns = 1e-9
+    n_run = 5
+    #################################################################
+    # Current scripts : mapper and backend are built for every run
+    #################################################################
+    start_time = time.perf_counter()
+    for i in range(n_run):
+        profile = HardwareProfile()
+        backend = qcs.HclBackend(channel_mapper = profile.mapper, hw_demod = True, init_time = 60 * ns)
+        executor = qcs.Executor(backend)
+    fresh_time = (time.perf_counter() - start_time) / n_run
+    #################################################################
+    # Cached profile and backend
+    #################################################################
+    start_time = time.perf_counter()
+    for i in range(n_run):
+        profile = get_profile()
+        backend = get_backend(profile, hw_demod = True, init_time = 60 * ns)
+        executor = get_executor(backend)
+    cached_time = (time.perf_counter() - start_time) / n_run
+    print(startup_report())
+    print(f"Startup per run : {fresh_time * 1e3:.3f} ms (fresh), {cached_time * 1e3:.3f} ms (cached)")
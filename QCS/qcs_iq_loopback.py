@@ -1,6 +1,10 @@
 """Baseband IQ modulation and demodulation example using Keysight QCS."""
 import keysight.qcs as qcs
 import numpy as np
+
+from qcs_report import IQReporter
+from qcs_result_writer import ResultSink, stream_batches
+from qcs_sweep_planner import SweepAxis, SweepPlanner, max_points_for
 #################################################################
 # Basic constants for convenience
 #################################################################
@@ -31,6 +35,9 @@ lo_freq         = 1.126 * GHz
 rf_freq         = 1.371 * GHz
 digitizer_range = 1.7
 duration        = 800 * ns
+# Sweep points of one execution, as many as IQ results (complex128 per
+# shot) fit in host memory. Whole sweep is one execution unless it is larger.
+max_points      = max_points_for(n_shots * 16)
 ##################################################################
 # Declare saclar vairable which can be sweeped
 ##################################################################
@@ -47,7 +54,6 @@ iq_phase        = qcs.Scalar(
 #################################################################
 # Program & Mapper Definition
 #################################################################
-program         = qcs.Program()
 mapper          = qcs.ChannelMapper()
 ##################################################################
 # Create the waveform for the M5300 AWG, and integration filter
@@ -117,39 +123,40 @@ dig_phys_channels[1].settings.range.value = digitizer_range
 dig_phys_channels[2].settings.range.value = digitizer_range
 dig_phys_channels[3].settings.range.value = digitizer_range
 ##################################################################
-# Program Sequence
-##################################################################
-program.add_waveform(
-    gauss_awg,
-    awgs[3]
-)
-program.add_acquisition(
-    gauss_dig,
-    digs[3],
-    pre_delay=20 * ns
-)
-##################################################################
-# Set the number of shots
+# Program Sequence, built again for every sweep batch
 ##################################################################
-program.n_shots(n_shots)
+def build_program() -> qcs.Program:
+    program = qcs.Program()
+    program.add_waveform(
+        gauss_awg,
+        awgs[3]
+    )
+    program.add_acquisition(
+        gauss_dig,
+        digs[3],
+        pre_delay=20 * ns
+    )
+    # Set the number of shots
+    program.n_shots(n_shots)
+    return program
 ##################################################################
 # Variable for sweep
 ##################################################################
-iq_sweep_amps = qcs.Array(
-    name = "iq_sweep_amps",
-    value = [(i+1.0)/5.0 for i in range(5)]
-)
-iq_sweep_phases = qcs.Array(
-    name = "iq_sweep_phases",
-    value = [i * np.pi/4 for i in range(8)]
-)
+iq_sweep_amps   = [(i+1.0)/5.0 for i in range(5)]
+iq_sweep_phases = [i * np.pi/4 for i in range(8)]
 ##################################################################
-# Sweep the qcs.Scalar variable with qcs.Array variable
+# Sweep the qcs.Scalar variable in batches of at most max_points points
 ##################################################################
-program.sweep(iq_sweep_amps, iq_amp)
-program.sweep(iq_sweep_phases, iq_phase)
+planner         = SweepPlanner(
+    [
+        SweepAxis(iq_amp, iq_sweep_amps),
+        SweepAxis(iq_phase, iq_sweep_phases)
+    ],
+    max_points  = max_points
+)
 
-if run_on_hw:
+# Guard with __main__ since the report process imports this module on Windows
+if run_on_hw and __name__ == "__main__":
     backend = qcs.HclBackend(
         channel_mapper      =mapper,
         # Demodulate singnal to IQ data on FPGA. So we cannot
@@ -159,10 +166,15 @@ if run_on_hw:
         init_time           =0.001,
         reset_phase_every_shot=True
     )
-    program_executed    = qcs.Executor(backend).execute(program)
-    program_executed.to_hdf5("qcs_IQ_test.hdf5")
-    html_str            = program_executed.plot_iq().to_html()
+    executor            = qcs.Executor(backend)
+    # IQ density plot of every batch is sent to background process as the
+    # batch is written, so that next batch is executed while it is rendered.
+    # The report is finished at interpreter exit.
     file_name           = "plot_iq.html"
-    with open(file_name, 'w', encoding='utf-8') as f:
-        f.write(html_str)
-    print(f"HTML content successfully saved to {file_name}")
+    reporter            = IQReporter()
+    with ResultSink("qcs_IQ_test.hdf5") as sink:
+        stream_batches(
+            sink, planner.batches(), build_program, executor.execute,
+            on_batch = lambda batch, points: reporter.submit_points(points, file_name)
+        )
+    print(f"HTML content is being saved to {file_name}")
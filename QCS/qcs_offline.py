@@ -0,0 +1,778 @@
+"""Offline stand-in for keysight.qcs to build, run, and profile programs without the chassis"""
+import sys
+import copy
+import enum
+import time
+import types
+import itertools
+import numpy as np
+import h5py
+from typing import Any, Dict, Iterator, List, Optional, Sequence, Tuple, Union
+#################################################################
+# Stand-in covers the part of keysight.qcs used by the QCS scripts
+# (Program, ChannelMapper, HclBackend, Executor, waveforms, sweeps).
+# Each digitizer channel sees AWG channels with the same port
+# (loopback), and results are written with the program.to_hdf5 layout
+#   DutChannel_<port>_Acquisition_<k>/trace   hw_demod = False
+#   DutChannel_<port>_Acquisition_<k>/iq      hw_demod = True, or RF
+#                                             integration filter
+#################################################################
+SAMPLE_RATE     = 4.8e9         # M5200 digitizer sample rate [Sa/s]
+timings: Dict[str, List[float]] = {}
+# WaveformCache used by backends created without waveform_cache
+waveform_cache  = None
+
+def _record(
+    name: str,
+    start: float
+) -> None:
+    timings.setdefault(name, []).append(time.perf_counter() - start)
+
+def reset_timings() -> None:
+    timings.clear()
+#################################################################
+# Variables
+#################################################################
+class _Arith:
+    """
+    Arithmetic on variables is kept symbolic and evaluated per sweep point
+    """
+    def __add__(self, other):       return _Expr(np.add, self, other)
+    def __radd__(self, other):      return _Expr(np.add, other, self)
+    def __sub__(self, other):       return _Expr(np.subtract, self, other)
+    def __rsub__(self, other):      return _Expr(np.subtract, other, self)
+    def __mul__(self, other):       return _Expr(np.multiply, self, other)
+    def __rmul__(self, other):      return _Expr(np.multiply, other, self)
+    def __truediv__(self, other):   return _Expr(np.divide, self, other)
+    def __neg__(self):              return _Expr(np.multiply, -1.0, self)
+
+class _Expr(_Arith):
+    def __init__(self, op, a, b):
+        self.op = op
+        self.a  = a
+        self.b  = b
+
+    def evaluate(self, env: Dict[str, Any]) -> float:
+        return float(self.op(_resolve(self.a, env), _resolve(self.b, env)))
+
+    def __repr__(self) -> str:
+        return f"{self.op.__name__}({self.a!r}, {self.b!r})"
+
+class Scalar(_Arith):
+    def __init__(
+        self,
+        name: str,
+        value: Any = None,
+        dtype: type = float
+    ):
+        self.name   = name
+        self.value  = value
+        self.dtype  = dtype
+
+    def evaluate(self, env: Dict[str, Any]) -> Any:
+        return env.get(self.name, self.value)
+
+    def __repr__(self) -> str:
+        return f"Scalar({self.name}, {self.value})"
+
+class Array:
+    def __init__(
+        self,
+        name: str,
+        value: Sequence[Any],
+        dtype: Optional[type] = None
+    ):
+        self.name   = name
+        self.value  = list(value)
+        self.dtype  = dtype
+
+    def __len__(self) -> int:
+        return len(self.value)
+
+    def __repr__(self) -> str:
+        return f"Array({self.name}, {len(self.value)} values)"
+
+def _resolve(
+    x: Any,
+    env: Dict[str, Any]
+) -> Any:
+    return x.evaluate(env) if isinstance(x, _Arith) else x
+#################################################################
+# Channels and mapper
+#################################################################
+class InstrumentEnum(enum.Enum):
+    M5300AWG        = 1
+    M5301AWG        = 2
+    M5200Digitizer  = 3
+    M5201DCM        = 4
+
+class Address(tuple):
+    def __new__(cls, chassis: int, slot: int, channel: int):
+        return tuple.__new__(cls, (chassis, slot, channel))
+
+class Channels:
+    def __init__(
+        self,
+        labels: Sequence[int],
+        name: str,
+        absolute_phase: bool = False
+    ):
+        self.labels         = list(labels)
+        self.name           = name
+        self.absolute_phase = absolute_phase
+
+    def __getitem__(self, idx) -> "Channels":
+        labels = self.labels[idx]
+        return Channels(labels if isinstance(labels, list) else [labels], self.name, self.absolute_phase)
+
+    def __len__(self) -> int:
+        return len(self.labels)
+
+    def __repr__(self) -> str:
+        return f"Channels({self.name}, {self.labels})"
+
+class _Setting:
+    def __init__(self, value: Any = None):
+        self.value = value
+
+class _PhysicalChannel:
+    def __init__(
+        self,
+        address: Tuple[int, int, int],
+        instrument: InstrumentEnum
+    ):
+        self.address    = address
+        self.instrument = instrument
+        self.settings   = types.SimpleNamespace(
+            range           = _Setting(0.9),
+            lo_frequency    = _Setting(None),
+            delay           = _Setting(0.0),
+        )
+
+def _addresses(
+    addresses: Any
+) -> List[Tuple[int, int, int]]:
+    """
+    Single (chassis, slot, channel) or list of them
+    """
+    if len(addresses) == 3 and all(isinstance(a, (int, np.integer)) for a in addresses):
+        addresses = [addresses]
+    return [tuple(int(v) for v in a) for a in addresses]
+
+class ChannelMapper:
+    def __init__(
+        self,
+        ip_address: Optional[str] = None
+    ):
+        self.ip_address     = ip_address
+        self.physical: Dict[Tuple[int, int, int], _PhysicalChannel] = {}
+        self.downconverters: Dict[Tuple[int, int, int], Tuple[int, int, int]] = {}
+        self.lo_frequencies: Dict[Tuple[int, int, int], float] = {}
+        self._virtual: Dict[Tuple[str, int], Tuple[int, int, int]] = {}
+
+    def add_channel_mapping(
+        self,
+        channels: Channels,
+        addresses: Sequence[Any],
+        instrument_types: Union[InstrumentEnum, Sequence[InstrumentEnum]]
+    ) -> None:
+        addresses = _addresses(addresses)
+        if len(addresses) != len(channels):
+            raise ValueError(f"{len(channels)} channels are mapped to {len(addresses)} addresses")
+        if isinstance(instrument_types, InstrumentEnum):
+            instrument_types = [instrument_types] * len(addresses)
+        for label, address, instrument in zip(channels.labels, addresses, instrument_types):
+            self._virtual[(channels.name, label)] = address
+            self.physical.setdefault(address, _PhysicalChannel(address, instrument))
+
+    def set_lo_frequencies(
+        self,
+        addresses: Sequence[Any],
+        lo_frequency: float
+    ) -> None:
+        for address in _addresses(addresses):
+            self.lo_frequencies[address] = lo_frequency
+            if address in self.physical:
+                self.physical[address].settings.lo_frequency.value = lo_frequency
+
+    def add_downconverters(
+        self,
+        dig_addresses: Sequence[Any],
+        downcon_addresses: Sequence[Any]
+    ) -> None:
+        for dig, dcm in zip(_addresses(dig_addresses), _addresses(downcon_addresses)):
+            self.downconverters[dig] = dcm
+
+    def get_physical_channels(
+        self,
+        channels: Channels
+    ) -> List[_PhysicalChannel]:
+        return [self.physical[self.address(channels.name, label)] for label in channels.labels]
+
+    def address(
+        self,
+        name: str,
+        label: int
+    ) -> Tuple[int, int, int]:
+        try:
+            return self._virtual[(name, label)]
+        except KeyError:
+            raise KeyError(f"Channel {name}[{label}] is not mapped") from None
+
+    def downconversion_lo(
+        self,
+        dig_address: Tuple[int, int, int]
+    ) -> float:
+        dcm = self.downconverters.get(dig_address)
+        if dcm is None:
+            return 0.0
+        return self.lo_frequencies.get(dcm) or 0.0
+#################################################################
+# Envelopes and waveforms
+#################################################################
+class ConstantEnvelope:
+    def sample(self, x: np.ndarray) -> np.ndarray:
+        return np.ones_like(x)
+
+    def __repr__(self) -> str:
+        return "ConstantEnvelope()"
+
+class GaussianEnvelope:
+    def __init__(self, num_sigma: float = 2.0):
+        self.num_sigma = num_sigma
+
+    def sample(self, x: np.ndarray) -> np.ndarray:
+        return np.exp(-0.5 * ((x - 0.5) * 2 * self.num_sigma) ** 2)
+
+    def __repr__(self) -> str:
+        return f"GaussianEnvelope({self.num_sigma})"
+
+class ArbitraryEnvelope:
+    def __init__(self, times: Sequence[float], amplitudes: Sequence[float]):
+        self.times      = list(times)
+        self.amplitudes = list(amplitudes)
+
+    def sample(self, x: np.ndarray) -> np.ndarray:
+        return np.interp(x, self.times, self.amplitudes)
+
+    def __repr__(self) -> str:
+        return f"ArbitraryEnvelope({self.times}, {self.amplitudes})"
+
+class _Waveform:
+    """
+    Base of waveforms. a + b plays b right after a.
+    """
+    duration: Any = 0.0
+
+    def __add__(self, other: "_Waveform") -> "_Sequence":
+        return _Sequence([self, other])
+
+    def parts(self) -> List["_Waveform"]:
+        return [self]
+
+    def sample(
+        self,
+        t: np.ndarray,
+        start: float,
+        env: Dict[str, Any],
+        lo_frequency: float = 0.0,
+        phase_ref: float = 0.0
+    ) -> np.ndarray:
+        return np.zeros_like(t)
+
+class _Sequence(_Waveform):
+    def __init__(self, waveforms: List[_Waveform]):
+        self.waveforms = [p for w in waveforms for p in w.parts()]
+
+    @property
+    def duration(self) -> Any:
+        return sum(w.duration for w in self.waveforms)
+
+    def parts(self) -> List[_Waveform]:
+        return list(self.waveforms)
+
+    def __repr__(self) -> str:
+        return " + ".join(repr(w) for w in self.waveforms)
+
+class Delay(_Waveform):
+    def __init__(self, duration: Any, name: Optional[str] = None):
+        self.duration   = duration
+        self.name       = name
+
+    def __repr__(self) -> str:
+        return f"Delay({self.duration!r})"
+
+class DCWaveform(_Waveform):
+    def __init__(
+        self,
+        duration: Any,
+        envelope: Any,
+        amplitude: Any,
+        name: Optional[str] = None
+    ):
+        self.duration   = duration
+        self.envelope   = envelope
+        self.amplitude  = amplitude
+        self.name       = name
+
+    def sample(self, t, start, env, lo_frequency = 0.0, phase_ref = 0.0):
+        duration = _resolve(self.duration, env)
+        x = (t - start) / duration
+        inside = (x >= 0) & (x < 1)
+        out = np.zeros_like(t)
+        out[inside] = _resolve(self.amplitude, env) * self.envelope.sample(x[inside])
+        return out
+
+    def __repr__(self) -> str:
+        return f"DCWaveform({self.duration!r}, {self.envelope!r}, {self.amplitude!r})"
+
+class RFWaveform(_Waveform):
+    def __init__(
+        self,
+        duration: Any,
+        envelope: Any,
+        amplitude: Any,
+        rf_frequency: Any,
+        instantaneous_phase: Any = 0.0,
+        post_phase: Any = None,
+        name: Optional[str] = None
+    ):
+        self.duration               = duration
+        self.envelope               = envelope
+        self.amplitude              = amplitude
+        self.rf_frequency           = rf_frequency
+        self.instantaneous_phase    = instantaneous_phase
+        self.post_phase             = post_phase
+        self.name                   = name
+
+    def sample(self, t, start, env, lo_frequency = 0.0, phase_ref = 0.0):
+        """
+        Signal seen after downconversion with lo_frequency
+        """
+        duration = _resolve(self.duration, env)
+        x = (t - start) / duration
+        inside = (x >= 0) & (x < 1)
+        freq = _resolve(self.rf_frequency, env) - lo_frequency
+        phase = 2 * np.pi * freq * (t[inside] - phase_ref) + _resolve(self.instantaneous_phase, env)
+        out = np.zeros_like(t)
+        out[inside] = _resolve(self.amplitude, env) * self.envelope.sample(x[inside]) * np.cos(phase)
+        return out
+
+    def __repr__(self) -> str:
+        return (
+            f"RFWaveform({self.duration!r}, {self.envelope!r}, {self.amplitude!r}, "
+            f"{self.rf_frequency!r}, {self.instantaneous_phase!r})"
+        )
+#################################################################
+# Program
+#################################################################
+class _Operation:
+    def __init__(self, kind: str, item: Any, channels: Channels, pre_delay: Any):
+        self.kind       = kind
+        self.item       = item
+        self.channels   = channels
+        self.pre_delay  = pre_delay
+
+class Program:
+    def __init__(
+        self,
+        name: str = ""
+    ):
+        self.name           = name
+        self.layers: List[List[_Operation]] = [[]]
+        self.sweeps: List[Tuple[List[Array], List[Scalar]]] = []
+        self.shots          = 1
+        self.results: Dict[str, np.ndarray] = {}
+        self.attrs: Dict[str, Any] = {}
+        self.accession_id   = None
+
+    def _add(self, kind, item, channels, pre_delay, new_layer) -> None:
+        if new_layer and self.layers[-1]:
+            self.layers.append([])
+        self.layers[-1].append(_Operation(kind, item, channels, pre_delay))
+
+    def add_waveform(
+        self,
+        pulse: _Waveform,
+        channels: Channels,
+        pre_delay: Any = None,
+        new_layer: bool = False
+    ) -> None:
+        self._add("waveform", pulse, channels, pre_delay, new_layer)
+
+    def add_acquisition(
+        self,
+        integration_filter: Any,
+        channels: Channels,
+        pre_delay: Any = None,
+        new_layer: bool = False
+    ) -> None:
+        self._add("acquisition", integration_filter, channels, pre_delay, new_layer)
+
+    def n_shots(
+        self,
+        n_shots: int
+    ) -> None:
+        self.shots = int(n_shots)
+
+    def sweep(
+        self,
+        arrays: Union[Array, Sequence[Array]],
+        scalars: Union[Scalar, Sequence[Scalar]]
+    ) -> None:
+        """
+        Sweep scalars with arrays. Several arrays in one call are swept
+        together, and each call adds an inner sweep.
+        """
+        arrays = list(arrays) if isinstance(arrays, (list, tuple)) else [arrays]
+        scalars = list(scalars) if isinstance(scalars, (list, tuple)) else [scalars]
+        if len(arrays) != len(scalars) or len({len(a) for a in arrays}) != 1:
+            raise ValueError("Arrays and scalars of a sweep should match")
+        self.sweeps.append((arrays, scalars))
+
+    @property
+    def sweep_shape(self) -> Tuple[int, ...]:
+        return tuple(len(arrays[0]) for arrays, _ in self.sweeps)
+
+    def sweep_points(self) -> Iterator[Dict[str, Any]]:
+        """
+        {scalar name : value} of each sweep point, outermost sweep first
+        """
+        for index in itertools.product(*[range(n) for n in self.sweep_shape]):
+            env = {}
+            for i, (arrays, scalars) in zip(index, self.sweeps):
+                for array, scalar in zip(arrays, scalars):
+                    env[scalar.name] = array.value[i]
+            yield env
+
+    def to_hdf5(
+        self,
+        path: str
+    ) -> None:
+        start = time.perf_counter()
+        with h5py.File(path, "w") as f:
+            for name, value in self.results.items():
+                f.create_dataset(name, data = value)
+            for key, value in self.attrs.items():
+                f.attrs[key] = value
+        _record("to_hdf5", start)
+
+    def _per_point(
+        self,
+        kind: str,
+        avg: bool
+    ) -> Dict[str, np.ndarray]:
+        """
+        {"DutChannel_<port>_Acquisition_<k>" : (n_points, n_shots[, n_samples])}
+        """
+        shape = np.ravel(self.attrs.get("Shape", [1, 1, -1]))
+        n_points, n_shots = int(np.prod(shape[:-2])), int(shape[-2])
+        out = {}
+        for name, value in self.results.items():
+            group, _, suffix = name.rpartition("/")
+            if suffix != kind:
+                continue
+            # IQ has all shots, traces have max_trace_shots (n_shots of Shape)
+            value = np.asarray(value).reshape((n_points, -1) if kind == "iq" else (n_points, n_shots, -1))
+            out[group] = value.mean(axis = 1) if avg else value
+        return out
+
+    def get_trace(
+        self,
+        channels: Optional[Channels] = None,
+        avg: bool = False
+    ) -> Dict[str, np.ndarray]:
+        """
+        Acquired traces of all digitizer channels (channels is not supported offline)
+        """
+        start = time.perf_counter()
+        if channels is not None:
+            raise NotImplementedError("Offline results are returned for all channels")
+        out = self._per_point("trace", avg)
+        _record("get_results", start)
+        return out
+
+    def get_iq(
+        self,
+        channels: Optional[Channels] = None,
+        avg: bool = False
+    ) -> Dict[str, np.ndarray]:
+        """
+        Acquired IQ of all digitizer channels (channels is not supported offline)
+        """
+        start = time.perf_counter()
+        if channels is not None:
+            raise NotImplementedError("Offline results are returned for all channels")
+        out = self._per_point("iq", avg)
+        _record("get_results", start)
+        return out
+
+    def plot_iq(self) -> "_IQFigure":
+        return _IQFigure({k: v for k, v in self.results.items() if np.iscomplexobj(v)}, self.name)
+
+class _IQFigure:
+    def __init__(self, iq: Dict[str, np.ndarray], title: str):
+        self.iq     = iq
+        self.title  = title
+
+    def to_html(self) -> str:
+        from qcs_report import iq_report_html
+        return iq_report_html(self.iq, title = self.title)
+#################################################################
+# Backend
+#################################################################
+_history: List[Dict[str, Any]] = []
+_states: Dict[int, str] = {}
+_accession_ids = itertools.count(1)
+
+class HclBackend:
+    """
+    Offline backend. Options of the real backend are accepted and stored.
+    noise_rms       : white noise on digitizer samples [V]
+    max_trace_shots : traces of at most this many shots are stored per
+                      sweep point (hw_demod = False), to bound memory
+    emulate_runtime : sleep for the duration the chassis would run the
+                      program, so that it can be aborted meanwhile
+    waveform_cache  : WaveformCache (qcs_waveform_cache.py) for samples of
+                      waveforms whose parameters are not swept
+    """
+    def __init__(
+        self,
+        channel_mapper: Optional[ChannelMapper] = None,
+        hw_demod: bool = False,
+        init_time: float = 0.0,
+        reset_phase_every_shot: bool = False,
+        noise_rms: float = 0.01,
+        max_trace_shots: int = 100,
+        emulate_runtime: bool = False,
+        waveform_cache: Any = None,
+        seed: Optional[int] = None,
+        **kwargs
+    ):
+        self.channel_mapper         = channel_mapper or ChannelMapper()
+        self.hw_demod               = hw_demod
+        self.init_time              = init_time
+        self.reset_phase_every_shot = reset_phase_every_shot
+        self.noise_rms              = noise_rms
+        self.max_trace_shots        = max_trace_shots
+        self.emulate_runtime        = emulate_runtime
+        self.waveform_cache         = waveform_cache if waveform_cache is not None else globals()["waveform_cache"]
+        self.options                = kwargs
+        self._rng                   = np.random.default_rng(seed)
+
+    def is_system_ready(self) -> bool:
+        return True
+
+    def get_program_execution_history(self) -> List[Dict[str, Any]]:
+        return [dict(h) for h in _history]
+
+    def get_program_state(
+        self,
+        accession_id: int
+    ) -> str:
+        return _states.get(accession_id, "Unknown")
+
+    def abort_program(
+        self,
+        accession_id: int
+    ) -> None:
+        if _states.get(accession_id) == "Running":
+            _states[accession_id] = "Aborted"
+
+    def _schedule(
+        self,
+        program: Program,
+        env: Dict[str, Any]
+    ) -> Tuple[List[Tuple], List[Tuple], float]:
+        """
+        Start time of every operation of one sweep point. Layers start
+        together, and operations on a channel are played one after another.
+        """
+        mapper = self.channel_mapper
+        waveforms, acquisitions = [], []
+        layer_start = 0.0
+        for layer in program.layers:
+            cursor: Dict[Tuple[int, int, int], float] = {}
+            layer_end = layer_start
+            for op in layer:
+                pre_delay = _resolve(op.pre_delay, env) or 0.0
+                for label in op.channels.labels:
+                    address = mapper.address(op.channels.name, label)
+                    start = cursor.get(address, layer_start) + pre_delay
+                    if op.kind == "waveform":
+                        duration = _resolve(op.item.duration, env)
+                        waveforms.append((address, start, op.item, op.channels.absolute_phase))
+                    else:
+                        duration = _resolve(getattr(op.item, "duration", op.item), env)
+                        acquisitions.append((address, start, duration, op.item, op.channels.absolute_phase))
+                    cursor[address] = start + duration
+                    layer_end = max(layer_end, start + duration)
+            layer_start = layer_end
+        return waveforms, acquisitions, layer_start
+
+    def _synthesize(
+        self,
+        waveforms: List[Tuple],
+        acquisition: Tuple,
+        env: Dict[str, Any]
+    ) -> Tuple[np.ndarray, np.ndarray]:
+        """
+        Noiseless loopback trace of one acquisition and its sample times
+        """
+        dig, start, duration, _, _ = acquisition
+        lo_frequency = self.channel_mapper.downconversion_lo(dig)
+        t = start + np.arange(int(round(duration * SAMPLE_RATE))) / SAMPLE_RATE
+        trace = np.zeros_like(t)
+        for awg, wf_start, waveform, absolute_phase in waveforms:
+            if awg[2] != dig[2]:
+                continue
+            offset = wf_start
+            for part in waveform.parts():
+                part_duration = _resolve(part.duration, env)
+                if offset < start + duration and offset + part_duration > start:
+                    samples = None
+                    if self.waveform_cache is not None and not absolute_phase and _is_static(part):
+                        samples = self.waveform_cache.get_or_none(part, lo_frequency)
+                    if samples is None:
+                        trace += part.sample(t, offset, env, lo_frequency, 0.0 if absolute_phase else offset)
+                    else:
+                        i0 = int(round((offset - start) * SAMPLE_RATE))
+                        lo, hi = max(i0, 0), min(i0 + len(samples), t.size)
+                        trace[lo:hi] += samples[lo - i0:hi - i0]
+                offset += part_duration
+        return t, trace
+
+    def _demodulate(
+        self,
+        t: np.ndarray,
+        trace: np.ndarray,
+        acquisition: Tuple,
+        env: Dict[str, Any]
+    ) -> complex:
+        dig, start, duration, integration_filter, absolute_phase = acquisition
+        if isinstance(integration_filter, RFWaveform):
+            lo_frequency = self.channel_mapper.downconversion_lo(dig)
+            weight = integration_filter.envelope.sample((t - start) / duration)
+            freq = _resolve(integration_filter.rf_frequency, env) - lo_frequency
+            ref = 0.0 if absolute_phase else start
+            phase = 2 * np.pi * freq * (t - ref) + _resolve(integration_filter.instantaneous_phase, env)
+            kernel = weight * np.exp(-1j * phase)
+            return complex(2 * np.dot(trace, kernel) / max(np.dot(weight, weight), 1e-30))
+        return complex(trace.mean()) if trace.size else 0j
+
+    def run(
+        self,
+        program: Program
+    ) -> Program:
+        """
+        Execute program offline and return a copy of it with results
+        """
+        accession_id = next(_accession_ids)
+        _history.insert(0, {"accession_id": accession_id, "name": program.name, "start_time": time.time()})
+        _states[accession_id] = "Running"
+
+        start = time.perf_counter()
+        points = list(program.sweep_points())
+        schedules = [self._schedule(program, env) for env in points]
+        _record("compile", start)
+
+        start = time.perf_counter()
+        n_shots = program.shots
+        n_trace_shots = min(n_shots, self.max_trace_shots)
+        results: Dict[str, List[np.ndarray]] = {}
+        for env, (waveforms, acquisitions, _) in zip(points, schedules):
+            counts: Dict[Tuple[int, int, int], int] = {}
+            for acquisition in acquisitions:
+                dig = acquisition[0]
+                k = counts.get(dig, 0)
+                counts[dig] = k + 1
+                group = f"DutChannel_{dig[2]}_Acquisition_{k}"
+                t, trace = self._synthesize(waveforms, acquisition, env)
+                # IQ is available with RF integration filter, traces only without hw_demod
+                if self.hw_demod or isinstance(acquisition[3], RFWaveform):
+                    iq = self._demodulate(t, trace, acquisition, env)
+                    scale = self.noise_rms * np.sqrt(2.0 / max(t.size, 1))
+                    noise = self._rng.normal(0, scale, (n_shots, 2))
+                    results.setdefault(f"{group}/iq", []).append(iq + noise[:, 0] + 1j * noise[:, 1])
+                if not self.hw_demod:
+                    shots = trace + self._rng.normal(0, self.noise_rms, (n_trace_shots, trace.size))
+                    results.setdefault(f"{group}/trace", []).append(shots.ravel())
+        _record("synthesize", start)
+
+        if self.emulate_runtime:
+            shot_time = max((s[2] for s in schedules), default = 0.0) + self.init_time
+            end_time = time.monotonic() + shot_time * n_shots * len(points)
+            while time.monotonic() < end_time and _states[accession_id] == "Running":
+                time.sleep(min(0.01, max(end_time - time.monotonic(), 0)))
+        if _states[accession_id] == "Running":
+            _states[accession_id] = "Finished"
+
+        executed = copy.copy(program)
+        executed.accession_id = accession_id
+        executed.results = {
+            name: np.stack(values) if name.endswith("/iq") else np.concatenate(values)
+            for name, values in results.items()
+        }
+        stored_shots = n_shots if self.hw_demod else n_trace_shots
+        executed.attrs = {
+            "Shape"                 : np.array([list(program.sweep_shape or (1,)) + [stored_shots, -1]], dtype = np.int32),
+            "Version"               : np.int32(1),
+            "FPGAPostprocessing"    : self.hw_demod,
+            "Offline"               : True,
+        }
+        return executed
+
+def _is_static(
+    waveform: _Waveform
+) -> bool:
+    """
+    True if no parameter of waveform is a variable
+    """
+    return not any(isinstance(v, _Arith) for v in vars(waveform).values())
+
+class Executor:
+    def __init__(
+        self,
+        backend: HclBackend
+    ):
+        self.backend = backend
+
+    def execute(
+        self,
+        program: Program
+    ) -> Program:
+        start = time.perf_counter()
+        executed = self.backend.run(program)
+        _record("execute", start)
+        return executed
+#################################################################
+# Install as keysight.qcs
+#################################################################
+_previous: Dict[str, Any] = {}
+
+def install() -> types.ModuleType:
+    """
+    Register this module as keysight.qcs, so that scripts doing
+    import keysight.qcs as qcs run offline without modification
+    """
+    module = sys.modules[__name__]
+    if not _previous:
+        _previous["keysight"] = sys.modules.get("keysight")
+        _previous["keysight.qcs"] = sys.modules.get("keysight.qcs")
+    package = _previous["keysight"] or types.ModuleType("keysight")
+    if not hasattr(package, "__path__"):
+        package.__path__ = []
+    package.qcs = module
+    sys.modules["keysight"] = package
+    sys.modules["keysight.qcs"] = module
+    return module
+
+def uninstall() -> None:
+    for name in ("keysight", "keysight.qcs"):
+        if _previous.get(name) is None:
+            sys.modules.pop(name, None)
+        else:
+            sys.modules[name] = _previous[name]
+    if _previous.get("keysight") is not None and _previous.get("keysight.qcs") is not None:
+        _previous["keysight"].qcs = _previous["keysight.qcs"]
+    _previous.clear()
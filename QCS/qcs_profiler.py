@@ -0,0 +1,253 @@
+"""Phase profiler for QCS executions with Chrome trace timeline output"""
+import json
+import time
+import threading
+import contextlib
+from typing import Any, Callable, Dict, Iterator, List, Optional, Tuple
+#################################################################
+# Timeline
+#################################################################
+class Timeline:
+    """
+    Spans recorded in Chrome trace event format. Saved file can be opened
+    with chrome://tracing or https://ui.perfetto.dev.
+    Each track (e.g. one execution label) is shown as one thread.
+    """
+    def __init__(self):
+        self.events: List[Dict[str, Any]] = []
+        self._t0        = time.perf_counter()
+        self._tracks    = {}
+        self._lock      = threading.Lock()
+
+    def _tid(
+        self,
+        track: str
+    ) -> int:
+        if track not in self._tracks:
+            self._tracks[track] = len(self._tracks) + 1
+            self.events.append({
+                "name": "thread_name", "ph": "M", "pid": 1,
+                "tid": self._tracks[track], "args": {"name": track},
+            })
+        return self._tracks[track]
+
+    def add(
+        self,
+        name: str,
+        start: float,
+        end: float,
+        track: str = "main",
+        **args
+    ) -> None:
+        """
+        Add span between perf_counter times start and end
+        """
+        with self._lock:
+            self.events.append({
+                "name"  : name,
+                "cat"   : "qcs",
+                "ph"    : "X",
+                "ts"    : (start - self._t0) * 1e6,
+                "dur"   : max(end - start, 0.0) * 1e6,
+                "pid"   : 1,
+                "tid"   : self._tid(track),
+                "args"  : args,
+            })
+
+    @contextlib.contextmanager
+    def span(
+        self,
+        name: str,
+        track: str = "main",
+        **args
+    ) -> Iterator[None]:
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.add(name, start, time.perf_counter(), track, **args)
+
+    def to_chrome(self) -> Dict[str, Any]:
+        return {"traceEvents": list(self.events), "displayTimeUnit": "ms"}
+
+    def save(
+        self,
+        path: str
+    ) -> None:
+        with open(path, "w", encoding = "utf-8") as f:
+            json.dump(self.to_chrome(), f)
+#################################################################
+# Execution profiler
+#################################################################
+class ExecutionProfiler:
+    """
+    Split Executor.execute into phases by polling state of the program
+    while it is executed
+        compile+upload  : execute() call until program is seen Running
+        shots           : Running until program is finished
+        download+result : program finished until execute() returns
+        fetch           : optional fetch(program), e.g. program.to_hdf5
+    keysight.qcs exposes only execute() and the program state (Running or
+    not), so compile and upload, and download and construction of the
+    result program, happen inside execute() with no state change between
+    them and are reported merged. They can be split only with hooks
+    {phase name : (object, method name)}, which record every call of the
+    method as a span on "<label> hooks" track, for backends whose internal
+    steps are known (see offline_hooks).
+    State is polled with monitor, a separate backend object (a dummy
+    mapper is enough, as in qcs_abort_code.py), so that the executing
+    backend is never called from the polling thread. Accession id of the
+    program is resolved once from the execution history, after which only
+    get_program_state is polled every poll_interval_s. Phases which are
+    shorter than poll_interval_s may not be seen, then whole execute() is
+    recorded as one "execute" span.
+    """
+    def __init__(
+        self,
+        monitor: Any = None,
+        poll_interval_s: float = 0.05,
+        timeline: Optional[Timeline] = None
+    ):
+        if monitor is None:
+            import keysight.qcs as qcs
+            monitor = qcs.HclBackend(qcs.ChannelMapper())
+        self.monitor            = monitor
+        self.poll_interval_s    = poll_interval_s
+        self.timeline           = timeline or Timeline()
+        self.runs: List[Dict[str, Any]] = []
+
+    def _latest_id(self) -> Optional[Any]:
+        history = self.monitor.get_program_execution_history()
+        return history[0]["accession_id"] if history else None
+
+    def _poll(
+        self,
+        before_id: Any,
+        stop: threading.Event,
+        marks: Dict[str, float]
+    ) -> None:
+        acc_id = None
+        while not stop.is_set():
+            if acc_id is None:
+                acc_id = self._latest_id()
+                if acc_id == before_id:
+                    acc_id = None
+            if acc_id is not None:
+                state = self.monitor.get_program_state(acc_id)
+                now = time.perf_counter()
+                if state == "Running":
+                    marks.setdefault("running", now)
+                elif "running" in marks:
+                    marks["finished"] = now
+                    marks["state"] = state
+                    return
+            stop.wait(self.poll_interval_s)
+
+    @contextlib.contextmanager
+    def _hooked(
+        self,
+        hooks: Dict[str, Tuple[Any, str]],
+        track: str
+    ) -> Iterator[None]:
+        originals = []
+        for phase, (obj, attr) in hooks.items():
+            method = getattr(obj, attr)
+
+            def wrapped(*args, _method = method, _phase = phase, **kwargs):
+                with self.timeline.span(_phase, track):
+                    return _method(*args, **kwargs)
+
+            originals.append((obj, attr, vars(obj).get(attr)))
+            setattr(obj, attr, wrapped)
+        try:
+            yield
+        finally:
+            for obj, attr, original in originals:
+                if original is not None:
+                    setattr(obj, attr, original)
+                else:
+                    delattr(obj, attr)
+
+    def execute(
+        self,
+        executor: Any,
+        program: Any,
+        label: str = "execute",
+        n_shots: Optional[int] = None,
+        fetch: Optional[Callable[[Any], Any]] = None,
+        hooks: Optional[Dict[str, Tuple[Any, str]]] = None
+    ) -> Any:
+        """
+        executor.execute(program) with phases recorded on track label.
+        n_shots is total number of shots (all sweep points) for shots/s.
+        """
+        before_id = self._latest_id()
+        marks: Dict[str, float] = {}
+        stop = threading.Event()
+        poller = threading.Thread(target = self._poll, args = (before_id, stop, marks), daemon = True)
+        poller.start()
+        start = time.perf_counter()
+        try:
+            with self._hooked(hooks or {}, f"{label} hooks"):
+                executed = executor.execute(program)
+        finally:
+            end = time.perf_counter()
+            stop.set()
+            poller.join()
+
+        phases = {}
+        if "running" in marks and "finished" not in marks:
+            # Finished between last poll and return of execute()
+            marks["finished"] = end
+        if "running" in marks:
+            phases["compile+upload"] = (start, marks["running"])
+            phases["shots"] = (marks["running"], marks["finished"])
+            phases["download+result"] = (marks["finished"], end)
+        else:
+            phases["execute"] = (start, end)
+        if fetch is not None:
+            fetch_start = time.perf_counter()
+            fetch(executed)
+            phases["fetch"] = (fetch_start, time.perf_counter())
+        for phase, (t0, t1) in phases.items():
+            self.timeline.add(phase, t0, t1, label)
+
+        run = {
+            "label"     : label,
+            "total_s"   : end - start,
+            "phases"    : {phase: t1 - t0 for phase, (t0, t1) in phases.items()},
+            "n_shots"   : n_shots,
+        }
+        shot_time = run["phases"].get("shots", run["total_s"])
+        run["shots_per_s"] = n_shots / shot_time if n_shots and shot_time > 0 else None
+        run["limiting"] = max(run["phases"], key = run["phases"].get)
+        self.runs.append(run)
+        return executed
+
+    def summary(self) -> str:
+        lines = []
+        for run in self.runs:
+            phases = ", ".join(f"{k} {v * 1e3:.1f} ms" for k, v in run["phases"].items())
+            rate = f", {run['shots_per_s']:.0f} shots/s" if run["shots_per_s"] else ""
+            lines.append(
+                f"{run['label']} : total {run['total_s'] * 1e3:.1f} ms ({phases}){rate}, "
+                f"limited by {run['limiting']}"
+            )
+        return "\n".join(lines)
+
+    def save(
+        self,
+        path: str
+    ) -> None:
+        self.timeline.save(path)
+
+def offline_hooks(
+    backend: Any
+) -> Dict[str, Tuple[Any, str]]:
+    """
+    Internal steps of the offline backend (qcs_offline.py)
+    """
+    return {
+        "compile"       : (backend, "_schedule"),
+        "synthesize"    : (backend, "_synthesize"),
+    }
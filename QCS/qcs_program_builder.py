@@ -0,0 +1,62 @@
+"""Repeated block construct for building long repetitive QCS programs"""
+import keysight.qcs as qcs
+from typing import Any, Iterator, Sequence, Tuple
+#################################################################
+# Repeated block
+#################################################################
+class RepeatedBlock:
+    """
+    N copies of segments on one channel, each copy followed by gap.
+    For example, qcs_repetitive.py pattern
+        program.add_waveform(seg, ch)  (for each seg)
+        for i in range(150):
+            program.add_waveform(qcs.Delay(63.333 * ns), ch, new_layer=True)
+            program.extend(program.layers[0])
+    is RepeatedBlock(segs, ch, n_repeat=151, gap=63.333 * ns).
+    The keysight.qcs API used here has no repeat primitive, so apply() still
+    adds every copy, one operation each, to a single layer instead of one
+    new layer per copy.
+    """
+    def __init__(
+        self,
+        segments: Sequence[Any],
+        channel: Any,
+        n_repeat: int,
+        gap: float = 0.0
+    ):
+        if n_repeat < 1:
+            raise ValueError(f"n_repeat should be positive, got {n_repeat}")
+        self.segments   = list(segments)
+        self.channel    = channel
+        self.n_repeat   = int(n_repeat)
+        self.gap        = float(gap)
+
+    def operations(self) -> Iterator[Tuple[Any, Any]]:
+        """
+        Expand block into (waveform, channel) operations
+        """
+        delay = qcs.Delay(self.gap) if self.gap > 0 else None
+        for k in range(self.n_repeat):
+            if k and delay is not None:
+                yield delay, self.channel
+            for seg in self.segments:
+                yield seg, self.channel
+
+    def apply(
+        self,
+        program: qcs.Program,
+        new_layer: bool = False
+    ) -> qcs.Program:
+        """
+        Add block to program in a single layer. All copies share the same
+        segment objects and the same Delay object.
+        """
+        for k, (waveform, channel) in enumerate(self.operations()):
+            program.add_waveform(waveform, channel, new_layer = (new_layer and k == 0))
+        return program
+
+    def __repr__(self) -> str:
+        return (
+            f"RepeatedBlock({len(self.segments)} segments x {self.n_repeat}, "
+            f"gap={self.gap:.4e} s)"
+        )
@@ -1,10 +1,14 @@
 	"""2 hours waveform generation with M5301AWG"""
 	import keysight.qcs as qcs
+	from qcs_program_builder import RepeatedBlock
+	from qcs_watchdog import ProgramWatchdog
 	
 	n_shots         = 100000000 # ~1 min
 	ns              = 1e-9
 	V_max_M5301AWG  = 5
 	mV              = 1/(V_max_M5301AWG * 1000)
+	# Program is aborted if it runs longer than this (expected ~2 hours)
+	max_runtime_s   = 3 * 3600
 	
 	dc_awgs = qcs.Channels(
 	    range(4),
@@ -68,15 +72,14 @@
 	    amplitude = 0 * mV
 	)
 	
-	program.add_waveform(dc_segment1, dc_awgs[2])
-	program.add_waveform(dc_segment2, dc_awgs[2])
-	program.add_waveform(dc_segment3, dc_awgs[2])
-	program.add_waveform(dc_segment4, dc_awgs[2])
-	program.add_waveform(dc_segment5, dc_awgs[2])
-	
-	for i in range(150):
-	    program.add_waveform(qcs.Delay(63.333 * ns), dc_awgs[2], new_layer=True)
-	    program.extend(program.layers[0])
+	# 151 copies of the pattern, each shifted by 63.333 ns from the previous one
+	pattern = RepeatedBlock(
+	    segments = [dc_segment1, dc_segment2, dc_segment3, dc_segment4, dc_segment5],
+	    channel = dc_awgs[2],
+	    n_repeat = 151,
+	    gap = 63.333 * ns
+	)
+	pattern.apply(program)
 	
 	program.n_shots(n_shots)
 	backend = qcs.HclBackend(
@@ -84,5 +87,14 @@
 	    init_time=0,
 	    hw_demod=True
 	)
-	program_result = qcs.Executor(backend).execute(program)
-	print("Done - program is finished...")
+	# Watchdog polls with its own dummy backend, so that it does not call
+	# the executing backend from another thread
+	watchdog = ProgramWatchdog(poll_interval_s = 5.0, max_runtime_s = max_runtime_s)
+	watchdog.register_next(n_shots = n_shots)
+	with watchdog:
+	    program_result = qcs.Executor(backend).execute(program)
+	record = watchdog.records.get(watchdog.latest_id(refresh = True))
+	if record is not None and record.aborted:
+	    print(f"Aborted - {record.abort_reason}")
+	else:
+	    print("Done - program is finished...")
@@ -0,0 +1,269 @@
+"""Background IQ report rendering for QCS results"""
+import os
+import io
+import atexit
+import base64
+import numpy as np
+import h5py
+from concurrent.futures import Future, ProcessPoolExecutor
+from typing import Dict, List, Optional, Sequence
+#################################################################
+# IQ aggregation
+#################################################################
+def read_iq_datasets(
+    path: str
+) -> Dict[str, np.ndarray]:
+    """
+    Complex datasets of a program.to_hdf5 file, {dataset name : IQ array}
+    """
+    iq = {}
+    with h5py.File(path, "r") as f:
+        def visit(name, obj):
+            if isinstance(obj, h5py.Dataset) and obj.dtype.kind == "c":
+                iq[name] = obj[()]
+        f.visititems(visit)
+    return iq
+
+def bin_iq(
+    iq: np.ndarray,
+    bins: int = 100
+) -> Dict[str, np.ndarray]:
+    """
+    2D histogram (density) of IQ points. Size of result does not depend on
+    number of shots.
+    """
+    iq = np.asarray(iq).ravel()
+    iq = iq[np.isfinite(iq)]
+    span = max(np.abs(iq.real).max(initial = 0), np.abs(iq.imag).max(initial = 0)) or 1.0
+    edges = np.linspace(-span, span, bins + 1)
+    hist, _, _ = np.histogram2d(iq.real, iq.imag, bins = (edges, edges))
+    centers = (edges[:-1] + edges[1:]) / 2
+    return {"density": hist.T, "i": centers, "q": centers, "n": iq.size}
+
+def point_means(
+    iq: np.ndarray
+) -> np.ndarray:
+    """
+    Mean of IQ per sweep point, averaging over the last (shot) axis
+    """
+    iq = np.asarray(iq)
+    return iq.reshape(-1) if iq.ndim < 2 else iq.reshape(-1, iq.shape[-1]).mean(axis = -1)
+#################################################################
+# Rendering
+#################################################################
+def _render_plotly(
+    binned: Dict[str, Dict[str, np.ndarray]],
+    means: Dict[str, np.ndarray],
+    title: str
+) -> str:
+    import plotly.graph_objects as go
+    from plotly.subplots import make_subplots
+
+    fig = make_subplots(rows = 1, cols = len(binned), subplot_titles = list(binned))
+    for col, (name, b) in enumerate(binned.items(), start = 1):
+        fig.add_trace(
+            go.Heatmap(x = b["i"], y = b["q"], z = np.log10(b["density"] + 1),
+                       colorscale = "Viridis", showscale = False, name = name),
+            row = 1, col = col
+        )
+        fig.add_trace(
+            go.Scatter(x = means[name].real, y = means[name].imag, mode = "markers",
+                       marker = dict(color = "red", size = 6), name = f"{name} mean"),
+            row = 1, col = col
+        )
+        fig.update_xaxes(title_text = "I", row = 1, col = col)
+        fig.update_yaxes(title_text = "Q", row = 1, col = col)
+    fig.update_layout(title = title)
+    # plotly.js is loaded from CDN instead of being embedded (~3 MB)
+    return fig.to_html(include_plotlyjs = "cdn", full_html = True)
+
+def _render_matplotlib(
+    binned: Dict[str, Dict[str, np.ndarray]],
+    means: Dict[str, np.ndarray],
+    title: str
+) -> str:
+    import matplotlib
+    matplotlib.use("Agg")
+    import matplotlib.pyplot as plt
+
+    fig, axes = plt.subplots(1, len(binned), figsize = (5 * len(binned), 4.5), squeeze = False)
+    for ax, (name, b) in zip(axes[0], binned.items()):
+        ax.pcolormesh(b["i"], b["q"], np.log10(b["density"] + 1), shading = "auto")
+        ax.plot(means[name].real, means[name].imag, "r.")
+        ax.set_title(name)
+        ax.set_xlabel("I")
+        ax.set_ylabel("Q")
+    fig.suptitle(title)
+    buf = io.BytesIO()
+    fig.savefig(buf, format = "png", dpi = 100)
+    plt.close(fig)
+    png = base64.b64encode(buf.getvalue()).decode("ascii")
+    return f"<html><body><img src=\"data:image/png;base64,{png}\"/></body></html>"
+
+def iq_report_html(
+    iq: Dict[str, np.ndarray],
+    bins: int = 100,
+    title: str = ""
+) -> str:
+    """
+    HTML of binned IQ density and per point means, {dataset name : IQ array}
+    """
+    binned = {name: bin_iq(value, bins) for name, value in iq.items()}
+    means = {name: point_means(value) for name, value in iq.items()}
+    try:
+        return _render_plotly(binned, means, title)
+    except ImportError:
+        return _render_matplotlib(binned, means, title)
+
+def render_iq_report(
+    h5_path: str,
+    html_path: str,
+    bins: int = 100,
+    title: Optional[str] = None
+) -> str:
+    """
+    Read IQ data from h5_path, bin it, and write compact HTML to html_path.
+    This runs in the report process.
+    """
+    iq = read_iq_datasets(h5_path)
+    if not iq:
+        raise ValueError(f"There is no IQ dataset in {h5_path}")
+    html_str = iq_report_html(iq, bins, title or os.path.basename(h5_path))
+    with open(html_path, "w", encoding = "utf-8") as f:
+        f.write(html_str)
+    return html_path
+
+# IQ received by the report process, {html path : {dataset name : [IQ arrays]}}
+_accumulated: Dict[str, Dict[str, List[np.ndarray]]] = {}
+
+def render_iq_points(
+    iq: Dict[str, np.ndarray],
+    html_path: str,
+    bins: int = 100,
+    title: Optional[str] = None,
+    append: bool = True
+) -> str:
+    """
+    Add IQ of new sweep points {dataset name : (n_points, n_shots)} to the
+    points received before for html_path, and write report of all of them.
+    This runs in the report process, which keeps the received points.
+    """
+    received = _accumulated.setdefault(html_path, {})
+    if not append:
+        received.clear()
+    for name, value in iq.items():
+        received.setdefault(name, []).append(value)
+    html_str = iq_report_html(
+        {name: np.concatenate(values) for name, values in received.items()},
+        bins,
+        title or os.path.basename(html_path)
+    )
+    with open(html_path, "w", encoding = "utf-8") as f:
+        f.write(html_str)
+    return html_path
+#################################################################
+# Background process
+#################################################################
+# Reporters which are not closed yet, see close_reporters
+_open_reporters: List["IQReporter"] = []
+
+class IQReporter:
+    """
+    Render IQ reports in a background process so that acquisition can go on.
+    submit() returns immediately. Reports which are still rendering are
+    waited for at interpreter exit, so scripts need not call close().
+    Scripts using it should guard hardware code with
+    if __name__ == "__main__", since the report process imports main module
+    on Windows.
+    """
+    def __init__(
+        self,
+        bins: int = 100
+    ):
+        self.bins       = bins
+        self._pool      = ProcessPoolExecutor(max_workers = 1)
+        self._futures: List[Future] = []
+        self._paths     = set()
+        atexit.register(self._close_at_exit)
+        _open_reporters.append(self)
+
+    def submit(
+        self,
+        h5_path: str,
+        html_path: str,
+        title: Optional[str] = None
+    ) -> Future:
+        """
+        Render report of IQ datasets of h5_path in background
+        """
+        future = self._pool.submit(render_iq_report, h5_path, html_path, self.bins, title)
+        self._futures.append(future)
+        return future
+
+    def submit_points(
+        self,
+        points: Sequence[Dict[str, np.ndarray]],
+        html_path: str,
+        title: Optional[str] = None
+    ) -> Optional[Future]:
+        """
+        Send IQ (complex) datasets of sweep points, e.g. of one batch from
+        the on_batch callback of stream_batches, to the report process, which
+        writes html_path with all points sent so far. Nothing is sent if
+        points have no IQ.
+        """
+        names = [name for name, value in points[0].items() if np.iscomplexobj(value)] if points else []
+        if not names:
+            return None
+        iq = {name: np.stack([np.asarray(point[name]) for point in points]) for name in names}
+        append = html_path in self._paths
+        self._paths.add(html_path)
+        future = self._pool.submit(render_iq_points, iq, html_path, self.bins, title, append)
+        self._futures.append(future)
+        return future
+
+    def wait(self) -> List[str]:
+        """
+        Wait for all submitted reports, and return written HTML paths
+        """
+        paths = [f.result() for f in self._futures]
+        self._futures = []
+        return paths
+
+    def close(self) -> List[str]:
+        """
+        Wait for all submitted reports and stop the report process
+        """
+        if self._pool is None:
+            return []
+        try:
+            return self.wait()
+        finally:
+            self._pool.shutdown(wait = True)
+            self._pool = None
+            atexit.unregister(self._close_at_exit)
+            if self in _open_reporters:
+                _open_reporters.remove(self)
+
+    def _close_at_exit(self) -> None:
+        try:
+            for path in dict.fromkeys(self.close()):
+                print(f"IQ report is saved to {path}")
+        except Exception as e:
+            print(f"IQ report failed : {type(e).__name__}: {e}")
+
+    def __enter__(self) -> "IQReporter":
+        return self
+
+    def __exit__(self, *exc) -> None:
+        self.close()
+
+def close_reporters() -> List[str]:
+    """
+    Close all reporters which are still open, e.g. before files of a run
+    are removed. Returns written HTML paths.
+    """
+    paths = []
+    while _open_reporters:
+        paths += _open_reporters[0].close()
+    return paths
@@ -0,0 +1,371 @@
+"""Streaming HDF5 result writer and reader for QCS executions"""
+import os
+import tempfile
+import numpy as np
+import h5py
+from typing import Any, Callable, Dict, Iterator, List, Optional, Sequence, Tuple, Union
+#################################################################
+# Writer
+#################################################################
+# Target size of one HDF5 chunk [bytes]. HDF5 limits a chunk to 4 GB, and
+# a whole (n_shots, n_samples) point can be hundreds of MB.
+CHUNK_BYTES = 2 * 2**20
+
+def chunk_shape(
+    shape: Tuple[int, ...],
+    itemsize: int,
+    target_bytes: int = CHUNK_BYTES
+) -> Tuple[int, ...]:
+    """
+    Chunk of a dataset stacked along sweep points, (1, *shape) when one
+    point is smaller than target_bytes. Otherwise leading axes of the point
+    (shot axis first) are cut, so that a chunk is about target_bytes.
+    """
+    chunk = [1]
+    rest = itemsize * int(np.prod(shape))
+    for i, n in enumerate(shape):
+        n = max(int(n), 1)
+        rest //= n
+        if rest * n <= target_bytes:
+            chunk += [max(int(m), 1) for m in shape[i:]]
+            break
+        chunk.append(int(min(n, max(target_bytes // max(rest, 1), 1))))
+    return tuple(chunk)
+
+class ResultSink:
+    """
+    Append per-sweep-point results to chunked, compressed HDF5 datasets.
+    Datasets are stacked along a new first axis (sweep point), and use the
+    same names as program.to_hdf5 (e.g. "DutChannel_3_Acquisition_0/trace").
+    HDF5 SWMR mode needs all datasets and attributes to exist before readers
+    attach, so they are declared (or taken from the first point) before start().
+    """
+    def __init__(
+        self,
+        path: str,
+        compression: Optional[str] = "gzip",
+        compression_opts: Optional[int] = 4,
+        flush_every: int = 1,
+        attrs: Optional[Dict[str, Any]] = None
+    ):
+        self.path               = path
+        self.compression        = compression
+        self.compression_opts   = compression_opts if compression == "gzip" else None
+        self.flush_every        = flush_every
+        self._file              = h5py.File(path, "w", libver = "latest")
+        self._started           = False
+        self._n_points          = {}
+        self._n_since_flush     = 0
+        self._has_program_attrs = False
+        # Layout differs from program.to_hdf5 file, whose "Shape" is not kept
+        self._file.attrs["Layout"] = "Datasets are (sweep point, shot[, sample]), sweep values are in sweep/"
+        for key, value in (attrs or {}).items():
+            self._file.attrs[key] = value
+
+    def declare(
+        self,
+        name: str,
+        shape: Tuple[int, ...],
+        dtype: Any = np.float64
+    ) -> None:
+        """
+        Declare dataset of which one sweep point has given shape
+        """
+        if self._started:
+            raise RuntimeError("Datasets cannot be declared after start()")
+        shape = tuple(shape)
+        self._file.create_dataset(
+            name,
+            shape           = (0,) + shape,
+            maxshape        = (None,) + shape,
+            chunks          = chunk_shape(shape, np.dtype(dtype).itemsize),
+            dtype           = dtype,
+            compression     = self.compression,
+            compression_opts= self.compression_opts,
+            shuffle         = self.compression is not None,
+        )
+        self._n_points[name] = 0
+
+    def start(self) -> None:
+        """
+        Enable SWMR mode. After this, readers can open the file while it is written.
+        """
+        self._file.swmr_mode = True
+        self._started = True
+
+    def append(
+        self,
+        point: Dict[str, np.ndarray],
+        sweep_values: Optional[Dict[str, float]] = None
+    ) -> int:
+        """
+        Append one sweep point {dataset name : array}. Datasets which are not
+        declared are declared from the first point, and start() is called.
+        Returns index of the point.
+        """
+        point = {name: np.asarray(value) for name, value in point.items()}
+        if sweep_values:
+            point.update({f"sweep/{k}": np.asarray(v, dtype = np.float64) for k, v in sweep_values.items()})
+        if not self._started:
+            for name, value in point.items():
+                if name not in self._n_points:
+                    self.declare(name, value.shape, value.dtype)
+            self.start()
+        for name, value in point.items():
+            if name not in self._n_points:
+                raise KeyError(f"{name} is not declared before start()")
+            dset = self._file[name]
+            idx = self._n_points[name]
+            dset.resize(idx + 1, axis = 0)
+            dset[idx] = value
+            self._n_points[name] = idx + 1
+        self._n_since_flush += 1
+        if self._n_since_flush >= self.flush_every:
+            self.flush()
+        return max(self._n_points.values()) - 1
+
+    def append_program(
+        self,
+        program: Any,
+        sweep_values: Optional[Sequence[Dict[str, float]]] = None,
+        derive: Optional[Callable[[Dict[str, np.ndarray]], Dict[str, np.ndarray]]] = None
+    ) -> int:
+        """
+        Append every sweep point of executed qcs.Program, e.g. one batch of
+        SweepPlanner, so that results are written as each batch completes
+        (see stream_batches). Metadata of the first program (see
+        program_attrs) is copied to the file attributes. sweep_values are
+        {scalar name : value} of each point. derive(point) returns extra
+        datasets of the point, e.g. IQ demodulated from traces. Returns
+        index of the last point.
+        """
+        self.copy_program_attrs(program)
+        points = program_points(program, derive)
+        return self.append_points(points, sweep_values)
+
+    def copy_program_attrs(
+        self,
+        program: Any
+    ) -> None:
+        """
+        Copy metadata of executed program (see program_attrs) to file
+        attributes. Only the first program before start() is copied, since
+        attributes cannot be added in SWMR mode.
+        """
+        if self._started or self._has_program_attrs:
+            return
+        for key, value in program_attrs(program).items():
+            self._file.attrs[key] = value
+        self._has_program_attrs = True
+
+    def append_points(
+        self,
+        points: Sequence[Dict[str, np.ndarray]],
+        sweep_values: Optional[Sequence[Dict[str, float]]] = None
+    ) -> int:
+        """
+        Append sweep points {dataset name : array}. Returns index of the last point.
+        """
+        if sweep_values is not None and len(sweep_values) != len(points):
+            raise ValueError(f"{len(sweep_values)} sweep values for {len(points)} points")
+        index = -1
+        for k, point in enumerate(points):
+            index = self.append(point, sweep_values[k] if sweep_values is not None else None)
+        return index
+
+    def flush(self) -> None:
+        self._file.flush()
+        self._n_since_flush = 0
+
+    def close(self) -> None:
+        if self._file is not None:
+            self._file.flush()
+            self._file.close()
+            self._file = None
+
+    def __enter__(self) -> "ResultSink":
+        return self
+
+    def __exit__(self, *exc) -> None:
+        self.close()
+
+# Result kind and keysight.qcs getter of executed program
+RESULT_GETTERS = {"trace": "get_trace", "iq": "get_iq"}
+
+def program_results(
+    program: Any
+) -> Dict[str, np.ndarray]:
+    """
+    {dataset name : array of (n_points, ...)} of executed qcs.Program, read
+    from memory with get_trace / get_iq (avg = False). Each column (one
+    acquisition of a channel) becomes "<column>/trace" or "<column>/iq",
+    the same names as program.to_hdf5. Kinds which are not acquired
+    (e.g. traces with hw_demod) are skipped.
+    """
+    results = {}
+    for kind, getter in RESULT_GETTERS.items():
+        try:
+            data = getattr(program, getter)(avg = False)
+        except (KeyError, ValueError):
+            continue
+        # Mapping or DataFrame of per point values
+        for label, column in data.items():
+            value = column if isinstance(column, np.ndarray) else np.stack([np.asarray(v) for v in column])
+            results[f"{label}/{kind}"] = value
+    return results
+
+def program_points(
+    program: Any,
+    derive: Optional[Callable[[Dict[str, np.ndarray]], Dict[str, np.ndarray]]] = None
+) -> List[Dict[str, np.ndarray]]:
+    """
+    Results of executed program split into sweep points, with datasets of
+    derive(point) added to each point
+    """
+    results = program_results(program)
+    n_points = min((len(value) for value in results.values()), default = 0)
+    points = [{name: value[k] for name, value in results.items()} for k in range(n_points)]
+    if derive is not None:
+        for point in points:
+            point.update(derive(point))
+    return points
+
+def program_attrs(
+    program: Any
+) -> Dict[str, Any]:
+    """
+    File attributes which program.to_hdf5 writes (Program and ChannelMapper
+    JSON, FPGAPostprocessing, Version, ...), except "Shape" which describes
+    the layout of that file only. Programs which do not keep them in memory
+    are written once to a temporary file to read the attributes.
+    """
+    attrs = getattr(program, "attrs", None)
+    if attrs is None:
+        fd, tmp = tempfile.mkstemp(suffix = ".h5")
+        os.close(fd)
+        try:
+            program.to_hdf5(tmp)
+            with h5py.File(tmp, "r") as f:
+                attrs = dict(f.attrs)
+        finally:
+            os.remove(tmp)
+    return {key: value for key, value in attrs.items() if key != "Shape"}
+#################################################################
+# Batched execution
+#################################################################
+def stream_batches(
+    sink: ResultSink,
+    batches: Sequence[Any],
+    build_program: Callable[[], Any],
+    execute: Callable[[Any], Any],
+    derive: Optional[Callable[[Dict[str, np.ndarray]], Dict[str, np.ndarray]]] = None,
+    on_batch: Optional[Callable[[Any, List[Dict[str, np.ndarray]]], Any]] = None,
+    progress: bool = True
+) -> Dict[str, Any]:
+    """
+    Execute SweepPlanner batches back-to-back with run_batches, and append
+    results of each batch to sink while the next batch is executed.
+    derive(point) adds datasets to each point (see program_points), and
+    on_batch(batch, points) is called after the points are written, e.g.
+    IQReporter.submit_points. Returns throughput of run_batches.
+    """
+    from qcs_sweep_planner import run_batches
+
+    def postprocess(batch: Any, program: Any) -> int:
+        sink.copy_program_attrs(program)
+        points = program_points(program, derive)
+        index = sink.append_points(points, batch.points())
+        if on_batch is not None:
+            on_batch(batch, points)
+        return index
+
+    return run_batches(
+        batches,
+        build_program,
+        execute,
+        postprocess = postprocess,
+        workers     = 1,
+        progress    = progress,
+    )
+#################################################################
+# Reader
+#################################################################
+class ResultReader:
+    """
+    Read ResultSink file, also while it is being written (SWMR).
+    Datasets are returned lazily (h5py.Dataset or np.memmap), so only the
+    slices which are indexed are read from disk. ResultSink datasets are
+    chunked and compressed, so they are always h5py.Dataset.
+    """
+    def __init__(
+        self,
+        path: str
+    ):
+        self.path   = path
+        self._file  = h5py.File(path, "r", libver = "latest", swmr = True)
+
+    def refresh(self) -> None:
+        """
+        Update dataset shapes to see points appended since last refresh
+        """
+        def visit(name, obj):
+            if isinstance(obj, h5py.Dataset):
+                obj.refresh()
+        self._file.visititems(visit)
+
+    def names(self) -> List[str]:
+        names = []
+        self._file.visititems(
+            lambda name, obj: names.append(name) if isinstance(obj, h5py.Dataset) else None
+        )
+        return names
+
+    def __len__(self) -> int:
+        self.refresh()
+        lengths = [self._file[name].shape[0] for name in self.names()]
+        return min(lengths) if lengths else 0
+
+    def dataset(
+        self,
+        name: str
+    ) -> Union[h5py.Dataset, np.ndarray]:
+        """
+        Dataset without reading it. Only contiguous, uncompressed datasets
+        (e.g. from program.to_hdf5) can be memory-mapped. Chunked datasets,
+        including every dataset written by ResultSink, are returned as
+        h5py.Dataset.
+        """
+        dset = self._file[name]
+        dset.refresh()
+        offset = dset.id.get_offset()
+        if dset.chunks is None and offset is not None:
+            return np.memmap(self.path, mode = "r", dtype = dset.dtype, shape = dset.shape, offset = offset)
+        return dset
+
+    def trace(
+        self,
+        channel: int,
+        acquisition: int = 0
+    ) -> Union[h5py.Dataset, np.ndarray]:
+        return self.dataset(f"DutChannel_{channel}_Acquisition_{acquisition}/trace")
+
+    def iter_points(
+        self,
+        name: str,
+        start: int = 0
+    ) -> Iterator[np.ndarray]:
+        """
+        Iterate sweep points of dataset from start, reading one point at a time
+        """
+        dset = self.dataset(name)
+        for idx in range(start, dset.shape[0]):
+            yield dset[idx]
+
+    def close(self) -> None:
+        self._file.close()
+
+    def __enter__(self) -> "ResultReader":
+        return self
+
+    def __exit__(self, *exc) -> None:
+        self.close()
@@ -0,0 +1,243 @@
+"""Sweep grid planner which splits large QCS sweeps into hardware sized batches"""
+import time
+import itertools
+import numpy as np
+import keysight.qcs as qcs
+from concurrent.futures import ThreadPoolExecutor
+from typing import Any, Callable, Dict, List, Optional, Sequence, Union
+#################################################################
+# Sweep axis
+#################################################################
+class SweepAxis:
+    """
+    One sweep axis. Several scalars on one axis are swept together (zipped),
+    e.g. dc_amp and awg_amp in qcs_test_pulse.py.
+    recompile : True if changing this parameter changes waveform shape
+                (e.g. duration), so that waveforms must be compiled again.
+    """
+    def __init__(
+        self,
+        scalars: Union[qcs.Scalar, Sequence[qcs.Scalar]],
+        values: Union[Sequence[float], Sequence[Sequence[float]]],
+        recompile: bool = False,
+        name: Optional[str] = None
+    ):
+        if not isinstance(scalars, (list, tuple)):
+            scalars = [scalars]
+            values  = [values]
+        self.scalars    = list(scalars)
+        self.values     = [np.asarray(v) for v in values]
+        if len({len(v) for v in self.values}) != 1:
+            raise ValueError("Zipped sweep values should have same length")
+        self.recompile  = recompile
+        self.name       = name or "_".join(str(getattr(s, "name", i)) for i, s in enumerate(self.scalars))
+
+    def __len__(self) -> int:
+        return len(self.values[0])
+#################################################################
+# Batch
+#################################################################
+class SweepBatch:
+    """
+    Sub grid of the sweep. index[axis name] are indices of values of the axis.
+    """
+    def __init__(
+        self,
+        number: int,
+        axes: List[SweepAxis],
+        index: Dict[str, np.ndarray]
+    ):
+        self.number = number
+        self.axes   = axes
+        self.index  = index
+
+    @property
+    def n_points(self) -> int:
+        return int(np.prod([len(self.index[axis.name]) for axis in self.axes]))
+
+    def values(self) -> Dict[str, List[np.ndarray]]:
+        return {axis.name: [v[self.index[axis.name]] for v in axis.values] for axis in self.axes}
+
+    def points(self) -> List[Dict[str, float]]:
+        """
+        {scalar name : value} of each point, in the order of results of the
+        program (outermost axis first)
+        """
+        points = []
+        for index in itertools.product(*[self.index[axis.name] for axis in self.axes]):
+            point = {}
+            for axis, i in zip(self.axes, index):
+                for k, (scalar, v) in enumerate(zip(axis.scalars, axis.values)):
+                    point[str(getattr(scalar, "name", f"{axis.name}_{k}"))] = float(v[i])
+            points.append(point)
+        return points
+
+    def apply(
+        self,
+        program: qcs.Program
+    ) -> qcs.Program:
+        """
+        Add sweeps of this batch to program, outermost axis first
+        """
+        for axis in self.axes:
+            idx = self.index[axis.name]
+            arrays = [
+                qcs.Array(name = f"{axis.name}_{k}_batch{self.number}", value = list(v[idx]))
+                for k, v in enumerate(axis.values)
+            ]
+            if len(arrays) == 1:
+                program.sweep(arrays[0], axis.scalars[0])
+            else:
+                program.sweep(arrays, axis.scalars)
+        return program
+
+    def __repr__(self) -> str:
+        shape = " x ".join(f"{axis.name}[{len(self.index[axis.name])}]" for axis in self.axes)
+        return f"SweepBatch({self.number} : {shape} = {self.n_points} points)"
+#################################################################
+# Planner
+#################################################################
+# Host memory for results of one batch [bytes]
+MEMORY_BYTES = 512 * 2**20
+
+def max_points_for(
+    bytes_per_point: float,
+    memory_bytes: float = MEMORY_BYTES
+) -> int:
+    """
+    Number of sweep points whose results fit in memory_bytes, e.g.
+    n_shots * n_samples * 8 for float64 traces. Sweeps which fit are
+    executed as one batch.
+    """
+    return max(int(memory_bytes // max(bytes_per_point, 1)), 1)
+
+class SweepPlanner:
+    """
+    Order axes so that axes which force recompilation change least often
+    (outermost), and split the grid into batches of at most max_points.
+    Inner axes are kept whole as long as they fit, the next axis is split
+    into chunks, and outer axes have one value per batch.
+    """
+    def __init__(
+        self,
+        axes: Sequence[SweepAxis],
+        max_points: int
+    ):
+        if max_points < 1:
+            raise ValueError("max_points should be positive")
+        # Batch indices are keyed by axis name
+        names = [axis.name for axis in axes]
+        duplicates = sorted({name for name in names if names.count(name) > 1})
+        if duplicates:
+            raise ValueError(f"Sweep axis names should be unique, got {duplicates} more than once")
+        self.axes       = list(axes)
+        self.max_points = int(max_points)
+
+    def order(self) -> List[SweepAxis]:
+        """
+        Recompiling axes first (outer), then the others, each group keeping
+        the given order. Stable, so user order is kept when flags are equal.
+        """
+        return sorted(self.axes, key = lambda axis: not axis.recompile)
+
+    @property
+    def n_points(self) -> int:
+        return int(np.prod([len(axis) for axis in self.axes]))
+
+    def batches(self) -> List[SweepBatch]:
+        axes = self.order()
+        # Number of inner axes which fit in one batch as a whole
+        n_whole, inner = 0, 1
+        for axis in reversed(axes):
+            if inner * len(axis) > self.max_points:
+                break
+            inner *= len(axis)
+            n_whole += 1
+        n_outer = len(axes) - n_whole
+        whole_axes = axes[n_outer:]
+        if n_outer == 0:
+            split_axis, chunk = None, 1
+            fixed_axes = []
+        else:
+            split_axis = axes[n_outer - 1]
+            chunk = max(self.max_points // inner, 1)
+            fixed_axes = axes[:n_outer - 1]
+
+        batches = []
+        for fixed in itertools.product(*[range(len(axis)) for axis in fixed_axes]):
+            split_ranges = (
+                [None] if split_axis is None
+                else [np.arange(k, min(k + chunk, len(split_axis))) for k in range(0, len(split_axis), chunk)]
+            )
+            for split in split_ranges:
+                index = {axis.name: np.array([i]) for axis, i in zip(fixed_axes, fixed)}
+                if split_axis is not None:
+                    index[split_axis.name] = split
+                for axis in whole_axes:
+                    index[axis.name] = np.arange(len(axis))
+                batches.append(SweepBatch(len(batches), axes, index))
+        return batches
+
+    def n_recompiles(
+        self,
+        batches: Optional[List[SweepBatch]] = None
+    ) -> int:
+        """
+        Number of batches where a recompiling parameter changes from the previous batch
+        """
+        batches = batches if batches is not None else self.batches()
+        count, previous = 0, None
+        for batch in batches:
+            key = tuple(tuple(batch.index[a.name]) for a in batch.axes if a.recompile)
+            if key != previous:
+                count += 1
+                previous = key
+        return count
+#################################################################
+# Pipelined execution
+#################################################################
+def run_batches(
+    batches: Sequence[SweepBatch],
+    build_program: Callable[[], qcs.Program],
+    execute: Callable[[qcs.Program], Any],
+    postprocess: Optional[Callable[[SweepBatch, Any], Any]] = None,
+    workers: int = 1,
+    progress: bool = True
+) -> Dict[str, Any]:
+    """
+    Execute batches back-to-back. build_program() returns program without
+    sweeps, execute(program) runs it (e.g. executor.execute), and
+    postprocess(batch, result) runs in worker threads while next batch is
+    executed. Returns results in batch order and throughput.
+    """
+    pool = ThreadPoolExecutor(max_workers = workers) if postprocess else None
+    futures, results = [], []
+    n_points = 0
+    start_time = time.perf_counter()
+    try:
+        for batch in batches:
+            program = batch.apply(build_program())
+            result = execute(program)
+            n_points += batch.n_points
+            if pool is not None:
+                futures.append(pool.submit(postprocess, batch, result))
+            else:
+                results.append(result)
+            if progress:
+                elapsed = time.perf_counter() - start_time
+                print(f"\r{batch} : {n_points / elapsed:.1f} points/s", end = "")
+        if pool is not None:
+            results = [f.result() for f in futures]
+    finally:
+        if pool is not None:
+            pool.shutdown(wait = True)
+    elapsed = time.perf_counter() - start_time
+    if progress:
+        print()
+    return {
+        "results"       : results,
+        "n_points"      : n_points,
+        "n_batches"     : len(batches),
+        "elapsed_s"     : elapsed,
+        "points_per_s"  : n_points / elapsed if elapsed > 0 else float("inf"),
+    }
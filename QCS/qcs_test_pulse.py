@@ -1,15 +1,18 @@
 """QCS execution measurement program"""
 from matplotlib import pyplot as plt
 import numpy as np
-import h5py
 
 import keysight.qcs as qcs
 
+from qcs_result_writer import ResultReader, ResultSink, stream_batches
+from qcs_sweep_planner import SweepAxis, SweepPlanner, max_points_for
+
 ns = 1e-9
 us = 1e-6
 MHz = 1e6
+# M5200 digitizer sample rate
+sample_rate = 4.8e9
 
-program = qcs.Program()
 mapper = qcs.ChannelMapper()
 awg_amp = qcs.Scalar(
     name = "awg_amp",
@@ -64,68 +67,69 @@ mapper.set_lo_frequencies(
 physical_digs = mapper.get_physical_channels(dig_channels)
 physical_digs[2].settings.range.value = 1.8
 
-program.add_waveform(
-    pulse = qcs.RFWaveform(
-        duration = 1 * us,
-        envelope = qcs.GaussianEnvelope(),
-        amplitude = awg_amp,
-        rf_frequency = 10 * MHz
-    ),
-    channels = awg_channels[3],
-    pre_delay= 0.4 * us
-)
-program.add_waveform(
-    pulse = qcs.DCWaveform(
-        duration = 300 * ns,
-        envelope = qcs.ArbitraryEnvelope(
-            times = [0, 1],
-            amplitudes= [0, 1],
+# Program sequence without sweeps, built again for every sweep batch
+def build_program() -> qcs.Program:
+    program = qcs.Program()
+    program.add_waveform(
+        pulse = qcs.RFWaveform(
+            duration = 1 * us,
+            envelope = qcs.GaussianEnvelope(),
+            amplitude = awg_amp,
+            rf_frequency = 10 * MHz
         ),
-        amplitude = dc_amp,
-    ),
-    channels = dc_channels[0],
-)
-program.add_waveform(
-    pulse = qcs.DCWaveform(
-        duration = 1.4 * us,
-        envelope = qcs.ConstantEnvelope(),
-        amplitude = dc_amp,
-    ),
-    channels = dc_channels[0],
-)
-program.add_waveform(
-    pulse = qcs.DCWaveform(
-        duration = 300 * ns,
-        envelope = qcs.ArbitraryEnvelope(
-            times = [0, 1],
-            amplitudes= [1, 0],
+        channels = awg_channels[3],
+        pre_delay= 0.4 * us
+    )
+    program.add_waveform(
+        pulse = qcs.DCWaveform(
+            duration = 300 * ns,
+            envelope = qcs.ArbitraryEnvelope(
+                times = [0, 1],
+                amplitudes= [0, 1],
+            ),
+            amplitude = dc_amp,
         ),
-        amplitude = dc_amp,
-    ),
-    channels = dc_channels[0],
-)
-program.add_acquisition(
-    integration_filter = 2 * us,
-    channels = dig_channels[3]
-)
-program.add_acquisition(
-    integration_filter = 2 * us,
-    channels = dig_channels[2]
-)
+        channels = dc_channels[0],
+    )
+    program.add_waveform(
+        pulse = qcs.DCWaveform(
+            duration = 1.4 * us,
+            envelope = qcs.ConstantEnvelope(),
+            amplitude = dc_amp,
+        ),
+        channels = dc_channels[0],
+    )
+    program.add_waveform(
+        pulse = qcs.DCWaveform(
+            duration = 300 * ns,
+            envelope = qcs.ArbitraryEnvelope(
+                times = [0, 1],
+                amplitudes= [1, 0],
+            ),
+            amplitude = dc_amp,
+        ),
+        channels = dc_channels[0],
+    )
+    program.add_acquisition(
+        integration_filter = 2 * us,
+        channels = dig_channels[3]
+    )
+    program.add_acquisition(
+        integration_filter = 2 * us,
+        channels = dig_channels[2]
+    )
 
-program.n_shots(1)
+    program.n_shots(1)
+    return program
 
-dc_amps = qcs.Array(
-    name = "dc_amps",
-    value = [0.1, 0.2, 0.3]
-)
-awg_amps = qcs.Array(
-    name = "awg_amps",
-    value = [0.2, 0.5, 1.0]
-)
-program.sweep(
-    [dc_amps, awg_amps],
-    [dc_amp, awg_amp]
+dc_amps = [0.1, 0.2, 0.3]
+awg_amps = [0.2, 0.5, 1.0]
+# Points of one execution, as many as traces of the two acquisitions
+# (2 us, 1 shot, float64) fit in host memory, so that this sweep is one
+# execution as before
+planner = SweepPlanner(
+    [SweepAxis([dc_amp, awg_amp], [dc_amps, awg_amps])],
+    max_points = max_points_for(2 * int(2 * us * sample_rate) * 8)
 )
 
 backend = qcs.HclBackend(
@@ -134,12 +138,14 @@ backend = qcs.HclBackend(
     init_time = 60 * ns,
 )
 
-program = qcs.Executor(backend).execute(program)
-program.to_hdf5("./QCS/test_result.h5")
+executor = qcs.Executor(backend)
+with ResultSink("./QCS/test_result.h5") as sink:
+    stream_batches(sink, planner.batches(), build_program, executor.execute)
 
-with h5py.File("./QCS/test_result.h5") as f:
-    dc_trace = f["DutChannel_3_Acquisition_0"]["trace"][:] - 1.0
-    rf_trace = f["DutChannel_4_Acquisition_0"]["trace"][:]
+# Points are stacked on the first axis, flattened to one trace as before
+with ResultReader("./QCS/test_result.h5") as reader:
+    dc_trace = reader.trace(3)[:].ravel() - 1.0
+    rf_trace = reader.trace(4)[:].ravel()
 t_axis = np.linspace(0, 0.001/4.8 * len(dc_trace), len(dc_trace))
 
 plt.figure()
@@ -2,12 +2,19 @@
 	"""IQ Upconversion and Downconversion Example"""
 	import keysight.qcs as qcs
 	import numpy as np
+	
+	from qcs_demod import IQDemodulator
+	from qcs_report import IQReporter
+	from qcs_result_writer import ResultSink, stream_batches
+	from qcs_sweep_planner import SweepAxis, SweepPlanner, max_points_for
 	#################################################################
 	# Basic constants for convenience
 	#################################################################
 	GHz     = 1e9
 	ns      = 1e-9
 	n_shots = 300
+	# M5200 digitizer sample rate
+	sample_rate = 4.8e9
 	#################################################################
 	# Virtual Channel Definitions
 	# awgs : M5300 AWG channels
@@ -27,7 +34,6 @@
 	# Program & Mapper Definition
 	#################################################################
 	mapper  = qcs.ChannelMapper()
-	program = qcs.Program()
 	#################################################################
 	# Map virtual channels to physical addresses
 	# awgs[0] -> M9046A chassis, slot 1, module 4, channel 1  M5300 AWG
@@ -126,55 +132,77 @@
 	    rf_frequency    = 9.791 * GHz
 	)
 	##################################################################
-	# Program Sequence
-	##################################################################
-	program.add_waveform(
-	    iq_pulse_awg,
-	    awgs[0],
-	    new_layer = True
-	)
-	program.add_acquisition(
-	    iq_pulse_dig,
-	    digs[0]
-	)
+	# Program Sequence, built again for every sweep batch
 	##################################################################
-	# Set the number of shots
-	##################################################################
-	program.n_shots(n_shots)
+	def build_program() -> qcs.Program:
+	    program = qcs.Program()
+	    program.add_waveform(
+	        iq_pulse_awg,
+	        awgs[0],
+	        new_layer = True
+	    )
+	    program.add_acquisition(
+	        iq_pulse_dig,
+	        digs[0]
+	    )
+	    # Set the number of shots
+	    program.n_shots(n_shots)
+	    return program
 	##################################################################
 	# Variable for sweep
 	##################################################################
-	amplitudes = qcs.Array(
-	    name="amplitudes",
-	    value = [0.25, 0.5, 0.75, 1.0]
-	)
-	phases = qcs.Array(
-	    name = "phases",
-	    value = [np.pi * i / 4 for i in range(8)]
-	)
+	amplitudes = [0.25, 0.5, 0.75, 1.0]
+	phases = [np.pi * i / 4 for i in range(8)]
+	# Sweep points of one execution, as many as float64 traces and IQ of
+	# the acquisition fit in host memory. Whole sweep is one execution
+	# unless it is larger.
+	n_samples = int(np.ceil((duration.value + 100 * ns) * sample_rate))
+	max_points = max_points_for(n_shots * (n_samples * 8 + 16))
 	##################################################################
-	# Sweep the qcs.Scalar variable with qcs.Array variable
+	# Sweep the qcs.Scalar variable in batches of at most max_points points
 	##################################################################
-	program.sweep(amplitudes, amplitude)
-	program.sweep(phases, phase)
-	backend = qcs.HclBackend( 
-	    channel_mapper  =mapper,
-	    init_time       =0.001,
-	    hw_demod        =False,
-	    # Phase should be reseted before each shot to get
-	    # correct IQ demodulated data.
-	    reset_phase_every_shot=True
-	)
-	##################################################################
-	# Execute the program and save the results
-	##################################################################
-	program_run = qcs.Executor(backend).execute(program)
-	program_run.to_hdf5("downconvertor.hdf5")
-	html_str = program_run.plot_iq().to_html()
-	##################################################################
-	# Save IQ demodulated data as HTML file
-	##################################################################
-	with open("downconvertor_iq.html","w", encoding='utf-8') as f:
-	    f.write(html_str)
-	    f.close()
+	planner = SweepPlanner(
+	    [
+	        SweepAxis(amplitude, amplitudes),
+	        SweepAxis(phase, phases)
+	    ],
+	    max_points = max_points
+	)
+	##################################################################
+	# Only traces are acquired (hw_demod = False), so IQ of every point
+	# is demodulated on host with the integration filter while the next
+	# batch is executed. M5201 downconverter LO is subtracted.
+	##################################################################
+	demodulator = IQDemodulator(iq_pulse_dig, lo_frequency = 9.286 * GHz)
+	def demodulate(point: dict) -> dict:
+	    return {
+	        name[:-len("trace")] + "iq": demodulator.demodulate(value)
+	        for name, value in point.items() if name.endswith("/trace")
+	    }
+	# Guard with __main__ since the report process imports this module on Windows
+	if __name__ == "__main__":
+	    backend = qcs.HclBackend( 
+	        channel_mapper  =mapper,
+	        init_time       =0.001,
+	        hw_demod        =False,
+	        # Phase should be reseted before each shot to get
+	        # correct IQ demodulated data.
+	        reset_phase_every_shot=True
+	    )
+	    ##################################################################
+	    # Execute the program and save the results
+	    ##################################################################
+	    executor = qcs.Executor(backend)
+	    ##################################################################
+	    # IQ demodulated data of every batch is sent to background process
+	    # and saved as HTML file, so that next batch is executed while it is
+	    # rendered. The report is finished at interpreter exit.
+	    ##################################################################
+	    reporter = IQReporter()
+	    with ResultSink("downconvertor.hdf5") as sink:
+	        stream_batches(
+	            sink, planner.batches(), build_program, executor.execute,
+	            derive = demodulate,
+	            on_batch = lambda batch, points: reporter.submit_points(points, "downconvertor_iq.html")
+	        )
 	
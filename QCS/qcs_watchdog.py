@@ -0,0 +1,248 @@
+"""Program state watchdog and fast abort for QCS backends"""
+import time
+import threading
+import keysight.qcs as qcs
+from datetime import datetime
+from typing import Any, Callable, Dict, List, Optional
+
+# Keys of the start time of a program in its execution history entry
+START_KEYS = ("start_time", "started_at", "start_timestamp", "start")
+#################################################################
+# Program record
+#################################################################
+def start_time(
+    entry: Dict[str, Any]
+) -> Optional[float]:
+    """
+    Start time (epoch [s]) of a program from its execution history entry.
+    Numbers, datetime and ISO format strings are accepted.
+    """
+    for key in START_KEYS:
+        value = entry.get(key)
+        if value is None:
+            continue
+        if isinstance(value, datetime):
+            return value.timestamp()
+        if isinstance(value, (int, float)):
+            return float(value)
+        try:
+            return datetime.fromisoformat(str(value)).timestamp()
+        except ValueError:
+            continue
+    return None
+
+class ProgramRecord:
+    """
+    Runtime information of one program seen by the watchdog.
+    Runtime counts from started_at, the start time reported by the backend,
+    or from the first poll which saw the program running if the backend
+    does not report it.
+    """
+    def __init__(
+        self,
+        accession_id: Any,
+        state: str,
+        n_shots: Optional[int] = None,
+        max_runtime_s: Optional[float] = None,
+        started_at: Optional[float] = None
+    ):
+        self.accession_id   = accession_id
+        self.state          = state
+        self.n_shots        = n_shots
+        self.max_runtime_s  = max_runtime_s
+        self.first_seen     = time.time()
+        self.started_at     = started_at if started_at is not None else self.first_seen
+        self.last_seen      = self.first_seen
+        self.finished_at    = None
+        self.aborted        = False
+        self.abort_reason   = None
+
+    @property
+    def runtime_s(self) -> float:
+        end = self.finished_at if self.finished_at is not None else self.last_seen
+        return end - self.started_at
+
+    @property
+    def shots_per_s(self) -> Optional[float]:
+        """
+        Throughput of finished program (registered n_shots over observed runtime)
+        """
+        if (
+            self.n_shots is None or self.finished_at is None
+            or self.aborted or self.runtime_s <= 0
+        ):
+            return None
+        return self.n_shots / self.runtime_s
+
+    def __repr__(self) -> str:
+        return (
+            f"ProgramRecord({self.accession_id}, {self.state}, "
+            f"runtime={self.runtime_s:.1f} s, shots/s={self.shots_per_s})"
+        )
+#################################################################
+# Watchdog
+#################################################################
+class ProgramWatchdog:
+    """
+    Poll state of the latest program at poll_interval_s and abort it when
+    it runs longer than its wall time budget or when one of budgets returns
+    True. Execution history is cached for history_ttl_s, so polling does
+    not query the whole history every time.
+    """
+    def __init__(
+        self,
+        backend: Optional[qcs.HclBackend] = None,
+        poll_interval_s: float = 1.0,
+        history_ttl_s: float = 10.0,
+        max_runtime_s: Optional[float] = None,
+        budgets: Optional[List[Callable[[ProgramRecord], bool]]] = None,
+        verbose: bool = True
+    ):
+        # Dummy mapper is enough to query and abort programs
+        self.backend            = backend or qcs.HclBackend(qcs.ChannelMapper())
+        self.poll_interval_s    = poll_interval_s
+        self.history_ttl_s      = history_ttl_s
+        self.max_runtime_s      = max_runtime_s
+        self.budgets            = budgets or []
+        self.verbose            = verbose
+        self.records: Dict[Any, ProgramRecord] = {}
+        self._history           = None
+        self._history_at        = 0.0
+        self._pending           = {}
+        self._lock              = threading.Lock()
+        self._stop              = threading.Event()
+        self._thread            = None
+
+    def history(
+        self,
+        refresh: bool = False
+    ) -> List[Dict[str, Any]]:
+        now = time.monotonic()
+        if refresh or self._history is None or now - self._history_at > self.history_ttl_s:
+            self._history = self.backend.get_program_execution_history()
+            self._history_at = now
+        return self._history
+
+    def latest_id(
+        self,
+        refresh: bool = False
+    ) -> Optional[Any]:
+        history = self.history(refresh)
+        return history[0]["accession_id"] if history else None
+
+    def _started_at(
+        self,
+        acc_id: Any
+    ) -> Optional[float]:
+        for entry in self.history():
+            if entry["accession_id"] == acc_id:
+                return start_time(entry)
+        return None
+
+    def register_next(
+        self,
+        n_shots: Optional[int] = None,
+        max_runtime_s: Optional[float] = None
+    ) -> None:
+        """
+        Set shots and wall time budget of the next program which is seen running
+        """
+        self._pending = {"n_shots": n_shots, "max_runtime_s": max_runtime_s}
+
+    def poll_once(self) -> Optional[ProgramRecord]:
+        """
+        Update state of latest program, and abort it if it is over budget
+        """
+        with self._lock:
+            # New program is seen at the latest history_ttl_s after it starts,
+            # or at the next poll while a registered program is expected
+            acc_id = self.latest_id(refresh = bool(self._pending))
+            if acc_id is None:
+                return None
+            record = self.records.get(acc_id)
+            if record is not None and record.finished_at is not None:
+                return record
+            state = self.backend.get_program_state(acc_id)
+            if record is None:
+                if state != "Running":
+                    return None
+                record = ProgramRecord(acc_id, state, started_at = self._started_at(acc_id), **self._pending)
+                self._pending = {}
+                self.records[acc_id] = record
+            record.state = state
+            record.last_seen = time.time()
+            if state != "Running":
+                if record.finished_at is None:
+                    record.finished_at = record.last_seen
+                return record
+            reason = self._over_budget(record)
+            if reason is not None:
+                self._abort(record, reason)
+            return record
+
+    def _over_budget(
+        self,
+        record: ProgramRecord
+    ) -> Optional[str]:
+        max_runtime_s = record.max_runtime_s if record.max_runtime_s is not None else self.max_runtime_s
+        if max_runtime_s is not None and record.runtime_s > max_runtime_s:
+            return f"runtime {record.runtime_s:.1f} s > {max_runtime_s:.1f} s"
+        for budget in self.budgets:
+            if budget(record):
+                return getattr(budget, "__name__", "budget")
+        return None
+
+    def _abort(
+        self,
+        record: ProgramRecord,
+        reason: str
+    ) -> None:
+        self.backend.abort_program(record.accession_id)
+        record.aborted      = True
+        record.abort_reason = reason
+        record.state        = self.backend.get_program_state(record.accession_id)
+        record.finished_at  = time.time()
+        if self.verbose:
+            print(f"Aborted program {record.accession_id} : {reason}")
+
+    def abort_running(self) -> bool:
+        """
+        Abort latest program if it is running. Returns True if aborted.
+        """
+        with self._lock:
+            acc_id = self.latest_id(refresh = True)
+            if acc_id is None or self.backend.get_program_state(acc_id) != "Running":
+                return False
+            record = self.records.setdefault(
+                acc_id, ProgramRecord(acc_id, "Running", started_at = self._started_at(acc_id))
+            )
+            self._abort(record, "manual abort")
+            return True
+
+    def _run(self) -> None:
+        while not self._stop.is_set():
+            try:
+                self.poll_once()
+            except Exception as e:
+                if self.verbose:
+                    print(f"Watchdog poll failed : {e}")
+            self._stop.wait(self.poll_interval_s)
+
+    def start(self) -> "ProgramWatchdog":
+        if self._thread is None or not self._thread.is_alive():
+            self._stop.clear()
+            self._thread = threading.Thread(target = self._run, name = "qcs-watchdog", daemon = True)
+            self._thread.start()
+        return self
+
+    def stop(self) -> None:
+        self._stop.set()
+        if self._thread is not None:
+            self._thread.join()
+            self._thread = None
+
+    def __enter__(self) -> "ProgramWatchdog":
+        return self.start()
+
+    def __exit__(self, *exc) -> None:
+        self.stop()
@@ -0,0 +1,198 @@
+"""
+Persistent on-disk cache of sampled QCS waveforms for the offline backend.
+keysight.qcs samples and uploads waveforms itself and has no hook to skip
+that, so this cache only speeds up the offline simulator (qcs_offline.py,
+qcs_benchmark.py --cache). It does not change hardware runs.
+"""
+import os
+import time
+import hashlib
+import numpy as np
+from typing import Any, Collection, Dict, Hashable, Optional, Tuple
+
+from qcs_demod import envelope_spec, envelope_samples
+
+SAMPLE_RATE = 4.8e9             # M5200 digitizer / M5300 AWG sample rate [Sa/s]
+# Per user, outside of the working directory (and the repository)
+DEFAULT_DIRECTORY = os.path.join(
+    os.environ.get("XDG_CACHE_HOME") or os.path.join(os.path.expanduser("~"), ".cache"),
+    "qcs_waveform_cache"
+)
+#################################################################
+# Waveform key
+#################################################################
+def _number(
+    value: Any,
+    constants: Collection[str] = ()
+) -> float:
+    """
+    Number of a waveform parameter. qcs.Scalar is a variable which can be
+    swept, so its current value is not a valid key, and it raises TypeError
+    unless its name is in constants. Expressions always raise TypeError.
+    """
+    if isinstance(value, (int, float, np.number)):
+        return float(value)
+    if getattr(value, "name", None) in constants and isinstance(getattr(value, "value", None), (int, float, np.number)):
+        return float(value.value)
+    raise TypeError(f"Waveform parameter {value!r} is not a constant number")
+
+def waveform_key(
+    waveform: Any,
+    sample_rate: float = SAMPLE_RATE,
+    lo_frequency: float = 0.0,
+    constants: Collection[str] = ()
+) -> Tuple[Hashable, ...]:
+    """
+    (type, envelope, duration, amplitude, frequency, phase, sample rate) of
+    RFWaveform or DCWaveform. Raises TypeError if the waveform cannot be
+    cached, i.e. a parameter is a qcs.Scalar which is not named in
+    constants, or an expression.
+    """
+    name = type(waveform).__name__
+    if name not in ("RFWaveform", "DCWaveform"):
+        raise TypeError(f"{name} is not cached")
+    if name == "RFWaveform":
+        frequency = _number(waveform.rf_frequency, constants) - lo_frequency
+        phase = _number(getattr(waveform, "instantaneous_phase", 0.0) or 0.0, constants)
+    else:
+        frequency, phase = 0.0, 0.0
+    return (
+        name,
+        envelope_spec(waveform.envelope),
+        round(_number(waveform.duration, constants), 15),
+        _number(waveform.amplitude, constants),
+        frequency,
+        phase,
+        float(sample_rate),
+    )
+
+def sample_key(
+    key: Tuple[Hashable, ...]
+) -> np.ndarray:
+    """
+    Samples of waveform described by waveform_key. RF waveforms are sampled
+    at rf_frequency - lo_frequency, with phase relative to waveform start.
+    """
+    _, envelope, duration, amplitude, frequency, phase, sample_rate = key
+    n_samples = int(round(duration * sample_rate))
+    t = np.arange(n_samples) / sample_rate
+    samples = amplitude * envelope_samples(envelope, t / duration)
+    if frequency != 0.0 or phase != 0.0:
+        samples = samples * np.cos(2 * np.pi * frequency * t + phase)
+    return samples
+#################################################################
+# Cache
+#################################################################
+class WaveformCache:
+    """
+    Sampled waveforms keyed by envelope type, duration, amplitude and
+    frequency. Samples are kept in memory and saved as .npy files in
+    directory, so identical segments are not sampled again in this or
+    later sessions. hits, disk_hits and misses count lookups, and
+    sample_time_s is time spent sampling missed waveforms.
+    Used by the offline HclBackend (qcs_offline.py), not by keysight.qcs.
+    directory : DEFAULT_DIRECTORY in the user cache, None keeps samples in
+                memory only
+    constants : names of qcs.Scalar which are never swept, so that
+                waveforms using them are cached at their current value
+    """
+    def __init__(
+        self,
+        directory: Optional[str] = DEFAULT_DIRECTORY,
+        sample_rate: float = SAMPLE_RATE,
+        constants: Collection[str] = ()
+    ):
+        self.directory      = os.path.abspath(directory) if directory is not None else None
+        self.sample_rate    = sample_rate
+        self.constants      = frozenset(constants)
+        self.hits           = 0
+        self.disk_hits      = 0
+        self.misses         = 0
+        self.sample_time_s  = 0.0
+        self._memory: Dict[Tuple, np.ndarray] = {}
+        if self.directory is not None:
+            os.makedirs(self.directory, exist_ok = True)
+
+    def _path(
+        self,
+        key: Tuple
+    ) -> Optional[str]:
+        if self.directory is None:
+            return None
+        digest = hashlib.sha1(repr(key).encode("utf-8")).hexdigest()
+        return os.path.join(self.directory, f"{key[0]}_{digest}.npy")
+
+    def get(
+        self,
+        waveform: Any,
+        lo_frequency: float = 0.0
+    ) -> np.ndarray:
+        """
+        Read-only samples of waveform
+        """
+        key = waveform_key(waveform, self.sample_rate, lo_frequency, self.constants)
+        samples = self._memory.get(key)
+        if samples is not None:
+            self.hits += 1
+            return samples
+        path = self._path(key)
+        if path is not None and os.path.exists(path):
+            samples = np.load(path, mmap_mode = "r")
+            self.disk_hits += 1
+        else:
+            start = time.perf_counter()
+            samples = sample_key(key)
+            self.sample_time_s += time.perf_counter() - start
+            self.misses += 1
+            if path is not None:
+                # Write to temporary file first so that readers never see half written files
+                tmp = f"{path}.{os.getpid()}.tmp.npy"
+                np.save(tmp, samples)
+                os.replace(tmp, path)
+            samples.setflags(write = False)
+        self._memory[key] = samples
+        return samples
+
+    def get_or_none(
+        self,
+        waveform: Any,
+        lo_frequency: float = 0.0
+    ) -> Optional[np.ndarray]:
+        """
+        Samples of waveform, or None if waveform cannot be cached
+        """
+        try:
+            return self.get(waveform, lo_frequency)
+        except (TypeError, ValueError, AttributeError):
+            return None
+
+    def stats(self) -> Dict[str, float]:
+        lookups = self.hits + self.disk_hits + self.misses
+        return {
+            "hits"          : self.hits,
+            "disk_hits"     : self.disk_hits,
+            "misses"        : self.misses,
+            "hit_rate"      : (self.hits + self.disk_hits) / lookups if lookups else 0.0,
+            "sample_time_s" : self.sample_time_s,
+            "entries"       : len(self._memory),
+        }
+
+    def clear(
+        self,
+        disk: bool = False
+    ) -> None:
+        """
+        Drop samples in memory, and also cached files if disk is True
+        """
+        self._memory.clear()
+        if disk and self.directory is not None:
+            for name in os.listdir(self.directory):
+                if name.endswith(".npy"):
+                    os.remove(os.path.join(self.directory, name))
+
+    def __repr__(self) -> str:
+        s = self.stats()
+        return (
+            f"WaveformCache({s['entries']} entries, hits={s['hits']}, "
+            f"disk hits={s['disk_hits']}, misses={s['misses']})"
+        )
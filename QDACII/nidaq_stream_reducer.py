@@ -0,0 +1,206 @@
+"""Streaming per-step averaging and software lock-in of NI-DAQ fast scan samples"""
+import threading
+import numpy as np
+from typing import Any, Dict, List, Optional, Sequence
+#################################################################
+# Reducer
+#################################################################
+class StepReducer:
+    """
+    Reduce sample stream of n_channels into per-step means as blocks arrive.
+    Step k is samples [k * samples_per_step, (k + 1) * samples_per_step) of
+    the stream. Only running sums of steps are kept, never the raw samples.
+    reference_hz : if given, software lock-in I/Q against cos/sin of this
+                   frequency is also computed per step. Phase is continuous
+                   over the whole stream (time 0 is the first sample).
+    skip         : samples at the start of every step which are not averaged
+                   (settling after QDAC-II step)
+    """
+    def __init__(
+        self,
+        n_channels: int,
+        samples_per_step: int,
+        n_steps: int,
+        sample_rate: float,
+        reference_hz: Optional[float] = None,
+        skip: int = 0
+    ):
+        if not 0 <= skip < samples_per_step:
+            raise ValueError("skip should be smaller than samples_per_step")
+        self.n_channels         = n_channels
+        self.samples_per_step   = samples_per_step
+        self.n_steps            = n_steps
+        self.sample_rate        = sample_rate
+        self.reference_hz       = reference_hz
+        self.skip               = skip
+        self._lock              = threading.Lock()
+        self.reset()
+
+    def reset(self) -> None:
+        self.n_samples  = 0
+        self._sum       = np.zeros((self.n_channels, self.n_steps))
+        self._count     = np.zeros(self.n_steps, dtype = np.int64)
+        self._iq        = np.zeros((self.n_channels, self.n_steps), dtype = complex) if self.reference_hz else None
+
+    @property
+    def total_samples(self) -> int:
+        return self.samples_per_step * self.n_steps
+
+    @property
+    def done(self) -> bool:
+        return self.n_samples >= self.total_samples
+
+    def feed(
+        self,
+        block: np.ndarray
+    ) -> None:
+        """
+        Add block (n_channels, n) of the stream. Samples after the last step
+        are ignored.
+        """
+        block = np.asarray(block, dtype = np.float64).reshape(self.n_channels, -1)
+        with self._lock:
+            n = min(block.shape[1], self.total_samples - self.n_samples)
+            if n <= 0:
+                return
+            block = block[:, :n]
+            index = self.n_samples + np.arange(n)
+            steps = index // self.samples_per_step
+            keep = (index % self.samples_per_step) >= self.skip
+            first = steps[0]
+            # Steps in this block are contiguous, so bincount on local step index
+            local = (steps - first)[keep]
+            n_local = int(steps[-1] - first + 1)
+            sl = slice(first, first + n_local)
+            self._count[sl] += np.bincount(local, minlength = n_local)
+            kept = block[:, keep]
+            for ch in range(self.n_channels):
+                self._sum[ch, sl] += np.bincount(local, weights = kept[ch], minlength = n_local)
+            if self._iq is not None:
+                t = index[keep] / self.sample_rate
+                ref = np.exp(-2j * np.pi * self.reference_hz * t)
+                for ch in range(self.n_channels):
+                    prod = kept[ch] * ref
+                    self._iq[ch, sl] += (
+                        np.bincount(local, weights = prod.real, minlength = n_local)
+                        + 1j * np.bincount(local, weights = prod.imag, minlength = n_local)
+                    )
+            self.n_samples += n
+
+    def means(self) -> np.ndarray:
+        """
+        (n_channels, n_steps) mean of every step, NaN for steps without samples
+        """
+        with self._lock:
+            count = np.where(self._count > 0, self._count, np.nan)
+            return self._sum / count
+
+    def lockin(self) -> np.ndarray:
+        """
+        (n_channels, n_steps) complex lock-in amplitude of every step.
+        |value| is amplitude of the tone at reference_hz.
+        """
+        if self._iq is None:
+            raise RuntimeError("reference_hz is not set")
+        with self._lock:
+            count = np.where(self._count > 0, self._count, np.nan)
+            return 2 * self._iq / count
+
+    def result(
+        self,
+        names: Sequence[str]
+    ) -> Dict[str, np.ndarray]:
+        """
+        {name : (n_steps,)} of means, and {name}_X / {name}_Y of lock-in
+        """
+        means = self.means()
+        out = {name: means[k] for k, name in enumerate(names)}
+        if self._iq is not None:
+            iq = self.lockin()
+            for k, name in enumerate(names):
+                out[f"{name}_X"] = iq[k].real
+                out[f"{name}_Y"] = iq[k].imag
+        return out
+#################################################################
+# NI-DAQ streaming task
+#################################################################
+class StreamingAcquisition:
+    """
+    Triggered NI-DAQ task which hands every block_size samples per channel
+    to StepReducer from the every-N-samples callback, so that the raw
+    buffer of one fast scan is never held. Needs nidaqmx.
+    trigger_source : PFI terminal of the QDAC-II trigger, which starts the task
+    """
+    def __init__(
+        self,
+        ai_chans: Dict[str, str],
+        sample_rate: float,
+        trigger_source: str,
+        v_min: float = -1.0,
+        v_max: float = 1.0,
+        block_size: int = 1000,
+        reference_hz: Optional[float] = None,
+        skip: int = 0
+    ):
+        self.ai_chans       = dict(ai_chans)
+        self.sample_rate    = sample_rate
+        self.trigger_source = trigger_source
+        self.v_min          = v_min
+        self.v_max          = v_max
+        self.block_size     = block_size
+        self.reference_hz   = reference_hz
+        self.skip           = skip
+
+    def acquire(
+        self,
+        sweep: Any,
+        samples_per_step: int,
+        n_steps: int,
+        timeout_s: float = 10.0
+    ) -> Dict[str, np.ndarray]:
+        """
+        Arm the task, start QDAC-II sweep, and return reduced line
+        {name : (n_steps,)}
+        """
+        import nidaqmx
+        from nidaqmx.constants import AcquisitionType
+        from nidaqmx.stream_readers import AnalogMultiChannelReader
+
+        n_channels = len(self.ai_chans)
+        reducer = StepReducer(n_channels, samples_per_step, n_steps, self.sample_rate, self.reference_hz, self.skip)
+        total = reducer.total_samples
+        block_size = min(self.block_size, total)
+        buffer = np.empty((n_channels, block_size))
+        finished = threading.Event()
+        errors: List[BaseException] = []
+
+        with nidaqmx.Task() as task:
+            for chan in self.ai_chans.values():
+                task.ai_channels.add_ai_voltage_chan(chan, min_val = self.v_min, max_val = self.v_max)
+            # Buffer of whole scan is rounded up to block_size, extra samples are ignored
+            n_buffer = -(-total // block_size) * block_size
+            task.timing.cfg_samp_clk_timing(
+                self.sample_rate, sample_mode = AcquisitionType.FINITE, samps_per_chan = n_buffer
+            )
+            task.triggers.start_trigger.cfg_dig_edge_start_trig(self.trigger_source)
+            reader = AnalogMultiChannelReader(task.in_stream)
+
+            def callback(task_handle, event_type, n_samples, callback_data):
+                try:
+                    reader.read_many_sample(buffer, number_of_samples_per_channel = block_size, timeout = 0)
+                    reducer.feed(buffer)
+                    if reducer.done:
+                        finished.set()
+                except BaseException as e:
+                    errors.append(e)
+                    finished.set()
+                return 0
+
+            task.register_every_n_samples_acquired_into_buffer_event(block_size, callback)
+            task.start()
+            sweep.start()
+            if not finished.wait(timeout_s):
+                raise TimeoutError(f"{reducer.n_samples}/{total} samples acquired in {timeout_s} s")
+        if errors:
+            raise errors[0]
+        return reducer.result(list(self.ai_chans))
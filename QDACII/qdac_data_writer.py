@@ -0,0 +1,181 @@
+"""Background qcodes DataSaver writer and array grid exporter for QDAC sweeps"""
+import os
+import json
+import queue
+import threading
+import numpy as np
+from typing import Any, Dict, List, Optional, Sequence, Tuple
+#################################################################
+# Background writer
+#################################################################
+_STOP = object()
+
+class BackgroundDataWriter:
+    """
+    Drop-in for datasaver.add_result which returns immediately. Results are
+    put in a bounded queue (add_result blocks only when maxsize results are
+    waiting), and a writer thread inserts up to batch_size results with one
+    datasaver.add_result call. close() writes the rest and flushes the
+    database. Errors of the writer thread are raised by the next add_result
+    or close.
+    """
+    def __init__(
+        self,
+        datasaver: Any,
+        maxsize: int = 16,
+        batch_size: int = 4
+    ):
+        self.datasaver      = datasaver
+        self.batch_size     = batch_size
+        self.n_written      = 0
+        self._queue         = queue.Queue(maxsize = maxsize)
+        self._error: Optional[BaseException] = None
+        self._thread        = threading.Thread(target = self._run, name = "qdac-writer", daemon = True)
+        self._thread.start()
+
+    def _raise(self) -> None:
+        if self._error is not None:
+            error, self._error = self._error, None
+            raise error
+
+    def add_result(
+        self,
+        *res_tuples: Tuple[Any, Any]
+    ) -> None:
+        self._raise()
+        if not self._thread.is_alive():
+            raise RuntimeError("Writer is closed")
+        self._queue.put(res_tuples)
+
+    def _write(
+        self,
+        batch: List[Tuple[Tuple[Any, Any], ...]]
+    ) -> None:
+        """
+        Concatenate values of each parameter over the batch into one insert
+        """
+        if not batch:
+            return
+        params = [param for param, _ in batch[0]]
+        values = [
+            np.concatenate([np.ravel(result[k][1]) for result in batch])
+            for k in range(len(params))
+        ]
+        self.datasaver.add_result(*zip(params, values))
+        self.n_written += len(batch)
+
+    def _run(self) -> None:
+        stop = False
+        while not stop:
+            batch = [self._queue.get()]
+            while len(batch) < self.batch_size:
+                try:
+                    batch.append(self._queue.get_nowait())
+                except queue.Empty:
+                    break
+            if batch[-1] is _STOP:
+                batch.pop()
+                stop = True
+            # Any error is kept for the caller and the thread keeps draining
+            # the queue, so that close() never waits on a dead thread
+            try:
+                # Results with different parameters cannot be merged into one insert
+                groups: List[List] = []
+                for result in batch:
+                    key = [id(param) for param, _ in result]
+                    if groups and [id(param) for param, _ in groups[-1][0]] == key:
+                        groups[-1].append(result)
+                    else:
+                        groups.append([result])
+                for group in groups:
+                    self._write(group)
+            except BaseException as e:
+                self._error = e
+
+    def close(self) -> None:
+        if self._thread.is_alive():
+            self._queue.put(_STOP)
+            self._thread.join()
+            flush = getattr(self.datasaver, "flush_data_to_database", None)
+            if flush is not None:
+                flush(block = True)
+        self._raise()
+
+    def __enter__(self) -> "BackgroundDataWriter":
+        return self
+
+    def __exit__(self, *exc) -> None:
+        self.close()
+#################################################################
+# Grid exporter
+#################################################################
+class GridExporter:
+    """
+    Write 2D grids {name : (slow_steps, fast_steps)} straight into .npy
+    files in directory as lines arrive, for fast replotting with load_grids.
+    If I and Q are given, amplitude and phase [deg] grids are written too.
+    add_line has the on_line signature of ChargeStabilitySweep.run.
+    """
+    def __init__(
+        self,
+        directory: str,
+        slow_vs: Sequence[float],
+        fast_vs: Sequence[float],
+        names: Sequence[str],
+        metadata: Optional[Dict[str, Any]] = None,
+        iq: Tuple[str, str] = ("I", "Q")
+    ):
+        os.makedirs(directory, exist_ok = True)
+        self.directory  = directory
+        self.iq         = iq if iq[0] in names and iq[1] in names else None
+        names           = list(names) + (["amp", "phase"] if self.iq else [])
+        shape           = (len(slow_vs), len(fast_vs))
+        self.grids: Dict[str, np.ndarray] = {}
+        for name in names:
+            grid = np.lib.format.open_memmap(
+                os.path.join(directory, f"{name}.npy"), mode = "w+", dtype = np.float64, shape = shape
+            )
+            grid[:] = np.nan
+            self.grids[name] = grid
+        np.save(os.path.join(directory, "slow_vs.npy"), np.asarray(slow_vs, dtype = float))
+        np.save(os.path.join(directory, "fast_vs.npy"), np.asarray(fast_vs, dtype = float))
+        with open(os.path.join(directory, "metadata.json"), "w", encoding = "utf-8") as f:
+            json.dump({"names": names, "shape": shape, **(metadata or {})}, f)
+
+    def add_line(
+        self,
+        index: int,
+        slow_v: float,
+        line: Dict[str, np.ndarray]
+    ) -> None:
+        for name, values in line.items():
+            if name in self.grids:
+                self.grids[name][index] = values
+        if self.iq is not None:
+            z = np.asarray(line[self.iq[0]]) + 1j * np.asarray(line[self.iq[1]])
+            self.grids["amp"][index] = np.abs(z)
+            self.grids["phase"][index] = np.angle(z, deg = True)
+
+    def flush(self) -> None:
+        for grid in self.grids.values():
+            grid.flush()
+
+    def close(self) -> None:
+        self.flush()
+        self.grids = {}
+
+def load_grids(
+    directory: str,
+    mmap: bool = True
+) -> Dict[str, np.ndarray]:
+    """
+    {name : grid, "slow_vs", "fast_vs"} written by GridExporter. Grids can be
+    loaded while the sweep is running.
+    """
+    with open(os.path.join(directory, "metadata.json"), "r", encoding = "utf-8") as f:
+        names = json.load(f)["names"]
+    mode = "r" if mmap else None
+    out = {name: np.load(os.path.join(directory, f"{name}.npy"), mmap_mode = mode) for name in names}
+    out["slow_vs"] = np.load(os.path.join(directory, "slow_vs.npy"))
+    out["fast_vs"] = np.load(os.path.join(directory, "fast_vs.npy"))
+    return out
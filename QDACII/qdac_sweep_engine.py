@@ -0,0 +1,237 @@
+"""Hardware triggered 2D charge stability sweep with QDAC-II and NI-DAQ"""
+import time
+import numpy as np
+from concurrent.futures import Future, ThreadPoolExecutor
+from typing import Any, Callable, Dict, List, Optional, Sequence
+#################################################################
+# Sweep engine
+#################################################################
+class ChargeStabilitySweep:
+    """
+    2D sweep of slow_chans x fast_chans. Fast axis is stepped by QDAC-II,
+    which triggers NI-DAQ at every step, and all AI channels (e.g. I and Q)
+    are read in one multi-channel task.
+    Line mode   : slow axis is ramped from Python. While one fast scan is
+                  reshaped and handed to on_line in a worker thread, the
+                  next slow step is ramped and the next scan is acquired.
+    Raster mode : whole 2D raster is uploaded as one QDAC-II list
+                  (virtual_sweep2d) and read in one NI-DAQ task, so the map
+                  takes about the pure dwell time. Only one slow and one fast
+                  contact are supported, and the slow axis steps without ramp.
+    ai_chans : {result name : AI channel}, e.g. {"I": "Dev2/ai0", "Q": "Dev2/ai1"}
+    stream   : StreamingAcquisition (nidaq_stream_reducer.py). If given, samples
+               are reduced per step while they are acquired instead of
+               reading the raw buffer and calling daq.reshape_array.
+    """
+    def __init__(
+        self,
+        qdac2: Any,
+        daq: Any,
+        contacts: Dict[str, int],
+        slow_chans: List[str],
+        fast_chans: List[str],
+        slow_vs: Sequence[float],
+        fast_vs: Sequence[float],
+        ai_chans: Dict[str, str],
+        fast_step_time_s: float,
+        trigger_port: int = 5,
+        v_min: float = -1.0,
+        v_max: float = 1.0,
+        timeout_margin_s: float = 1.0,
+        raster: bool = False,
+        stream: Any = None
+    ):
+        if raster and (len(slow_chans) != 1 or len(fast_chans) != 1):
+            raise ValueError("Raster mode supports one slow and one fast contact")
+        self.qdac2              = qdac2
+        self.daq                = daq
+        self.contacts           = contacts
+        self.slow_chans         = list(slow_chans)
+        self.fast_chans         = list(fast_chans)
+        self.slow_vs            = np.asarray(slow_vs, dtype = float)
+        self.fast_vs            = np.asarray(fast_vs, dtype = float)
+        self.ai_chans           = dict(ai_chans)
+        self.fast_step_time_s   = fast_step_time_s
+        self.trigger_port       = trigger_port
+        self.v_min              = v_min
+        self.v_max              = v_max
+        self.timeout_margin_s   = timeout_margin_s
+        self.raster             = raster
+        self.stream             = stream
+        self.line_times_s: List[float] = []
+        for v in (self.slow_vs.min(), self.slow_vs.max(), self.fast_vs.min(), self.fast_vs.max()):
+            qdac2.validate_voltages([v])
+
+    @property
+    def fast_steps(self) -> int:
+        return len(self.fast_vs)
+
+    @property
+    def samples_per_step(self) -> int:
+        """
+        Samples per fast step per channel. Channels share max sampling rate.
+        """
+        if self.stream is not None:
+            return int(self.fast_step_time_s * self.stream.sample_rate)
+        return int(self.fast_step_time_s * self.daq.max_sampling_rate / len(self.ai_chans))
+
+    @property
+    def samples_per_line(self) -> int:
+        return self.fast_steps * self.samples_per_step
+
+    @property
+    def dwell_time_s(self) -> float:
+        """
+        Pure dwell time of the whole map
+        """
+        return len(self.slow_vs) * self.fast_steps * self.fast_step_time_s
+
+    def _arrange(
+        self,
+        chans: List[str]
+    ) -> Any:
+        return self.qdac2.arrange(
+            contacts        = {x: self.contacts[x] for x in chans},
+            output_triggers = {"NIDAQ": self.trigger_port}
+        )
+
+    def _fast_sweep(self) -> Any:
+        """
+        Fast scan, built once and restarted for every slow step
+        """
+        return self._arrange(self.fast_chans).virtual_detune(
+            contacts    = tuple(self.fast_chans),
+            start_V     = (self.fast_vs[0],) * len(self.fast_chans),
+            end_V       = (self.fast_vs[-1],) * len(self.fast_chans),
+            steps       = self.fast_steps,
+            step_trigger= "NIDAQ",
+            step_time_s = self.fast_step_time_s,
+            repetitions = 1
+        )
+
+    def _raster_sweep(self) -> Any:
+        return self._arrange(self.slow_chans + self.fast_chans).virtual_sweep2d(
+            inner_contact       = self.fast_chans[0],
+            inner_voltages      = self.fast_vs,
+            outer_contact       = self.slow_chans[0],
+            outer_voltages      = self.slow_vs,
+            inner_step_trigger  = "NIDAQ",
+            inner_step_time_s   = self.fast_step_time_s,
+            inner_repetitions   = 1
+        )
+
+    def _read(
+        self,
+        sweep: Any,
+        n_samples: int
+    ) -> Any:
+        """
+        (n_channels, n_samples) of all AI channels in one task, or reduced
+        {name : (n_steps,)} if stream is given
+        """
+        n_steps = n_samples // self.samples_per_step
+        timeout = n_steps * self.fast_step_time_s + self.timeout_margin_s
+        if self.stream is not None:
+            return self.stream.acquire(sweep, self.samples_per_step, n_steps, timeout)
+        return np.atleast_2d(self.daq.read_triggered_multi_channels(
+            sweep, list(self.ai_chans.values()), n_samples, self.v_min, self.v_max, timeout
+        ))
+
+    def _reduce(
+        self,
+        raw: Any
+    ) -> Dict[str, np.ndarray]:
+        """
+        Raw samples of one line into {result name : (fast_steps,)}
+        """
+        if isinstance(raw, dict):
+            return raw
+        return {name: self.daq.reshape_array(raw[k], self.fast_steps) for k, name in enumerate(self.ai_chans)}
+
+    def _handle(
+        self,
+        index: int,
+        raw: np.ndarray,
+        maps: Dict[str, np.ndarray],
+        on_line: Optional[Callable[[int, float, Dict[str, np.ndarray]], None]]
+    ) -> None:
+        line = self._reduce(raw)
+        for name, values in line.items():
+            maps[name][index] = values
+        if on_line is not None:
+            on_line(index, self.slow_vs[index], line)
+
+    def run(
+        self,
+        on_line: Optional[Callable[[int, float, Dict[str, np.ndarray]], None]] = None,
+        progress: bool = True
+    ) -> Dict[str, np.ndarray]:
+        """
+        Acquire the map. on_line(slow index, slow voltage, {name : line}) is
+        called in order for every slow step (e.g. datasaver.add_result).
+        Returns {result name : (slow_steps, fast_steps)}.
+        """
+        names = list(self.ai_chans)
+        if self.stream is not None and self.stream.reference_hz:
+            names += [f"{name}_{part}" for name in self.ai_chans for part in ("X", "Y")]
+        maps = {name: np.full((len(self.slow_vs), self.fast_steps), np.nan) for name in names}
+        self.line_times_s = []
+        start_time = time.perf_counter()
+        if self.raster:
+            raw = self._read(self._raster_sweep(), self.samples_per_line * len(self.slow_vs))
+            for i in range(len(self.slow_vs)):
+                if isinstance(raw, dict):
+                    row = {name: v[i * self.fast_steps:(i + 1) * self.fast_steps] for name, v in raw.items()}
+                else:
+                    row = raw[:, i * self.samples_per_line:(i + 1) * self.samples_per_line]
+                self._handle(i, row, maps, on_line)
+            self.line_times_s.append(time.perf_counter() - start_time)
+        else:
+            sweep = self._fast_sweep()
+            pending: List[Future] = []
+            # One worker keeps on_line calls in slow axis order
+            with ThreadPoolExecutor(max_workers = 1) as pool:
+                for i, slow_v in enumerate(self.slow_vs):
+                    line_start = time.perf_counter()
+                    self.qdac2.ramp_channels(self.slow_chans, [slow_v] * len(self.slow_chans))
+                    raw = self._read(sweep, self.samples_per_line)
+                    pending.append(pool.submit(self._handle, i, raw, maps, on_line))
+                    self.line_times_s.append(time.perf_counter() - line_start)
+                    if progress:
+                        print(
+                            f"Time elapsed: {np.round(time.perf_counter() - start_time, 2)} sec. "
+                            f"Loop finished: {i + 1}/{len(self.slow_vs)}."
+                        )
+                for f in pending:
+                    f.result()
+        elapsed = time.perf_counter() - start_time
+        if progress:
+            print(
+                f"Time elapsed: {np.round(elapsed, 2)} sec. "
+                f"Dwell time: {np.round(self.dwell_time_s, 2)} sec "
+                f"({100 * self.dwell_time_s / elapsed:.0f} %)."
+            )
+        return maps
+#################################################################
+# qcodes saving
+#################################################################
+def qcodes_line_saver(
+    datasaver: Any,
+    slow_param: Any,
+    fast_param: Any,
+    params: Dict[str, Any],
+    fast_vs: Sequence[float]
+) -> Callable[[int, float, Dict[str, np.ndarray]], None]:
+    """
+    on_line callback which adds every line to qcodes datasaver.
+    params : {result name : qcodes Parameter}, results without parameter are not saved
+    """
+    fast_vs = np.asarray(fast_vs)
+
+    def on_line(index: int, slow_v: float, line: Dict[str, np.ndarray]) -> None:
+        datasaver.add_result(
+            (slow_param, [slow_v] * len(fast_vs)),
+            (fast_param, fast_vs),
+            *[(params[name], values) for name, values in line.items() if name in params]
+        )
+    return on_line
@@ -6,7 +6,6 @@ and we get all trace data from DRAM and average it in software.
 Note that data trace data should not exceed 4 GB and virtual memory allocated
 for RPC Server in RFSoC (I don't know how can we estimate virtual memory allocation...).
 """
-import numpy as np
 import math
 import matplotlib.pyplot as plt
 import time
@@ -14,6 +13,8 @@ import time
 from qick import *
 from qick.pyro import make_proxy
 
+from ddr4_capture import DDR4Capture
+
 class MultiPulseLoopBackExample(AveragerProgram):
     def initialize(self):
         # set the nyquist zone
@@ -112,18 +113,15 @@ if __name__ == "__main__":
         cfg
     )
     LEN = int(3360 / 4 * 3)
-    nt = int(LEN  * cfg["reps"] / 128)
+    # nt is sized from LEN and reps, and DDR4 is read in bounded pages
+    capture = DDR4Capture(soc, soccfg, samples_per_shot = LEN, shots = cfg["reps"], ch = 0)
     start_time = time.time()
-    soc.clear_ddr4()
-    soc.arm_ddr4(ch = 0, nt = nt, )
+    capture.arm()
     print(prog)
     prog.run_rounds(soc = soc)
-    data = soc.get_ddr4(nt = nt, start = 0)
     mean_start_time = time.time()
-    data = np.array([data[i][0] for i in range(len(data))])
-    print(len(data))
-    data = data[:(len(data) // LEN) * LEN]
-    data = data.reshape(-1,LEN).mean(axis=0)
+    data = capture.average()[:, 0]
+    print(capture.nt)
     mean_end_time = time.time()
 
     plt.figure()
@@ -132,6 +130,6 @@ if __name__ == "__main__":
 
     print(prog)
 
-    print("Acquisition Time: %.3f s, Mean Time: %.3f s"%(
+    print("Acquisition Time: %.3f s, Read and Mean Time: %.3f s"%(
         mean_start_time - start_time, mean_end_time - mean_start_time
     ))
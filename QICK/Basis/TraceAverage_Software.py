@@ -15,6 +15,8 @@ import time
 from qick import *
 from qick.pyro import make_proxy
 
+from bulk_transfer import BulkClient, BulkSoc
+
 class MultiPulseLoopBackExample(AveragerProgram):
     def initialize(self):
         # set the nyquist zone
@@ -88,6 +90,11 @@ class MultiPulseLoopBackExample(AveragerProgram):
 if __name__ == "__main__":
     # Qick version : 0.2.357
     (soc, soccfg) = make_proxy("192.168.2.99")
+    # Read buffers through bulk transfer server if it is running on the board
+    try:
+        soc = BulkSoc(soc, BulkClient("192.168.2.99"))
+    except OSError:
+        print("Bulk transfer server is not running, buffers are read through Pyro")
 
     # Set DAC Channel 0 attenuation 31 dB and 31 dB, and turn on DAC channel
     soc.rfb_set_gen_rf(0,31,31)
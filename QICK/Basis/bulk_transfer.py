@@ -0,0 +1,385 @@
+"""
+Binary bulk transfer of QICK readout buffers.
+Buffers read through the Pyro proxy of make_proxy are serialized by Pyro and
+converted back to arrays by the scripts (np.array([data[i][0] ...])).
+BulkServer runs on the board in the Pyro server process (start_with_pyro)
+and sends buffers of the same QickSoc as raw contiguous bytes over a
+side-channel TCP socket, and BulkSoc on the PC turns them into arrays with
+np.frombuffer. All other calls still go through Pyro.
+Like the Pyro server, the socket has no authentication, so it is bound to
+the board interface which faces the PC network, never to all interfaces.
+"""
+import json
+import time
+import struct
+import socket
+import argparse
+import threading
+import socketserver
+import numpy as np
+from typing import Any, Dict, Optional, Sequence, Tuple
+
+BULK_PORT       = 8889
+BULK_METHODS    = ("get_ddr4", "get_decimated", "get_accumulated")
+_MAGIC          = b"QBT1"
+_HEADER         = struct.Struct("<4sBI")    # magic, status, length of dtype or error
+_OK, _ERROR     = 0, 1
+#################################################################
+# Wire format
+#################################################################
+def _recv_exact(
+    sock: socket.socket,
+    n: int
+) -> bytearray:
+    buf = bytearray(n)
+    view = memoryview(buf)
+    got = 0
+    while got < n:
+        k = sock.recv_into(view[got:], n - got)
+        if k == 0:
+            raise ConnectionError("Connection closed")
+        got += k
+    return buf
+
+def _send_message(
+    sock: socket.socket,
+    message: Dict[str, Any]
+) -> None:
+    data = json.dumps(message).encode("utf-8")
+    sock.sendall(struct.pack("<I", len(data)) + data)
+
+def _recv_message(
+    sock: socket.socket
+) -> Dict[str, Any]:
+    (n,) = struct.unpack("<I", _recv_exact(sock, 4))
+    return json.loads(_recv_exact(sock, n).decode("utf-8"))
+
+def send_array(
+    sock: socket.socket,
+    array: np.ndarray
+) -> None:
+    """
+    Header (dtype, shape) followed by raw bytes of array, without copying
+    if array is already contiguous
+    """
+    array = np.ascontiguousarray(array)
+    dtype = array.dtype.str.encode("ascii")
+    header = _HEADER.pack(_MAGIC, _OK, len(dtype)) + dtype
+    header += struct.pack(f"<I{array.ndim}Q", array.ndim, *array.shape)
+    sock.sendall(header)
+    if array.nbytes:
+        sock.sendall(memoryview(array).cast("B"))
+
+def _send_error(
+    sock: socket.socket,
+    error: BaseException
+) -> None:
+    message = f"{type(error).__name__}: {error}".encode("utf-8")
+    sock.sendall(_HEADER.pack(_MAGIC, _ERROR, len(message)) + message)
+
+def recv_array(
+    sock: socket.socket
+) -> np.ndarray:
+    magic, status, n = _HEADER.unpack(_recv_exact(sock, _HEADER.size))
+    if magic != _MAGIC:
+        raise ConnectionError("Unexpected bulk transfer header")
+    if status == _ERROR:
+        raise RuntimeError(_recv_exact(sock, n).decode("utf-8"))
+    dtype = np.dtype(_recv_exact(sock, n).decode("ascii"))
+    (ndim,) = struct.unpack("<I", _recv_exact(sock, 4))
+    shape = struct.unpack(f"<{ndim}Q", _recv_exact(sock, 8 * ndim))
+    nbytes = int(np.prod(shape, dtype = np.int64)) * dtype.itemsize
+    return np.frombuffer(_recv_exact(sock, nbytes), dtype = dtype).reshape(shape)
+#################################################################
+# Board side
+#################################################################
+def board_address(
+    peer: Optional[str] = None
+) -> str:
+    """
+    IPv4 address of the board interface which faces peer (e.g. Pyro name
+    server). If peer is not given or is on the board, address of eth0 as in
+    qick.pyro.start_server, and loopback if it is not found.
+    """
+    if peer is not None:
+        with socket.socket(socket.AF_INET, socket.SOCK_DGRAM) as s:
+            s.connect((peer, 1))
+            host = s.getsockname()[0]
+        if not host.startswith("127."):
+            return host
+    try:
+        import psutil
+    except ImportError:
+        psutil = None
+    if psutil is not None:
+        for name, addrs in sorted(psutil.net_if_addrs().items(), key = lambda item: item[0] != "eth0"):
+            addrs_v4 = [addr.address for addr in addrs if addr.family == socket.AF_INET]
+            if name.startswith("eth0") and len(addrs_v4) == 1:
+                return addrs_v4[0]
+    print("Board interface is not found, bulk transfer server is bound to loopback")
+    return "127.0.0.1"
+
+class _Handler(socketserver.BaseRequestHandler):
+    def handle(self) -> None:
+        sock = self.request
+        sock.setsockopt(socket.IPPROTO_TCP, socket.TCP_NODELAY, 1)
+        while True:
+            try:
+                request = _recv_message(sock)
+            except ConnectionError:
+                return
+            try:
+                method = request["method"]
+                if method not in self.server.methods:
+                    raise AttributeError(f"{method} is not a bulk method")
+                result = getattr(self.server.soc, method)(*request.get("args", []), **request.get("kwargs", {}))
+                send_array(sock, np.asarray(result))
+            except Exception as e:
+                _send_error(sock, e)
+
+class BulkServer(socketserver.ThreadingTCPServer):
+    """
+    Serve buffer methods of soc on port. It must run in the process which
+    owns QickSoc, i.e. the Pyro server (see start_with_pyro).
+    host : bind address, board_address() if None
+    """
+    daemon_threads      = True
+    allow_reuse_address = True
+
+    def __init__(
+        self,
+        soc: Any,
+        host: Optional[str] = None,
+        port: int = BULK_PORT,
+        methods: Sequence[str] = BULK_METHODS
+    ):
+        super().__init__((host or board_address(), port), _Handler)
+        self.soc        = soc
+        self.methods    = set(methods)
+        self._thread: Optional[threading.Thread] = None
+
+    def start(self) -> "BulkServer":
+        self._thread = threading.Thread(target = self.serve_forever, name = "qick-bulk", daemon = True)
+        self._thread.start()
+        return self
+
+    def close(self) -> None:
+        if self._thread is not None:
+            self.shutdown()
+            self._thread.join()
+            self._thread = None
+        self.server_close()
+
+def start_with_pyro(
+    ns_host: str,
+    ns_port: int = 8888,
+    proxy_name: str = "myqick",
+    port: int = BULK_PORT,
+    soc: Any = None,
+    **kwargs
+) -> None:
+    """
+    Pyro server of qick.pyro.start_server with BulkServer of the same soc.
+    Both are bound to the board interface which faces the name server.
+    soc is QickSoc(**kwargs) if it is not given. Blocks in daemon.requestLoop().
+    """
+    import Pyro4
+
+    Pyro4.config.REQUIRE_EXPOSE = False
+    Pyro4.config.SERIALIZER = "pickle"
+    Pyro4.config.SERIALIZERS_ACCEPTED = set(["pickle"])
+    Pyro4.config.PICKLE_PROTOCOL_VERSION = 4
+
+    print("looking for nameserver . . .")
+    ns = Pyro4.locateNS(host = ns_host, port = ns_port)
+    print("found nameserver")
+    host = board_address(ns._pyroUri.host)
+    daemon = Pyro4.Daemon(host = host)
+
+    if soc is None:
+        from qick import QickSoc
+        soc = QickSoc(**kwargs)
+    print("initialized QICK")
+    ns.register(proxy_name, daemon.register(soc))
+    for obj in getattr(soc, "autoproxy", []):
+        daemon.register(obj)
+    print("registered QICK")
+
+    server = BulkServer(soc, host = host, port = port).start()
+    print(f"Bulk transfer server on {host}:{port}")
+    try:
+        daemon.requestLoop()
+    finally:
+        server.close()
+        daemon.close()
+#################################################################
+# PC side
+#################################################################
+class BulkClient:
+    """
+    Persistent connection to BulkServer. Calls are serialized by a lock.
+    """
+    def __init__(
+        self,
+        host: str,
+        port: int = BULK_PORT,
+        timeout_s: Optional[float] = 30.0
+    ):
+        self.host   = host
+        self.port   = port
+        self._sock  = socket.create_connection((host, port), timeout = timeout_s)
+        self._sock.setsockopt(socket.IPPROTO_TCP, socket.TCP_NODELAY, 1)
+        self._lock  = threading.Lock()
+
+    def call(
+        self,
+        method: str,
+        *args,
+        **kwargs
+    ) -> np.ndarray:
+        with self._lock:
+            _send_message(self._sock, {"method": method, "args": list(args), "kwargs": kwargs})
+            return recv_array(self._sock)
+
+    def close(self) -> None:
+        self._sock.close()
+
+class BulkSoc:
+    """
+    Pyro soc proxy whose buffer methods go through BulkClient, so that
+    programs use the fast path with no change, e.g.
+        (soc, soccfg) = make_proxy("192.168.2.99")
+        soc = BulkSoc(soc, BulkClient("192.168.2.99"))
+        data = prog.acquire_decimated(soc = soc)
+    """
+    def __init__(
+        self,
+        soc: Any,
+        client: BulkClient,
+        methods: Sequence[str] = BULK_METHODS
+    ):
+        self._soc       = soc
+        self._client    = client
+        self._methods   = set(methods)
+
+    def __getattr__(
+        self,
+        name: str
+    ) -> Any:
+        if name in self._methods:
+            return lambda *args, **kwargs: self._client.call(name, *args, **kwargs)
+        return getattr(self._soc, name)
+#################################################################
+# Loopback benchmark
+#################################################################
+class LoopbackSoc:
+    """
+    Stand-in of QickSoc buffer methods with int16 I/Q data.
+    as_list emulates a server which returns buffers as Python lists.
+    """
+    def __init__(
+        self,
+        as_list: bool = False
+    ):
+        self.as_list = as_list
+        self._buffer = np.random.default_rng(0).integers(-2**15, 2**15, (2**24, 2), dtype = np.int16)
+
+    def _out(
+        self,
+        data: np.ndarray
+    ) -> Any:
+        return data.tolist() if self.as_list else data
+
+    def get_ddr4(self, nt: int, start: int = 0) -> Any:
+        return self._out(self._buffer[start * 128:(start + nt) * 128])
+
+    def get_decimated(self, ch: int, address: int = 0, length: Optional[int] = None) -> Any:
+        return self._out(self._buffer[address:address + (length or 1024)])
+
+    def get_accumulated(self, ch: int, address: int = 0, length: Optional[int] = None) -> Any:
+        return self._out(self._buffer[address:address + (length or 1024)].astype(np.int64))
+
+def _pyro_proxy(
+    soc: Any,
+    serializer: str
+) -> Tuple[Any, Any]:
+    """
+    Pyro4 daemon serving soc on loopback, with same config as qick.pyro
+    """
+    import Pyro4
+
+    Pyro4.config.REQUIRE_EXPOSE = False
+    Pyro4.config.SERIALIZER = serializer
+    Pyro4.config.SERIALIZERS_ACCEPTED = set(["pickle", "serpent"])
+    Pyro4.config.PICKLE_PROTOCOL_VERSION = 4
+    daemon = Pyro4.Daemon(host = "127.0.0.1")
+    uri = daemon.register(soc)
+    threading.Thread(target = daemon.requestLoop, daemon = True).start()
+    return Pyro4.Proxy(uri), daemon
+
+def benchmark(
+    nt_list: Sequence[int] = (16, 256, 4096),
+    repeat: int = 5,
+    serializer: str = "pickle"
+) -> Dict[str, Dict[int, float]]:
+    """
+    Best get_ddr4 time [s] for each nt of
+        pyro-array : Pyro with array result (np.asarray on PC)
+        pyro-list  : Pyro with list result (np.array on PC, as in scripts)
+        bulk       : BulkServer / BulkClient
+    Needs Pyro4 for the Pyro paths.
+    """
+    results: Dict[str, Dict[int, float]] = {}
+    paths = {}
+    daemons = []
+    try:
+        for label, as_list in (("pyro-array", False), ("pyro-list", True)):
+            proxy, daemon = _pyro_proxy(LoopbackSoc(as_list), serializer)
+            daemons.append(daemon)
+            paths[label] = lambda nt, proxy = proxy: np.asarray(proxy.get_ddr4(nt = nt, start = 0))
+    except ImportError:
+        print("Pyro4 is not installed, only bulk path is measured")
+    server = BulkServer(LoopbackSoc(), host = "127.0.0.1", port = 0).start()
+    client = BulkClient("127.0.0.1", server.server_address[1])
+    paths["bulk"] = lambda nt: client.call("get_ddr4", nt = nt, start = 0)
+    try:
+        for label, fetch in paths.items():
+            results[label] = {}
+            for nt in nt_list:
+                best = np.inf
+                for _ in range(repeat):
+                    start = time.perf_counter()
+                    data = fetch(nt)
+                    best = min(best, time.perf_counter() - start)
+                assert data.shape == (nt * 128, 2)
+                results[label][nt] = best
+    finally:
+        client.close()
+        server.close()
+        for daemon in daemons:
+            daemon.shutdown()
+    return results
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description = "QICK bulk transfer server / loopback benchmark")
+    sub = parser.add_subparsers(dest = "command", required = True)
+    serve = sub.add_parser("serve", help = "run Pyro and bulk transfer server on the board")
+    serve.add_argument("--ns-host", required = True, help = "Pyro name server")
+    serve.add_argument("--ns-port", type = int, default = 8888)
+    serve.add_argument("--proxy-name", default = "myqick")
+    serve.add_argument("--port", type = int, default = BULK_PORT)
+    bench = sub.add_parser("bench", help = "loopback benchmark against Pyro")
+    bench.add_argument("--nt", type = int, nargs = "+", default = [16, 256, 4096])
+    bench.add_argument("--repeat", type = int, default = 5)
+    bench.add_argument("--serializer", default = "pickle")
+    args = parser.parse_args()
+
+    if args.command == "serve":
+        start_with_pyro(args.ns_host, args.ns_port, args.proxy_name, args.port)
+    else:
+        results = benchmark(args.nt, args.repeat, args.serializer)
+        for label, times in results.items():
+            row = ", ".join(
+                f"nt {nt}: {t * 1e3:.2f} ms ({nt * 128 * 4 / t / 1e6:.0f} MB/s)" for nt, t in times.items()
+            )
+            print(f"{label:10s} : {row}")
@@ -0,0 +1,159 @@
+"""
+DDR4 capture manager.
+TraceAverage_DRAMBuffer.py and TraceNoiseTest.ipynb size the capture with
+nt = int(LEN * reps / 128) and read it with a single soc.get_ddr4 call,
+which has to fit in the RPC server memory on the board and in one Pyro
+message. DDR4Capture computes nt from readout length and reps, checks it
+against the DDR4 buffer, and reads the capture in pages of bounded size.
+"""
+import math
+import numpy as np
+from typing import Any, Iterator, Optional, Tuple
+
+SAMPLES_PER_TRANSACTION = 128           # samples of one DDR4 transaction (nt unit)
+BYTES_PER_SAMPLE        = 4             # I and Q, int16 each
+DDR4_BYTES              = 4 * 2**30     # 4 GB DDR4 buffer
+#################################################################
+# Sizing
+#################################################################
+def transactions(
+    n_samples: int
+) -> int:
+    """
+    Number of transactions (nt) which holds n_samples. Rounded up, so that
+    the last samples are not cut off as with int(n_samples / 128).
+    """
+    return math.ceil(n_samples / SAMPLES_PER_TRANSACTION)
+
+def buffer_transactions(
+    soccfg: Any = None
+) -> int:
+    """
+    Transactions which fit in DDR4 buffer. Taken from soccfg["ddr4_buf"]
+    if the firmware reports it, else from 4 GB.
+    """
+    try:
+        return int(soccfg["ddr4_buf"]["maxlen"]) // SAMPLES_PER_TRANSACTION
+    except (KeyError, TypeError):
+        return DDR4_BYTES // (BYTES_PER_SAMPLE * SAMPLES_PER_TRANSACTION)
+
+def program_shots(
+    prog: Any
+) -> int:
+    """
+    Number of readout triggers written to DDR4 by prog.run_rounds
+    """
+    cfg = prog.cfg
+    return int(cfg.get("reps", 1)) * int(cfg.get("soft_avgs", 1))
+#################################################################
+# Capture
+#################################################################
+class DDR4Capture:
+    """
+    Arm, run and read one DDR4 capture of shots x samples_per_shot samples.
+    page_bytes bounds the size of one soc.get_ddr4 call, which is the memory
+    of one RPC response on the board and of one Pyro message.
+        capture = DDR4Capture(soc, soccfg, samples_per_shot = LEN, shots = cfg["reps"])
+        capture.arm()
+        prog.run_rounds(soc = soc)
+        trace = capture.average()
+    """
+    def __init__(
+        self,
+        soc: Any,
+        soccfg: Any,
+        samples_per_shot: int,
+        shots: int = 1,
+        ch: int = 0,
+        page_bytes: int = 64 * 2**20
+    ):
+        self.soc                = soc
+        self.soccfg             = soccfg
+        self.samples_per_shot   = int(samples_per_shot)
+        self.shots              = int(shots)
+        self.ch                 = ch
+        self.nt                 = transactions(self.samples_per_shot * self.shots)
+        self.page_nt            = max(1, page_bytes // (BYTES_PER_SAMPLE * SAMPLES_PER_TRANSACTION))
+        max_nt = buffer_transactions(soccfg)
+        if self.nt > max_nt:
+            raise ValueError(
+                f"Capture of {self.shots} x {self.samples_per_shot} samples needs {self.nt} transactions, "
+                f"DDR4 buffer holds {max_nt} ({max_nt // max(1, transactions(self.samples_per_shot))} shots)"
+            )
+
+    @classmethod
+    def for_program(
+        cls,
+        soc: Any,
+        soccfg: Any,
+        prog: Any,
+        samples_per_shot: Optional[int] = None,
+        ch: int = 0,
+        **kwargs
+    ) -> "DDR4Capture":
+        """
+        Capture sized from prog : shots from reps x soft_avgs, and
+        samples_per_shot from readout length of ch if it is not given
+        """
+        if samples_per_shot is None:
+            samples_per_shot = prog.ro_chs[ch]["length"]
+        return cls(soc, soccfg, samples_per_shot, program_shots(prog), ch, **kwargs)
+
+    @property
+    def n_samples(self) -> int:
+        return self.nt * SAMPLES_PER_TRANSACTION
+
+    @property
+    def nbytes(self) -> int:
+        return self.n_samples * BYTES_PER_SAMPLE
+
+    def arm(self) -> None:
+        self.soc.clear_ddr4()
+        self.soc.arm_ddr4(ch = self.ch, nt = self.nt)
+
+    def pages(self) -> Iterator[Tuple[int, np.ndarray]]:
+        """
+        (first sample index, (n, 2) int array of I and Q) of every page
+        """
+        for start in range(0, self.nt, self.page_nt):
+            nt = min(self.page_nt, self.nt - start)
+            page = np.asarray(self.soc.get_ddr4(nt = nt, start = start))
+            yield start * SAMPLES_PER_TRANSACTION, page.reshape(-1, 2)
+
+    def read(self) -> np.ndarray:
+        """
+        Whole capture as (shots * samples_per_shot, 2) array, filled page by page
+        """
+        n = self.samples_per_shot * self.shots
+        out = None
+        for first, page in self.pages():
+            if first >= n:
+                break
+            if out is None:
+                out = np.empty((n, 2), dtype = page.dtype)
+            page = page[:n - first]
+            out[first:first + len(page)] = page
+        return out
+
+    def average(self) -> np.ndarray:
+        """
+        (samples_per_shot, 2) mean over shots, accumulated page by page so
+        that the whole capture is never held on the host
+        """
+        total = np.zeros((self.samples_per_shot, 2))
+        n = self.samples_per_shot * self.shots
+        for first, page in self.pages():
+            if first >= n:
+                break
+            page = page[:n - first]
+            pos = first % self.samples_per_shot
+            # Samples until the next shot boundary
+            head = min(len(page), (self.samples_per_shot - pos) % self.samples_per_shot)
+            total[pos:pos + head] += page[:head]
+            rest = page[head:]
+            n_full = len(rest) // self.samples_per_shot
+            if n_full:
+                total += rest[:n_full * self.samples_per_shot].reshape(n_full, -1, 2).sum(axis = 0)
+            tail = rest[n_full * self.samples_per_shot:]
+            total[:len(tail)] += tail
+        return total / self.shots
@@ -0,0 +1,187 @@
+"""
+Duration x frequency analysis of Frequency_Time_Sweep.ipynb results.
+Flat avgi / avgq of Sweep_Freq_Time_Exp are mapped onto (duration, frequency)
+grid from the program config (frequency is the inner loop stepped by
+update(), duration the outer loop). Magnitude, unwrapped phase and linear
+fits of every row and column are computed for the whole grid at once.
+"""
+import numpy as np
+from typing import Any, Dict, Optional, Tuple
+#################################################################
+# Vectorized fits
+#################################################################
+def linear_fit(
+    x: np.ndarray,
+    y: np.ndarray,
+    axis: int = -1
+) -> Dict[str, np.ndarray]:
+    """
+    Least squares y = slope * x + intercept along axis for all other
+    indices at once. Returns slope, intercept and r2.
+    """
+    y = np.moveaxis(np.asarray(y, dtype = np.float64), axis, -1)
+    x = np.asarray(x, dtype = np.float64)
+    xm = x - x.mean()
+    ym = y - y.mean(axis = -1, keepdims = True)
+    sxx = (xm**2).sum()
+    slope = (ym * xm).sum(axis = -1) / sxx
+    intercept = y.mean(axis = -1) - slope * x.mean()
+    ss_res = ((ym - slope[..., np.newaxis] * xm)**2).sum(axis = -1)
+    ss_tot = (ym**2).sum(axis = -1)
+    with np.errstate(divide = "ignore", invalid = "ignore"):
+        r2 = np.where(ss_tot > 0, 1 - ss_res / ss_tot, 1.0)
+    return {"slope": slope, "intercept": intercept, "r2": r2}
+
+def peak_parabolic(
+    x: np.ndarray,
+    y: np.ndarray,
+    axis: int = -1
+) -> Dict[str, np.ndarray]:
+    """
+    Position and height of maximum along axis, refined by parabola through
+    the maximum and its neighbours. x should be evenly spaced.
+    """
+    y = np.moveaxis(np.asarray(y, dtype = np.float64), axis, -1)
+    x = np.asarray(x, dtype = np.float64)
+    n = y.shape[-1]
+    k = np.argmax(y, axis = -1)
+    kc = np.clip(k, 1, n - 2)
+    y0 = np.take_along_axis(y, (kc - 1)[..., np.newaxis], -1)[..., 0]
+    y1 = np.take_along_axis(y, kc[..., np.newaxis], -1)[..., 0]
+    y2 = np.take_along_axis(y, (kc + 1)[..., np.newaxis], -1)[..., 0]
+    denom = y0 - 2 * y1 + y2
+    with np.errstate(divide = "ignore", invalid = "ignore"):
+        delta = np.where(denom < 0, 0.5 * (y0 - y2) / denom, 0.0)
+    # Maximum on the edge is not refined
+    delta = np.where(k == kc, delta, 0.0)
+    dx = x[1] - x[0] if n > 1 else 0.0
+    y_max = np.take_along_axis(y, k[..., np.newaxis], -1)[..., 0]
+    return {
+        "position"  : x[k] + delta * dx,
+        "height"    : np.where(k == kc, y1 - 0.25 * (y0 - y2) * delta, y_max),
+    }
+#################################################################
+# Grid
+#################################################################
+class FreqTimeGrid:
+    """
+    Axes of Sweep_Freq_Time_Exp from cfg
+        frequency [MHz] : start + step * arange(inner_loop)
+        duration [cycles] : duration_start + duration_step * arange(expts // inner_loop)
+    cycles2us : e.g. soccfg.cycles2us, to give duration_us axis as well
+    """
+    def __init__(
+        self,
+        cfg: Dict[str, Any],
+        cycles2us: Optional[Any] = None
+    ):
+        n_freq = int(cfg["inner_loop"])
+        self.n_expts    = int(cfg["expts"])
+        if self.n_expts % n_freq:
+            raise ValueError(f"expts {self.n_expts} is not a multiple of inner_loop {n_freq}")
+        n_duration = self.n_expts // n_freq
+        self.freq       = cfg["start"] + cfg["step"] * np.arange(n_freq)
+        self.duration   = cfg["duration_start"] + cfg["duration_step"] * np.arange(n_duration)
+        self.duration_us = np.array([cycles2us(int(d)) for d in self.duration]) if cycles2us else None
+
+    @property
+    def shape(self) -> Tuple[int, int]:
+        return (len(self.duration), len(self.freq))
+
+    def to_grid(
+        self,
+        data: Any,
+        ro_index: int = 0
+    ) -> np.ndarray:
+        """
+        (duration, frequency) grid of acquire() output. Leading readout
+        axes of avgi / avgq (channel, readout) are flattened and ro_index
+        is taken.
+        """
+        flat = np.asarray(data).reshape(-1, self.n_expts)[ro_index]
+        return flat.reshape(self.shape)
+
+    def analyze(
+        self,
+        avgi: Any,
+        avgq: Any,
+        ro_index: int = 0
+    ) -> Dict[str, Any]:
+        return analyze_grid(self, self.to_grid(avgi, ro_index) + 1j * self.to_grid(avgq, ro_index))
+
+def analyze_grid(
+    grid: FreqTimeGrid,
+    iq: np.ndarray
+) -> Dict[str, Any]:
+    """
+    iq     : complex (duration, frequency)
+    mag    : |I + jQ|
+    phase  : phase [deg] unwrapped along frequency
+    rows   : per duration, linear fit of phase vs frequency (slope [deg/MHz],
+             electrical delay [us] = -slope / 360) and magnitude peak
+    cols   : per frequency, linear fit of magnitude vs duration
+    """
+    mag = np.abs(iq)
+    phase = np.degrees(np.unwrap(np.angle(iq), axis = 1))
+    rows = linear_fit(grid.freq, phase, axis = 1)
+    rows["delay_us"] = -rows["slope"] / 360
+    peak = peak_parabolic(grid.freq, mag, axis = 1)
+    rows["peak_freq"] = peak["position"]
+    rows["peak_mag"] = peak["height"]
+    cols = linear_fit(grid.duration, mag, axis = 0)
+    return {
+        "freq"      : grid.freq,
+        "duration"  : grid.duration,
+        "iq"        : iq,
+        "mag"       : mag,
+        "phase"     : phase,
+        "rows"      : rows,
+        "cols"      : cols,
+    }
+#################################################################
+# Incremental update
+#################################################################
+class IncrementalFreqTime:
+    """
+    Running mean of rounds which arrive one by one, e.g. repeated
+    prog.acquire() with soft_avgs = 1, with analysis of the current mean.
+    Analysis is recomputed only when new data was added since last call.
+    """
+    def __init__(
+        self,
+        grid: FreqTimeGrid,
+        ro_index: int = 0
+    ):
+        self.grid       = grid
+        self.ro_index   = ro_index
+        self.n_rounds   = 0
+        self._sum       = np.zeros(grid.shape, dtype = complex)
+        self._weight    = 0.0
+        self._result: Optional[Dict[str, Any]] = None
+
+    def add_round(
+        self,
+        avgi: Any,
+        avgq: Any,
+        weight: float = 1.0
+    ) -> None:
+        """
+        weight : e.g. reps of the round when rounds have different reps
+        """
+        iq = self.grid.to_grid(avgi, self.ro_index) + 1j * self.grid.to_grid(avgq, self.ro_index)
+        self._sum += weight * iq
+        self._weight += weight
+        self.n_rounds += 1
+        self._result = None
+
+    @property
+    def mean(self) -> np.ndarray:
+        if self._weight == 0:
+            raise RuntimeError("No round is added")
+        return self._sum / self._weight
+
+    def result(self) -> Dict[str, Any]:
+        if self._result is None:
+            self._result = analyze_grid(self.grid, self.mean)
+            self._result["n_rounds"] = self.n_rounds
+        return self._result
@@ -0,0 +1,243 @@
+"""
+Resumable attenuator x frequency x gain calibration sweep.
+GainPowerMap.ipynb keeps results in a dict and dumps JSON only at the end of
+each attenuator block. CalibrationSweep appends each point to JSON lines log
+as soon as it is measured, skips points which are already in the log when it
+is restarted, and orders points so that slow instrument changes happen least
+often (attenuator, then frequency, then gain). Next QICK program is built in a
+worker thread while the oscilloscope reads current point.
+"""
+import os
+import json
+import time
+import itertools
+from concurrent.futures import ThreadPoolExecutor
+from typing import Any, Callable, Dict, Iterator, List, Optional, Sequence, Tuple
+
+from scope_power_meter import ScopePowerMeter
+
+Point = Tuple[float, float, float, int]     # (att1, att2, freq, gain)
+
+#################################################################
+# Point ordering
+#################################################################
+def attenuator_pairs(
+    attenuations: Sequence[float]
+) -> List[Tuple[float, float]]:
+    """
+    (att1, 0) for all attenuations followed by (0, att2), same as GainPowerMap.ipynb
+    """
+    pairs = [(float(att), 0.0) for att in attenuations]
+    pairs += [(0.0, float(att)) for att in attenuations if (0.0, float(att)) not in pairs]
+    return pairs
+
+def sweep_points(
+    att_pairs: Sequence[Tuple[float, float]],
+    frequencies: Sequence[float],
+    gains: Sequence[int]
+) -> Iterator[Point]:
+    """
+    Attenuator is outermost (slowest) and gain is innermost (fastest) axis
+    """
+    for (att1, att2), freq, gain in itertools.product(att_pairs, frequencies, gains):
+        yield (float(att1), float(att2), float(freq), int(gain))
+
+def _key(
+    point: Point
+) -> Tuple[float, float, float, int]:
+    att1, att2, freq, gain = point
+    return (round(att1, 6), round(att2, 6), round(freq, 6), int(gain))
+
+#################################################################
+# Append-only log
+#################################################################
+class PointLog:
+    """
+    JSON lines log of measured points. Each line is flushed and synced to disk
+    so that at most one point is lost on crash.
+    """
+    def __init__(
+        self,
+        path: str,
+        fsync: bool = True
+    ):
+        self.path   = path
+        self.fsync  = fsync
+        self._file  = None
+
+    def read(self) -> List[Dict[str, Any]]:
+        records = []
+        if not os.path.exists(self.path):
+            return records
+        with open(self.path, "r", encoding = "utf-8") as f:
+            for line in f:
+                try:
+                    records.append(json.loads(line))
+                except json.JSONDecodeError:
+                    # Last line can be partially written when process is killed
+                    continue
+        return records
+
+    def done(self) -> set:
+        return {
+            _key((r["att1"], r["att2"], r["freq"], r["gain"])) for r in self.read()
+        }
+
+    def append(
+        self,
+        record: Dict[str, Any]
+    ) -> None:
+        if self._file is None:
+            self._file = open(self.path, "a", encoding = "utf-8")
+            if not self._ends_with_newline():
+                # Partial last line of a killed process is closed, so that
+                # it does not merge with the next record
+                self._file.write("\n")
+        self._file.write(json.dumps(record) + "\n")
+        self._file.flush()
+        if self.fsync:
+            os.fsync(self._file.fileno())
+
+    def _ends_with_newline(self) -> bool:
+        if not os.path.exists(self.path) or os.path.getsize(self.path) == 0:
+            return True
+        with open(self.path, "rb") as f:
+            f.seek(-1, os.SEEK_END)
+            return f.read(1) == b"\n"
+
+    def close(self) -> None:
+        if self._file is not None:
+            self._file.close()
+            self._file = None
+
+    def to_power_maps(
+        self,
+        directory: str = "."
+    ) -> List[str]:
+        """
+        Write pwr_map_{att1}dB_{att2}dB.json files in GainPowerMap.ipynb format
+        """
+        maps = {}
+        for r in self.read():
+            att_map = maps.setdefault((r["att1"], r["att2"]), {})
+            att_map.setdefault(str(r["freq"]), {})[str(r["gain"])] = r["power"]
+        paths = []
+        for (att1, att2), json_data in maps.items():
+            file_name = os.path.join(directory, f"pwr_map_{att1}dB_{att2}dB.json")
+            with open(file_name, "w", encoding = "utf-8") as f:
+                json.dump(json_data, f, indent = 4, ensure_ascii = False)
+            paths.append(file_name)
+        return paths
+
+#################################################################
+# Sweep runner
+#################################################################
+class CalibrationSweep:
+    """
+    set_attenuation(att1, att2) : set DAC attenuators (e.g. soc.rfb_set_gen_rf)
+    prepare(freq, gain)         : build QICK program, returns object passed to start
+    start(prepared)             : start QICK output (e.g. prog.acquire(soc))
+    meter                       : ScopePowerMeter
+    """
+    def __init__(
+        self,
+        log_path: str,
+        set_attenuation: Callable[[float, float], Any],
+        prepare: Callable[[float, int], Any],
+        start: Callable[[Any], Any],
+        meter: ScopePowerMeter,
+        overlap: bool = True
+    ):
+        self.log                = PointLog(log_path)
+        self.set_attenuation    = set_attenuation
+        self.prepare            = prepare
+        self.start              = start
+        self.meter              = meter
+        self.overlap            = overlap
+        self._att               = None
+
+    def run(
+        self,
+        points: Sequence[Point],
+        progress: bool = True
+    ) -> int:
+        """
+        Measure points which are not in log yet. Returns number of measured points.
+        """
+        done = self.log.done()
+        todo = [p for p in points if _key(p) not in done]
+        if progress:
+            print(f"{len(done)} points are already measured, {len(todo)} points remain")
+        if not todo:
+            return 0
+
+        pool = ThreadPoolExecutor(max_workers = 1) if self.overlap else None
+        start_time = time.time()
+        try:
+            pending = self._submit(pool, todo[0])
+            for k, point in enumerate(todo):
+                att1, att2, freq, gain = point
+                prepared = pending.result() if pool else pending
+                if self._att != (att1, att2):
+                    self.set_attenuation(att1, att2)
+                    self._att = (att1, att2)
+                self.meter.set_frequency(freq)
+                self.start(prepared)
+                # Build next program while scope is settling and reading
+                if k + 1 < len(todo):
+                    pending = self._submit(pool, todo[k + 1])
+                self.meter.wait_settled()
+                power = self.meter.read_power()
+                self.log.append({
+                    "att1"  : att1,
+                    "att2"  : att2,
+                    "freq"  : freq,
+                    "gain"  : gain,
+                    "power" : power,
+                    "time"  : time.time(),
+                })
+                if progress:
+                    elapsed = time.time() - start_time
+                    print(
+                        f"\r{k + 1}/{len(todo)} att=({att1}, {att2}) dB, f={freq:.3f} MHz, "
+                        f"gain={gain} : {power:.2f} dBm ({elapsed / (k + 1):.2f} s/point)",
+                        end = ""
+                    )
+        finally:
+            if pool is not None:
+                pool.shutdown(wait = True)
+            self.log.close()
+        if progress:
+            print()
+        return len(todo)
+
+    def _submit(
+        self,
+        pool: Optional[ThreadPoolExecutor],
+        point: Point
+    ) -> Any:
+        _, _, freq, gain = point
+        if pool is None:
+            return self.prepare(freq, gain)
+        return pool.submit(self.prepare, freq, gain)
+
+if __name__ == "__main__":
+    import numpy as np
+    from scope_power_meter import FakeOscilloscope
+
+    scope = FakeOscilloscope(tau_s = 0.02, latency_s = 0.001, seed = 0)
+    meter = ScopePowerMeter(scope, settle_interval_s = 0.01, n_average = 20)
+    sweep = CalibrationSweep(
+        log_path        = "pwr_map_sweep_test.jsonl",
+        set_attenuation = lambda att1, att2: None,
+        prepare         = lambda freq, gain: (freq, gain),
+        start           = lambda prepared: scope.apply(*prepared),
+        meter           = meter,
+    )
+    points = list(sweep_points(
+        attenuator_pairs(np.linspace(0, 31.5, 3)),
+        np.linspace(500, 580, 3),
+        np.logspace(np.log10(10), np.log10(32767), 5).astype(int)
+    ))
+    sweep.run(points)
+    print(sweep.log.to_power_maps("."))
@@ -0,0 +1,229 @@
+"""
+DAC gain <-> DC voltage lookup from GainVoltageMap files.
+RFDAC_VoltageMap.ipynb saves ch{N}_gain_voltage_map_{date}.h5 with "gain" and
+"voltage" datasets. GainVoltageMap loads latest file of each channel once,
+builds monotone piecewise linear interpolant (measured voltage is noisy, so it
+is made monotone with isotonic regression), and answers vectorized
+voltage -> gain and gain -> voltage queries. Cached interpolant is rebuilt when
+newer file appears in the directory. Files of interrupted runs (attribute
+"completed" False, written by SweepRecorder) are skipped.
+"""
+import os
+import re
+import time
+import numpy as np
+import h5py
+from typing import Union, Dict, Optional, Sequence, Tuple
+
+ArrayLike = Union[float, Sequence[float], np.ndarray]
+
+FILE_PATTERN = re.compile(
+    r"^ch(\d+)_gain_voltage_map_(\d{4}-\d{2}-\d{2}_\d{2}_\d{2}_\d{2})\.h5$"
+)
+
+#################################################################
+# Interpolant
+#################################################################
+def _isotonic(
+    y: np.ndarray
+) -> np.ndarray:
+    """
+    Non-decreasing least squares fit of y (pool adjacent violators)
+    """
+    means, weights = [], []
+    for value in y:
+        means.append(float(value))
+        weights.append(1)
+        while len(means) > 1 and means[-2] > means[-1]:
+            w = weights[-2] + weights[-1]
+            means[-2] = (means[-2] * weights[-2] + means[-1] * weights[-1]) / w
+            weights[-2] = w
+            means.pop()
+            weights.pop()
+    return np.repeat(means, weights)
+
+class MonotoneInterpolant:
+    """
+    Monotone piecewise linear map between gain and voltage of one channel
+    """
+    def __init__(
+        self,
+        gain: np.ndarray,
+        voltage: np.ndarray,
+        path: Optional[str] = None
+    ):
+        order       = np.argsort(gain)
+        gain        = np.asarray(gain, dtype = np.float64)[order]
+        voltage     = np.asarray(voltage, dtype = np.float64)[order]
+        sign        = 1.0 if voltage[-1] >= voltage[0] else -1.0
+        voltage     = sign * _isotonic(sign * voltage)
+        self.path   = path
+        self.gain   = gain
+        self.voltage= voltage
+        # Flat segments of isotonic fit are merged to their center so that
+        # inverse map is strictly monotone
+        v_unique, inverse = np.unique(voltage, return_inverse = True)
+        g_center = np.bincount(inverse, weights = gain) / np.bincount(inverse)
+        self._v_axis = v_unique
+        self._g_axis = g_center
+
+    @property
+    def voltage_range(self) -> Tuple[float, float]:
+        return (float(self._v_axis[0]), float(self._v_axis[-1]))
+
+    def gain_to_voltage(
+        self,
+        gain: ArrayLike
+    ) -> np.ndarray:
+        return np.interp(np.asarray(gain, dtype = np.float64), self.gain, self.voltage)
+
+    def voltage_to_gain(
+        self,
+        voltage: ArrayLike,
+        clip: bool = False,
+        as_int: bool = True
+    ) -> np.ndarray:
+        """
+        Gain which outputs voltage. Voltage outside of calibrated range raises
+        ValueError unless clip is True.
+        """
+        voltage = np.asarray(voltage, dtype = np.float64)
+        v_min, v_max = self.voltage_range
+        if not clip and (np.any(voltage < v_min) or np.any(voltage > v_max)):
+            raise ValueError(
+                f"Voltage is out of calibrated range [{v_min:.4f}, {v_max:.4f}] V"
+            )
+        gain = np.interp(voltage, self._v_axis, self._g_axis)
+        if as_int:
+            return np.rint(gain).astype(np.int64)
+        return gain
+
+def is_completed(
+    path: str
+) -> bool:
+    """
+    False for files of interrupted runs. Files without the attribute
+    (one-shot dump of RFDAC_VoltageMap.ipynb) are complete.
+    """
+    with h5py.File(path, "r") as f:
+        return bool(f.attrs.get("completed", True))
+
+def load_interpolant(
+    path: str,
+    require_completed: bool = True
+) -> MonotoneInterpolant:
+    """
+    Only the first "n_points" points are used if the file has the attribute.
+    Interrupted run raises ValueError unless require_completed is False.
+    """
+    with h5py.File(path, "r") as f:
+        if require_completed and not bool(f.attrs.get("completed", True)):
+            raise ValueError(f"{path} is from an interrupted run")
+        n_points = int(f.attrs.get("n_points", -1))
+        n = slice(None) if n_points < 0 else slice(0, n_points)
+        return MonotoneInterpolant(f["gain"][n], f["voltage"][n], path = path)
+
+#################################################################
+# Cached lookup service
+#################################################################
+class GainVoltageMap:
+    """
+    Cached per-channel gain <-> voltage lookup.
+    directory is scanned for newer files at most once per check_interval_s,
+    so queries in tight sweep loops do not touch file system.
+    """
+    def __init__(
+        self,
+        directory: str = "./GainVoltageMap",
+        check_interval_s: float = 5.0
+    ):
+        self.directory          = directory
+        self.check_interval_s   = check_interval_s
+        self._latest            = {}
+        self._completed         = {}
+        self._interpolants      = {}
+        self._checked_at        = None
+
+    def latest_files(
+        self,
+        refresh: bool = False
+    ) -> Dict[int, str]:
+        """
+        Return {channel : latest file path of a completed run}
+        """
+        now = time.monotonic()
+        if (
+            refresh
+            or self._checked_at is None
+            or now - self._checked_at >= self.check_interval_s
+        ):
+            candidates = {}
+            with os.scandir(self.directory) as it:
+                for entry in it:
+                    match = FILE_PATTERN.match(entry.name)
+                    if match is None:
+                        continue
+                    candidates.setdefault(int(match.group(1)), []).append((match.group(2), entry.path))
+            latest = {}
+            for ch, files in candidates.items():
+                # Date format is sortable as string
+                for _, path in sorted(files, reverse = True):
+                    if path not in self._completed:
+                        self._completed[path] = is_completed(path)
+                    if self._completed[path]:
+                        latest[ch] = path
+                        break
+            self._latest = latest
+            self._checked_at = now
+        return self._latest
+
+    def interpolant(
+        self,
+        ch: int
+    ) -> MonotoneInterpolant:
+        path = self.latest_files().get(ch)
+        if path is None:
+            raise KeyError(f"There is no gain voltage map for channel {ch} in {self.directory}")
+        cached = self._interpolants.get(ch)
+        if cached is None or cached.path != path:
+            cached = load_interpolant(path)
+            self._interpolants[ch] = cached
+        return cached
+
+    def invalidate(
+        self,
+        ch: Optional[int] = None
+    ) -> None:
+        if ch is None:
+            self._interpolants.clear()
+        else:
+            self._interpolants.pop(ch, None)
+        self._checked_at = None
+
+    def voltage_to_gain(
+        self,
+        ch: int,
+        voltage: ArrayLike,
+        clip: bool = False,
+        as_int: bool = True
+    ) -> np.ndarray:
+        return self.interpolant(ch).voltage_to_gain(voltage, clip = clip, as_int = as_int)
+
+    def gain_to_voltage(
+        self,
+        ch: int,
+        gain: ArrayLike
+    ) -> np.ndarray:
+        return self.interpolant(ch).gain_to_voltage(gain)
+
+if __name__ == "__main__":
+    gv_map = GainVoltageMap("./GainVoltageMap")
+    print(gv_map.latest_files())
+    for ch in gv_map.latest_files():
+        print(f"ch{ch} : {gv_map.interpolant(ch).voltage_range} V")
+    voltages = np.linspace(-0.5, 0.5, 100000)
+    start_time = time.time()
+    gains = gv_map.voltage_to_gain(1, voltages)
+    end_time = time.time()
+    print(f"{len(gains)} points : {(end_time - start_time) * 1e3:.2f} ms")
+    print(gains[::20000], gv_map.gain_to_voltage(1, gains[::20000]))
@@ -0,0 +1,264 @@
+"""
+Array backed power-gain calibration table.
+PowerGainMap/pwr_map_{att1}dB_{att2}dB.json files are nested dicts
+{freq : {gain : power [dBm]}} keyed by stringified floats. ingest() converts
+them into one (attenuation x frequency x gain) power grid and saves it as
+HDF5 with contiguous datasets, so PowerGainTable.load() can memory-map it
+instead of parsing JSON. PowerGainTable converts output power to DAC gain
+(and vice versa) for many points with vectorized interpolation.
+"""
+import os
+import re
+import glob
+import json
+import numpy as np
+import h5py
+from typing import Union, Dict, List, Optional, Tuple, Sequence
+
+ArrayLike = Union[float, Sequence[float], np.ndarray]
+
+FILE_PATTERN = re.compile(r"pwr_map_([\d.]+)dB_([\d.]+)dB\.json$")
+
+#################################################################
+# JSON -> HDF5
+#################################################################
+def _attenuation_from_name(
+    path: str
+) -> Optional[Tuple[float, float]]:
+    match = FILE_PATTERN.search(os.path.basename(path))
+    if match is None:
+        return None
+    return (float(match.group(1)), float(match.group(2)))
+
+def ingest(
+    files: Union[str, List[str]],
+    out_path: str,
+    attenuations: Optional[Dict[str, Tuple[float, float]]] = None
+) -> str:
+    """
+    Ingest power map JSON files into one HDF5 table.
+    files        : directory, glob pattern, or list of JSON files
+    attenuations : {path : (att1, att2)} for files whose name does not follow
+                   pwr_map_{att1}dB_{att2}dB.json (e.g. pwr_map_200.0MHz_800.0MHz.json)
+    Frequency axis is union of all files and missing points are NaN. Files
+    with same (att1, att2) (e.g. 0dB_0.0dB and 0.0dB_0dB) are averaged.
+    """
+    if isinstance(files, str):
+        pattern = os.path.join(files, "*.json") if os.path.isdir(files) else files
+        files = sorted(glob.glob(pattern))
+    attenuations = attenuations or {}
+
+    maps = {}
+    for path in files:
+        att = attenuations.get(path, _attenuation_from_name(path))
+        if att is None:
+            raise ValueError(f"Attenuation of {path} is unknown, pass it with attenuations")
+        with open(path, "r", encoding = "utf-8") as f:
+            data = json.load(f)
+        maps.setdefault(att, []).append(
+            {float(freq): {int(float(g)): p for g, p in v.items()} for freq, v in data.items()}
+        )
+    if not maps:
+        raise ValueError("No power map file is found")
+
+    att_axis    = sorted(maps)
+    freq_axis   = sorted({freq for m in maps.values() for d in m for freq in d})
+    gain_axis   = sorted({g for m in maps.values() for d in m for v in d.values() for g in v})
+    freq_index  = {freq: i for i, freq in enumerate(freq_axis)}
+    gain_index  = {g: i for i, g in enumerate(gain_axis)}
+
+    total = np.zeros((len(att_axis), len(freq_axis), len(gain_axis)))
+    count = np.zeros(total.shape, dtype = np.int32)
+    for k, att in enumerate(att_axis):
+        for d in maps[att]:
+            for freq, v in d.items():
+                for g, p in v.items():
+                    total[k, freq_index[freq], gain_index[g]] += p
+                    count[k, freq_index[freq], gain_index[g]] += 1
+    with np.errstate(invalid = "ignore"):
+        power = np.where(count > 0, total / np.maximum(count, 1), np.nan)
+
+    with h5py.File(out_path, "w") as f:
+        # Contiguous datasets (no chunk, no compression) can be memory-mapped
+        f.create_dataset("attenuation", data = np.array(att_axis, dtype = np.float64))
+        f.create_dataset("frequency", data = np.array(freq_axis, dtype = np.float64))
+        f.create_dataset("gain", data = np.array(gain_axis, dtype = np.int64))
+        f.create_dataset("power", data = power)
+        f.attrs["axes"] = "attenuation(att1, att2) x frequency [MHz] x gain"
+        f.attrs["unit"] = "dBm"
+    return out_path
+
+def _memmap_dataset(
+    path: str,
+    f: h5py.File,
+    name: str
+) -> np.ndarray:
+    """
+    Memory-map contiguous HDF5 dataset, or read it if it cannot be mapped
+    """
+    dset = f[name]
+    offset = dset.id.get_offset()
+    if offset is None or dset.chunks is not None or dset.compression is not None:
+        return dset[()]
+    return np.memmap(path, mode = "r", dtype = dset.dtype, shape = dset.shape, offset = offset)
+
+#################################################################
+# Table
+#################################################################
+class PowerGainTable:
+    """
+    Vectorized power <-> gain conversion on (attenuation x frequency x gain) grid.
+    Power is interpolated linearly in frequency and log10(gain). For power -> gain
+    conversion power is made monotonic in gain with running maximum, since
+    readings near noise floor (low gain) are not monotonic.
+    """
+    def __init__(
+        self,
+        attenuation: np.ndarray,
+        frequency: np.ndarray,
+        gain: np.ndarray,
+        power: np.ndarray
+    ):
+        self.attenuation    = np.asarray(attenuation, dtype = np.float64).reshape(-1, 2)
+        self.frequency      = np.asarray(frequency, dtype = np.float64)
+        self.gain           = np.asarray(gain)
+        self.power          = power
+        self._log_gain      = np.log10(self.gain.astype(np.float64))
+        self._rows          = {}
+
+    @classmethod
+    def load(
+        cls,
+        path: str
+    ) -> "PowerGainTable":
+        with h5py.File(path, "r") as f:
+            return cls(
+                attenuation = f["attenuation"][()],
+                frequency   = f["frequency"][()],
+                gain        = f["gain"][()],
+                power       = _memmap_dataset(path, f, "power"),
+            )
+
+    @property
+    def attenuations(self) -> List[Tuple[float, float]]:
+        return [(float(a1), float(a2)) for a1, a2 in self.attenuation]
+
+    def _att_rows(
+        self,
+        att: Tuple[float, float]
+    ) -> Tuple[np.ndarray, np.ndarray, np.ndarray]:
+        """
+        Return (valid frequencies, power rows, monotonic power rows) for att.
+        Rows are cached per attenuation.
+        """
+        key = (float(att[0]), float(att[1]))
+        if key not in self._rows:
+            match = np.flatnonzero(np.all(np.isclose(self.attenuation, key), axis = 1))
+            if match.size == 0:
+                raise KeyError(f"Attenuation {key} is not in table, available : {self.attenuations}")
+            rows = np.asarray(self.power[match[0]])
+            valid = ~np.isnan(rows).any(axis = 1)
+            rows = rows[valid]
+            self._rows[key] = (
+                self.frequency[valid],
+                rows,
+                np.maximum.accumulate(rows, axis = 1)
+            )
+        return self._rows[key]
+
+    @staticmethod
+    def _freq_weights(
+        freqs: np.ndarray,
+        freq: np.ndarray
+    ) -> Tuple[np.ndarray, np.ndarray, np.ndarray, np.ndarray]:
+        """
+        Return lower index, upper index, upper weight, and in-range mask
+        """
+        inside = (freq >= freqs[0]) & (freq <= freqs[-1])
+        hi = np.clip(np.searchsorted(freqs, freq), 1, max(len(freqs) - 1, 1))
+        lo = hi - 1
+        if len(freqs) == 1:
+            return np.zeros_like(hi), np.zeros_like(hi), np.zeros(freq.shape), inside
+        w = (freq - freqs[lo]) / (freqs[hi] - freqs[lo])
+        return lo, hi, np.clip(w, 0.0, 1.0), inside
+
+    def power_for_gain(
+        self,
+        freq: ArrayLike,
+        gain: ArrayLike,
+        att: Tuple[float, float] = (0, 0)
+    ) -> np.ndarray:
+        """
+        Output power [dBm] for DAC gain at freq [MHz]. NaN outside of table.
+        """
+        freq, gain = np.broadcast_arrays(
+            np.asarray(freq, dtype = np.float64),
+            np.asarray(gain, dtype = np.float64)
+        )
+        freqs, rows, _ = self._att_rows(att)
+        lo, hi, w, inside = self._freq_weights(freqs, freq.ravel())
+        curves = rows[lo] * (1 - w)[:, None] + rows[hi] * w[:, None]
+
+        lg = np.log10(np.clip(gain.ravel(), self.gain[0], self.gain[-1]))
+        g_hi = np.clip(np.searchsorted(self._log_gain, lg), 1, len(self._log_gain) - 1)
+        g_lo = g_hi - 1
+        gw = (lg - self._log_gain[g_lo]) / (self._log_gain[g_hi] - self._log_gain[g_lo])
+        n = np.arange(len(lg))
+        power = curves[n, g_lo] * (1 - gw) + curves[n, g_hi] * gw
+        inside &= (gain.ravel() >= self.gain[0]) & (gain.ravel() <= self.gain[-1])
+        return np.where(inside, power, np.nan).reshape(freq.shape)
+
+    def gain_for_power(
+        self,
+        freq: ArrayLike,
+        power: ArrayLike,
+        att: Tuple[float, float] = (0, 0),
+        as_int: bool = True
+    ) -> np.ndarray:
+        """
+        DAC gain which outputs power [dBm] at freq [MHz]. Points outside of
+        frequency range or above maximum power are NaN (or -1 if as_int),
+        and power below table is clipped to minimum gain.
+        """
+        freq, power = np.broadcast_arrays(
+            np.asarray(freq, dtype = np.float64),
+            np.asarray(power, dtype = np.float64)
+        )
+        shape = freq.shape
+        freq, power = freq.ravel(), power.ravel()
+        freqs, _, mono = self._att_rows(att)
+        lo, hi, w, inside = self._freq_weights(freqs, freq)
+        curves = np.maximum.accumulate(
+            mono[lo] * (1 - w)[:, None] + mono[hi] * w[:, None],
+            axis = 1
+        )
+        # Curves are non-decreasing, so counting points below target gives
+        # insertion index of each row at once.
+        n_gain = curves.shape[1]
+        idx = np.clip((curves < power[:, None]).sum(axis = 1), 1, n_gain - 1)
+        n = np.arange(len(power))
+        p_lo, p_hi = curves[n, idx - 1], curves[n, idx]
+        with np.errstate(invalid = "ignore", divide = "ignore"):
+            t = np.where(p_hi > p_lo, (power - p_lo) / (p_hi - p_lo), 0.0)
+        t = np.clip(t, 0.0, 1.0)
+        log_gain = self._log_gain[idx - 1] * (1 - t) + self._log_gain[idx] * t
+        valid = inside & (power <= curves[:, -1])
+        gain = np.where(valid, 10 ** log_gain, np.nan).reshape(shape)
+        if as_int:
+            return np.where(np.isnan(gain), -1, np.rint(np.nan_to_num(gain))).astype(np.int64)
+        return gain
+
+if __name__ == "__main__":
+    import time
+    out_path = ingest("./PowerGainMap/500-580MHz_att_test", "./PowerGainMap/pwr_map_500-580MHz.h5")
+    table = PowerGainTable.load(out_path)
+    print(table.attenuations)
+
+    freqs = np.random.uniform(500, 580, 10000)
+    powers = np.random.uniform(-40, -10, 10000)
+    start_time = time.time()
+    gains = table.gain_for_power(freqs, powers, att = (0, 0))
+    end_time = time.time()
+    print(f"{len(gains)} points : {(end_time - start_time) * 1e3:.2f} ms")
+    print(gains[:10])
+    print(table.power_for_gain(freqs[:10], gains[:10]) - powers[:10])
@@ -0,0 +1,279 @@
+"""
+Oscilloscope (Keysight DSO-X 6004A) FFT marker based power meter for
+QICK DAC output power calibration.
+measure_pwr in GainPowerMap.ipynb rewrites whole FFT/marker setup for each
+point, sleeps fixed 3 s, and queries marker 100 times. ScopePowerMeter instead
+configures scope once, only moves FFT center and marker when frequency is
+changed, waits until marker reading is settled, and averages marker reads
+spaced by read_interval_s (queries in one message would all read the same
+FFT frame).
+FakeOscilloscope is pyvisa stand-in which can be used to test it offline.
+"""
+import time
+import math
+import random
+from typing import Union, Any, Callable, Dict, List, Optional
+
+#################################################################
+# Power meter
+#################################################################
+class SettleTimeoutError(Exception):
+    """Marker reading did not settle within timeout"""
+
+class ScopePowerMeter:
+    """
+    Measure RF power at given frequency with oscilloscope FFT marker.
+    oscilloscope : pyvisa resource (or FakeOscilloscope)
+    """
+    def __init__(
+        self,
+        oscilloscope: Any,
+        channel: int = 4,
+        span_mhz: float = 100,
+        n_average: int = 100,
+        read_interval_s: float = 0.01,
+        settle_tol_db: float = 0.2,
+        settle_count: int = 3,
+        settle_interval_s: float = 0.1,
+        settle_timeout_s: float = 5.0,
+        raise_on_timeout: bool = False
+    ):
+        self.oscilloscope       = oscilloscope
+        self.channel            = channel
+        self.span_mhz           = span_mhz
+        self.n_average          = n_average         # Number of marker reads to average
+        self.read_interval_s    = read_interval_s   # At least one FFT update, so that reads are independent
+        self.settle_tol_db      = settle_tol_db     # Successive readings within this are settled
+        self.settle_count       = settle_count      # Number of successive settled readings
+        self.settle_interval_s  = settle_interval_s # Polling interval of settle detection
+        self.settle_timeout_s   = settle_timeout_s
+        self.raise_on_timeout   = raise_on_timeout
+        self._configured        = False
+        self._freq_mhz          = None
+        self.last_settle_time   = 0.0
+        self.n_settle_timeout   = 0
+
+    def configure(self) -> None:
+        """
+        Write FFT and marker setup. This is only needed once per session.
+        """
+        osc = self.oscilloscope
+        osc.write_termination   = "\n"
+        osc.read_termination    = "\n"
+        # Set input impedance
+        osc.write(f":CHAN{self.channel}:IMP FIFT")
+        # Set function operation as fft
+        osc.write(":FUNC1:DISP ON")
+        osc.write(":FUNC1:OPER FFT")
+        osc.write(f":FUNC1:SOUR CHAN{self.channel}")
+        osc.write(f":FUNC1:SPAN {self.span_mhz} MHz")
+        osc.write(":SYST:PREC ON")
+        osc.write(":MARK:MODE WAV")
+        osc.write(":MARK:X1Y1Source MATH1")
+        self._configured        = True
+        self._freq_mhz          = None
+
+    def set_frequency(
+        self,
+        freq: Union[float, int]
+    ) -> None:
+        """
+        Move FFT center and marker to freq [MHz]. Scope is configured if
+        it is not configured yet, and nothing is written if freq is not changed.
+        """
+        if not self._configured:
+            self.configure()
+        if self._freq_mhz == freq:
+            return
+        self.oscilloscope.write(f":FUNC1:CENT {freq} MHz")
+        self.oscilloscope.write(f":MARK:X1Position {freq} MHz")
+        self._freq_mhz = freq
+
+    def _read_marker(self) -> float:
+        return float(self.oscilloscope.query(":MARK:Y1Position?").strip())
+
+    def wait_settled(self) -> float:
+        """
+        Poll marker until settle_count successive readings are within
+        settle_tol_db of each other. Returns last reading. Timeout raises
+        SettleTimeoutError if raise_on_timeout, otherwise it is printed and
+        counted in n_settle_timeout.
+        """
+        start = time.perf_counter()
+        readings = [self._read_marker()]
+        while True:
+            window = readings[-(self.settle_count + 1):]
+            if (
+                len(window) == self.settle_count + 1
+                and max(window) - min(window) <= self.settle_tol_db
+            ):
+                break
+            if time.perf_counter() - start > self.settle_timeout_s:
+                message = f"Marker did not settle in {self.settle_timeout_s} s : {window}"
+                if self.raise_on_timeout:
+                    raise SettleTimeoutError(message)
+                self.n_settle_timeout += 1
+                print(f"{message} at {self._freq_mhz} MHz, last reading is used")
+                break
+            time.sleep(self.settle_interval_s)
+            readings.append(self._read_marker())
+        self.last_settle_time = time.perf_counter() - start
+        return readings[-1]
+
+    def read_power(self) -> float:
+        """
+        Average of n_average marker reads [dBm], started every
+        read_interval_s
+        """
+        values = []
+        start = time.perf_counter()
+        for k in range(self.n_average):
+            delay = start + k * self.read_interval_s - time.perf_counter()
+            if delay > 0:
+                time.sleep(delay)
+            values.append(self._read_marker())
+        return sum(values) / len(values)
+
+    def measure(
+        self,
+        freq: Union[float, int],
+        launch: Optional[Callable[[], Any]] = None
+    ) -> float:
+        """
+        Measure power at freq [MHz]. launch is called after scope is set,
+        which starts QICK output (e.g. prog.acquire(soc)).
+        """
+        self.set_frequency(freq)
+        if launch is not None:
+            launch()
+        self.wait_settled()
+        return self.read_power()
+
+    def measure_map(
+        self,
+        frequencies: List[float],
+        gains: List[int],
+        launch: Callable[[float, int], Any]
+    ) -> Dict[float, Dict[int, float]]:
+        """
+        Measure power map {freq : {gain : power}}. Frequency is outer loop so
+        that scope is set once per frequency. launch(freq, gain) starts QICK output.
+        """
+        data = {}
+        for freq in frequencies:
+            data[freq] = {}
+            for gain in gains:
+                data[freq][gain] = self.measure(
+                    freq,
+                    lambda: launch(freq, gain)
+                )
+        return data
+
+#################################################################
+# Offline stand-in
+#################################################################
+class FakeOscilloscope:
+    """
+    pyvisa resource stand-in for offline test of ScopePowerMeter.
+    apply(freq, gain) is used instead of QICK program, and marker reading
+    settles to power_model(freq, gain) exponentially with time constant tau_s.
+    Marker noise changes once per FFT frame of frame_s, so reads within one
+    frame return the same value.
+    Each write and query is counted to compare number of round-trips.
+    """
+    def __init__(
+        self,
+        power_model: Optional[Callable[[float, int], float]] = None,
+        tau_s: float = 0.2,
+        noise_db: float = 0.05,
+        latency_s: float = 0.0,
+        frame_s: float = 0.0,
+        seed: Optional[int] = None
+    ):
+        self.power_model        = power_model or (
+            lambda freq, gain: 20 * math.log10(max(gain, 1) / 32767) - 5
+        )
+        self.tau_s              = tau_s
+        self.noise_db           = noise_db
+        self.latency_s          = latency_s         # Latency of each round-trip
+        self.frame_s            = frame_s
+        self.write_termination  = "\n"
+        self.read_termination   = "\n"
+        self.n_write            = 0
+        self.n_query            = 0
+        self.log                = []
+        self._rng               = random.Random(seed)
+        self._target            = -100.0
+        self._previous          = -100.0
+        self._changed_at        = time.perf_counter()
+        self._frame             = None
+        self._frame_noise       = 0.0
+
+    def apply(
+        self,
+        freq: float,
+        gain: int
+    ) -> None:
+        """
+        Simulate QICK output change
+        """
+        self._previous      = self._marker()
+        self._target        = self.power_model(freq, gain)
+        self._changed_at    = time.perf_counter()
+
+    def _marker(self) -> float:
+        elapsed = time.perf_counter() - self._changed_at
+        decay = math.exp(-elapsed / self.tau_s) if self.tau_s > 0 else 0.0
+        return self._target + (self._previous - self._target) * decay
+
+    def _noise(self) -> float:
+        frame = int(time.perf_counter() / self.frame_s) if self.frame_s > 0 else None
+        if frame is None or frame != self._frame:
+            self._frame = frame
+            self._frame_noise = self._rng.gauss(0, self.noise_db)
+        return self._frame_noise
+
+    def write(
+        self,
+        cmd: str
+    ) -> None:
+        self.n_write += 1
+        self.log.append(cmd)
+        if self.latency_s:
+            time.sleep(self.latency_s)
+
+    def query(
+        self,
+        cmd: str
+    ) -> str:
+        self.n_query += 1
+        self.log.append(cmd)
+        if self.latency_s:
+            time.sleep(self.latency_s)
+        if cmd == "*IDN?":
+            return "KEYSIGHT TECHNOLOGIES,DSO-X 6004A,FAKE,0.0"
+        resp = []
+        for sub in cmd.split(";"):
+            if sub.strip().upper().startswith(":MARK:Y1P"):
+                resp.append(f"{self._marker() + self._noise():.6e}")
+            else:
+                resp.append("0")
+        return ";".join(resp)
+
+    def close(self) -> None:
+        pass
+
+if __name__ == "__main__":
+    scope = FakeOscilloscope(tau_s = 0.05, latency_s = 0.001, frame_s = 0.01, seed = 0)
+    meter = ScopePowerMeter(scope, settle_interval_s = 0.02)
+    start_time = time.time()
+    data = meter.measure_map(
+        frequencies = [500, 540, 580],
+        gains       = [10, 100, 1000, 10000],
+        launch      = scope.apply
+    )
+    end_time = time.time()
+    print(data)
+    print("Time : %.3f s, writes : %d, queries : %d"%(
+        end_time - start_time, scope.n_write, scope.n_query
+    ))
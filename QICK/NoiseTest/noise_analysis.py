@@ -0,0 +1,228 @@
+"""
+Batched SNR / noise floor analysis for DDR4 IQ captures.
+This is the batched counterpart of analyze_iq_and_fft in TraceNoiseTest.ipynb.
+All captures of a stack must have the same length, so the window, its
+normalisation constants (U, CG, ENBW) and the bin index table are computed once
+and reused for every capture, and all FFTs are done in one vectorized call.
+For stacks which are too large for a single FFT call, the stack is split into
+chunks which can be analyzed in a process pool.
+"""
+import numpy as np
+from functools import lru_cache
+from concurrent.futures import ProcessPoolExecutor
+from typing import Union, Optional, Dict, Any, Tuple
+
+#################################################################
+# Cached tables
+#################################################################
+@lru_cache(maxsize = 16)
+def _window_table(
+    N: int,
+    window: str
+) -> Tuple[np.ndarray, str, float, float, float]:
+    """
+    Return (win, wname, U, CG, ENBW_bins) for a window of length N
+    """
+    wname = window.lower()
+    if wname in ("hann", "hanning"):
+        win = np.hanning(N)
+    elif wname in ("hamming",):
+        win = np.hamming(N)
+    elif wname in ("rect", "rectangular", "boxcar"):
+        win = np.ones(N)
+    else:
+        raise ValueError(f"Unknown window : {window}")
+    win.setflags(write = False)
+    U           = (win**2).mean()
+    CG          = win.mean()
+    ENBW_bins   = N * (win**2).sum() / (win.sum()**2)
+    return win, wname, U, CG, ENBW_bins
+
+@lru_cache(maxsize = 16)
+def _bin_table(
+    N: int,
+    dt: float
+) -> Tuple[np.ndarray, np.ndarray, int]:
+    """
+    Return (bin index, shifted frequency axis, DC index) for N bins
+    """
+    idx = np.arange(N)
+    fx  = np.fft.fftshift(np.fft.fftfreq(N, d = dt))
+    dc_idx = int(np.argmin(np.abs(fx)))
+    idx.setflags(write = False)
+    fx.setflags(write = False)
+    return idx, fx, dc_idx
+
+def clear_cache() -> None:
+    """
+    Drop cached window and bin tables
+    """
+    _window_table.cache_clear()
+    _bin_table.cache_clear()
+
+#################################################################
+# Input conversion
+#################################################################
+def _to_complex_stack(
+    data: Any
+) -> np.ndarray:
+    """
+    Convert capture stack into complex array with shape (n_capture, N).
+    Accepted inputs are
+    - complex array (n_capture, N)
+    - (i, q) tuple, each of shape (n_capture, N)
+    - real array (n_capture, N, 2) which is stack of soc.get_ddr4 results
+    """
+    if isinstance(data, (tuple, list)) and len(data) == 2:
+        i, q = data
+        x = np.asarray(i, dtype = np.float64) + 1j * np.asarray(q, dtype = np.float64)
+    else:
+        x = np.asarray(data)
+        if not np.iscomplexobj(x) and x.ndim == 3 and x.shape[-1] == 2:
+            x = x[..., 0].astype(np.float64) + 1j * x[..., 1].astype(np.float64)
+        else:
+            x = x.astype(np.complex128)
+    if x.ndim == 1:
+        x = x[np.newaxis, :]
+    if x.ndim != 2:
+        raise ValueError(f"Capture stack should be (n_capture, N), got {x.shape}")
+    return x
+
+#################################################################
+# Analysis
+#################################################################
+def _analyze_chunk(
+    seg: np.ndarray,
+    dt: float,
+    window: str,
+    signal_bins: int,
+    guard_bins: int,
+    exclude_dc_from_noise: bool,
+    return_psd: bool
+) -> Dict[str, np.ndarray]:
+    """
+    Analyze (n, N) complex segment. Windowing, FFT, and masking are
+    done for all rows at once.
+    """
+    n, N = seg.shape
+    fs = 1.0 / dt
+    df = fs / N
+    win, _, U, _, _ = _window_table(N, window)
+    idx, fx, dc_idx = _bin_table(N, dt)
+
+    X   = np.fft.fft(seg * win, axis = -1)
+    Ss  = np.fft.fftshift(
+        (X.real**2 + X.imag**2) / (fs * N * U),
+        axes = -1
+    )
+
+    peak_idx    = np.argmax(Ss, axis = -1)
+    # Distance of each bin from its capture's peak. Signal bins are within
+    # signal_bins from the peak, and guard bins are excluded from noise.
+    dist        = np.abs(idx[np.newaxis, :] - peak_idx[:, np.newaxis])
+    mask_signal = dist <= signal_bins
+    mask_noise  = dist > (signal_bins + guard_bins)
+    if exclude_dc_from_noise:
+        mask_noise[:, dc_idx] = False
+
+    n_noise = mask_noise.sum(axis = -1)
+    Psig    = np.where(mask_signal, Ss, 0.0).sum(axis = -1) * df
+    Pnoise  = np.where(mask_noise, Ss, 0.0).sum(axis = -1) * df
+
+    noise_only = np.where(mask_noise, Ss, np.nan)
+    with np.errstate(invalid = "ignore", divide = "ignore"):
+        noise_psd_mean      = np.where(
+            n_noise > 0, np.nansum(noise_only, axis = -1) / n_noise, np.nan
+        )
+        noise_psd_median    = np.full(n, np.nan)
+        has_noise           = n_noise > 0
+        if has_noise.any():
+            noise_psd_median[has_noise] = np.nanmedian(noise_only[has_noise], axis = -1)
+        SNR_dB = np.where(Pnoise > 0, 10 * np.log10(Psig / Pnoise), np.inf)
+        noise_floor_mean    = np.where(
+            (Psig > 0) & (noise_psd_mean > 0),
+            10 * np.log10(noise_psd_mean / Psig),
+            np.nan
+        )
+        noise_floor_median  = np.where(
+            (Psig > 0) & (noise_psd_median > 0),
+            10 * np.log10(noise_psd_median / Psig),
+            np.nan
+        )
+
+    result = {
+        "peak_freq_hz": fx[peak_idx],
+        "signal_power": Psig,
+        "noise_power": Pnoise,
+        "SNR_dB": SNR_dB,
+        "noise_psd_mean": noise_psd_mean,
+        "noise_psd_median": noise_psd_median,
+        "noise_floor_mean_dBc_per_Hz": noise_floor_mean,
+        "noise_floor_median_dBc_per_Hz": noise_floor_median,
+    }
+    if return_psd:
+        result["psd_shifted"] = Ss
+    return result
+
+def analyze_iq_and_fft_batch(
+    data: Any,
+    dt_ns: float = 10/3,
+    start_idx: int = 1000,
+    stop_idx: int = 5000,
+    include_end: bool = True,
+    window: str = "hann",
+    signal_bins: int = 2,
+    guard_bins: int = 4,
+    exclude_dc_from_noise: bool = False,
+    return_psd: bool = False,
+    chunk_size: Optional[int] = None,
+    processes: Optional[int] = None
+) -> Dict[str, Union[np.ndarray, float, int, str]]:
+    """
+    Batched analyze_iq_and_fft for captures with identical length.
+    data is capture stack with shape (n_capture, N_total), see _to_complex_stack.
+    Returns scalars shared by all captures (fs_hz, df_hz, N, window, U, ...)
+    and per-capture arrays (SNR_dB, noise_floor_*, peak_freq_hz, ...).
+
+    chunk_size : number of captures per FFT call. None analyzes whole stack at once.
+    processes  : number of worker processes used for chunks. None or 1 runs
+                 chunks sequentially in this process.
+    """
+    x = _to_complex_stack(data)
+    stop_eff = stop_idx + 1 if include_end else stop_idx
+    seg = x[:, start_idx:stop_eff]
+    n_capture, N = seg.shape
+
+    fs = 1.0 / (dt_ns * 1e-9)
+    dt = 1.0 / fs
+    df = fs / N
+    _, wname, U, CG, ENBW_bins = _window_table(N, window)
+    _, fx, _ = _bin_table(N, dt)
+
+    args = (dt, window, signal_bins, guard_bins, exclude_dc_from_noise, return_psd)
+    if chunk_size is None or chunk_size >= n_capture:
+        chunks = [_analyze_chunk(seg, *args)]
+    else:
+        bounds = range(0, n_capture, chunk_size)
+        if processes is not None and processes > 1:
+            with ProcessPoolExecutor(max_workers = processes) as pool:
+                futures = [
+                    pool.submit(_analyze_chunk, seg[k:k + chunk_size], *args)
+                    for k in bounds
+                ]
+                chunks = [f.result() for f in futures]
+        else:
+            chunks = [_analyze_chunk(seg[k:k + chunk_size], *args) for k in bounds]
+
+    result = {
+        "fs_hz": fs, "df_hz": df, "dt_s": dt, "N": N, "n_capture": n_capture,
+        "window": wname, "U": U, "coherent_gain": CG,
+        "ENBW_bins": ENBW_bins, "ENBW_hz": ENBW_bins * df,
+        "start_idx": start_idx, "stop_idx_inclusive": stop_idx if include_end else stop_idx-1,
+        "f_axis_hz": fx,
+        "signal_bins_each_side": signal_bins,
+        "guard_bins_each_side": guard_bins,
+    }
+    for key in chunks[0]:
+        result[key] = np.concatenate([c[key] for c in chunks], axis = 0)
+    return result
@@ -0,0 +1,319 @@
+"""
+Live plotting in a separate process.
+Results are put in a queue and return immediately. The plot process keeps
+only the latest data of every line / image, redraws at most max_fps times
+per second, and renders saved figures (PNG etc.) itself, so acquisition is
+never blocked by matplotlib.
+Scripts using it should guard hardware code with if __name__ == "__main__",
+since the plot process imports main module on Windows.
+"""
+import time
+import queue
+import multiprocessing as mp
+from typing import Any, Dict, Optional, Sequence, Tuple
+
+_STOP = "stop"
+#################################################################
+# Plot process
+#################################################################
+def _style(
+    ax: Any,
+    spec: Dict[str, Any]
+) -> None:
+    if spec.get("xlabel"):
+        ax.set_xlabel(spec["xlabel"])
+    if spec.get("ylabel"):
+        ax.set_ylabel(spec["ylabel"])
+    if spec.get("title"):
+        ax.set_title(spec["title"])
+    if spec.get("ylim"):
+        ax.set_ylim(spec["ylim"])
+
+def _draw(
+    fig: Any,
+    ax: Any,
+    artists: Dict[Any, Any],
+    spec: Dict[str, Any]
+) -> None:
+    """
+    Draw spec on ax. Existing line of the same label is updated in place.
+    """
+    if spec["kind"] == "line":
+        key = spec.get("label")
+        if key in artists:
+            artists[key].set_data(spec["x"], spec["y"])
+            ax.relim()
+            ax.autoscale_view()
+        else:
+            (artists[key],) = ax.plot(spec["x"], spec["y"], label = key)
+            if key is not None:
+                ax.legend()
+    elif spec["kind"] == "image":
+        if "image" in artists:
+            artists["image"].remove()
+        artists["image"] = ax.pcolormesh(
+            spec["x"], spec["y"], spec["z"], shading = "nearest", cmap = spec.get("cmap")
+        )
+        if "colorbar" in artists:
+            artists["colorbar"].update_normal(artists["image"])
+        else:
+            artists["colorbar"] = fig.colorbar(artists["image"], ax = ax, label = spec.get("clabel"))
+    _style(ax, spec)
+
+def _save_spec(
+    path: str,
+    specs: Sequence[Dict[str, Any]],
+    dpi: Optional[float]
+) -> None:
+    """
+    Render specs on an off-screen figure and save it
+    """
+    from matplotlib.figure import Figure
+    from matplotlib.backends.backend_agg import FigureCanvasAgg
+
+    fig = Figure()
+    FigureCanvasAgg(fig)
+    ax = fig.add_subplot()
+    artists: Dict[Any, Any] = {}
+    for spec in specs:
+        _draw(fig, ax, artists, spec)
+    fig.savefig(path, dpi = dpi)
+
+def _run(
+    frames: Any,
+    jobs: Any,
+    n_failed: Any,
+    max_fps: float,
+    interactive: bool,
+    backend: Optional[str]
+) -> None:
+    import matplotlib
+    if backend or not interactive:
+        matplotlib.use(backend or "Agg")
+    import matplotlib.pyplot as plt
+    if interactive:
+        plt.ion()
+
+    period = 1.0 / max_fps
+    figures: Dict[str, Tuple[Any, Any, Dict[Any, Any]]] = {}
+    pending: Dict[Tuple[str, Any], Dict[str, Any]] = {}
+    last_draw = 0.0
+
+    def apply(names: Optional[set] = None) -> None:
+        for key in [k for k in pending if names is None or k[0] in names]:
+            spec = pending.pop(key)
+            if spec["name"] not in figures:
+                fig = plt.figure(spec["name"])
+                figures[spec["name"]] = (fig, fig.add_subplot(), {})
+            _draw(*figures[spec["name"]], spec)
+        for name in (figures if names is None else names):
+            if name in figures:
+                figures[name][0].canvas.draw_idle()
+
+    def failed(what: str, error: BaseException) -> None:
+        # Errors of one figure never stop the plot process
+        with n_failed.get_lock():
+            n_failed.value += 1
+        print(f"[live-view] {what} failed: {type(error).__name__}: {error}")
+
+    running = True
+    while running:
+        # Drain frames, only the latest data of every line / image is kept.
+        # One saved figure per loop, so that live figures are redrawn while
+        # many saved figures are waiting.
+        messages = []
+        while True:
+            try:
+                messages.append(frames.get_nowait())
+            except queue.Empty:
+                break
+        try:
+            messages.append(jobs.get_nowait())
+        except queue.Empty:
+            pass
+        if not messages:
+            time.sleep(0.01)
+        for msg in messages:
+            try:
+                if msg["kind"] == _STOP:
+                    running = False
+                elif msg["kind"] == "save":
+                    _save_spec(msg["path"], msg["specs"], msg.get("dpi"))
+                elif msg["kind"] == "save_live":
+                    apply({msg["name"]})
+                    if msg["name"] in figures:
+                        figures[msg["name"]][0].savefig(msg["path"], dpi = msg.get("dpi"))
+                else:
+                    pending[(msg["name"], msg.get("label"))] = msg
+            except Exception as e:
+                failed(f"{msg.get('kind')} {msg.get('path', msg.get('name'))}", e)
+        if pending and (not running or time.perf_counter() - last_draw >= period):
+            try:
+                apply()
+            except Exception as e:
+                pending.clear()
+                failed("redraw", e)
+            last_draw = time.perf_counter()
+        if interactive and figures:
+            try:
+                plt.pause(0.001)
+            except Exception as e:
+                failed("pause", e)
+    plt.close("all")
+#################################################################
+# Acquisition side
+#################################################################
+class LiveView:
+    """
+    Handle of the plot process.
+        plot / image : live figure update. If maxsize updates are waiting,
+                       new updates are dropped (counted in n_dropped).
+        save_plot / save_image / save_live : figure file, queued without
+                       limit and never dropped.
+    Figures which fail in the plot process (e.g. bad path) are printed and
+    counted in n_failed. No call raises into the measurement loop; if the
+    plot process is gone, updates are counted in n_dropped.
+    interactive : show figures in windows. False only renders saved figures.
+    backend     : matplotlib backend of the plot process (e.g. "QtAgg")
+    """
+    def __init__(
+        self,
+        max_fps: float = 5.0,
+        interactive: bool = True,
+        backend: Optional[str] = None,
+        maxsize: int = 64
+    ):
+        ctx = mp.get_context("spawn")
+        self.n_dropped  = 0
+        self._n_failed  = ctx.Value("i", 0)
+        self._frames    = ctx.Queue(maxsize = maxsize)
+        self._jobs      = ctx.Queue()
+        self._process   = ctx.Process(
+            target  = _run,
+            args    = (self._frames, self._jobs, self._n_failed, max_fps, interactive, backend),
+            name    = "live-view",
+            daemon  = True
+        )
+        self._process.start()
+
+    @property
+    def n_failed(self) -> int:
+        return self._n_failed.value
+
+    def _alive(self) -> bool:
+        if self._process.is_alive():
+            return True
+        if self.n_dropped == 0:
+            print("[live-view] Plot process is not running, figures are dropped")
+            self._cancel_queues()
+        self.n_dropped += 1
+        return False
+
+    def _cancel_queues(self) -> None:
+        """
+        Messages left in the queues are never read by a dead plot process,
+        so that interpreter exit must not wait to flush them
+        """
+        self._jobs.cancel_join_thread()
+        self._frames.cancel_join_thread()
+
+    def _put(
+        self,
+        msg: Dict[str, Any],
+        job: bool
+    ) -> None:
+        if not self._alive():
+            return
+        if job:
+            self._jobs.put(msg)
+            return
+        try:
+            self._frames.put_nowait(msg)
+        except queue.Full:
+            self.n_dropped += 1
+
+    def plot(
+        self,
+        name: str,
+        x: Any,
+        y: Any,
+        label: Optional[str] = None,
+        **style
+    ) -> None:
+        """
+        Set line label of figure name to (x, y). style : xlabel, ylabel, title, ylim
+        """
+        self._put({"kind": "line", "name": name, "x": x, "y": y, "label": label, **style}, job = False)
+
+    def image(
+        self,
+        name: str,
+        x: Any,
+        y: Any,
+        z: Any,
+        **style
+    ) -> None:
+        """
+        pcolormesh of z (len(y), len(x)). style : xlabel, ylabel, title, clabel, cmap
+        """
+        self._put({"kind": "image", "name": name, "x": x, "y": y, "z": z, **style}, job = False)
+
+    def save_plot(
+        self,
+        path: str,
+        x: Any,
+        y: Any,
+        label: Optional[str] = None,
+        dpi: Optional[float] = None,
+        **style
+    ) -> None:
+        """
+        plt.figure(); plt.plot(x, y); plt.savefig(path) in the plot process
+        """
+        spec = {"kind": "line", "x": x, "y": y, "label": label, **style}
+        self._put({"kind": "save", "path": path, "specs": [spec], "dpi": dpi}, job = True)
+
+    def save_image(
+        self,
+        path: str,
+        x: Any,
+        y: Any,
+        z: Any,
+        dpi: Optional[float] = None,
+        **style
+    ) -> None:
+        spec = {"kind": "image", "x": x, "y": y, "z": z, **style}
+        self._put({"kind": "save", "path": path, "specs": [spec], "dpi": dpi}, job = True)
+
+    def save_live(
+        self,
+        name: str,
+        path: str,
+        dpi: Optional[float] = None
+    ) -> None:
+        """
+        Save live figure name with all updates sent before this call.
+        Sent through the frame queue to keep the order, waits if it is full.
+        """
+        if not self._alive():
+            return
+        self._frames.put({"kind": "save_live", "name": name, "path": path, "dpi": dpi})
+
+    def close(
+        self,
+        timeout_s: Optional[float] = None
+    ) -> None:
+        """
+        Wait until all saved figures are written and stop the plot process
+        """
+        if self._process.is_alive():
+            self._jobs.put({"kind": _STOP})
+            self._process.join(timeout_s)
+        if not self._process.is_alive():
+            self._cancel_queues()
+
+    def __enter__(self) -> "LiveView":
+        return self
+
+    def __exit__(self, *exc) -> None:
+        self.close()